@@ -0,0 +1,165 @@
+"""Time-bucketed usage and serving analytics over the daily rollups.
+
+Bucketing, unit normalization and summing all happen in one GROUP BY per
+series; Python only places the grouped values into arrays aligned with the
+bucket list. Quantities are reported in base units (g, ml, or the counted unit).
+"""
+from datetime import date, timedelta
+from typing import Iterable, List, Optional
+from sqlalchemy import Date, Float, String, case, cast, func, select, type_coerce
+from sqlalchemy.orm import Session
+from app.models import DailyMealRollup, DailyProductUsageRollup, Meal, Product
+from app.units import BASE_UNITS, FACTORS
+
+BUCKETS = ("day", "week", "month")
+
+def bucket_start(column, bucket: str, dialect: str):
+    """SQL expression for the first day of the bucket containing ``column`` (weeks start on Monday)"""
+    if dialect == "sqlite":
+        # SQLite keeps dates as ISO text; leave them as text rather than parsing every row
+        if bucket == "day":
+            return type_coerce(column, String)
+        modifiers = ("weekday 0", "-6 days") if bucket == "week" else ("start of month",)
+        return func.date(column, *modifiers, type_=String)
+    if bucket == "day":
+        return column
+    return cast(func.date_trunc(bucket, column), Date)
+
+def bucket_starts(date_from: date, date_to: date, bucket: str) -> List[date]:
+    """Every bucket that overlaps [date_from, date_to], for aligning sparse series"""
+    if bucket == "day":
+        current, step = date_from, lambda d: d + timedelta(days=1)
+    elif bucket == "week":
+        current, step = date_from - timedelta(days=date_from.weekday()), lambda d: d + timedelta(days=7)
+    else:
+        current = date_from.replace(day=1)
+        step = lambda d: (d + timedelta(days=32)).replace(day=1)
+    starts = []
+    while current <= date_to:
+        starts.append(current)
+        current = step(current)
+    return starts
+
+def bucket_positions(starts: List[date]) -> dict:
+    """Index of each bucket start, keyed by date and by ISO text (what SQLite returns)"""
+    positions = {start: index for index, start in enumerate(starts)}
+    positions.update({start.isoformat(): index for index, start in enumerate(starts)})
+    return positions
+
+def base_quantity(quantity, unit):
+    factors = {name: factor for name, factor in FACTORS.items() if factor != 1}
+    return quantity * case(factors, value=unit, else_=1)
+
+def base_unit(unit):
+    renamed = {name: base for name, base in BASE_UNITS.items() if base != name}
+    return case(renamed, value=unit, else_=unit)
+
+def product_usage_series(
+    db: Session,
+    starts: List[date],
+    bucket: str,
+    date_from: date,
+    date_to: date,
+    product_ids: Optional[Iterable[int]] = None
+) -> list:
+    """Usage per product (by id) and base unit, one value per bucket of ``starts``"""
+    period = bucket_start(DailyProductUsageRollup.day, bucket, db.get_bind().dialect.name)
+    unit = base_unit(DailyProductUsageRollup.unit)
+    # Aggregate the rollup on its own, then attach names to the (much smaller) grouped result
+    grouped = select(
+        DailyProductUsageRollup.product_id,
+        unit.label("unit"),
+        period.label("bucket"),
+        cast(func.sum(base_quantity(DailyProductUsageRollup.quantity_used, DailyProductUsageRollup.unit)), Float).label("quantity"),
+        func.sum(DailyProductUsageRollup.uses_count).label("uses")
+    ).where(
+        DailyProductUsageRollup.day >= date_from,
+        DailyProductUsageRollup.day <= date_to
+    ).group_by(DailyProductUsageRollup.product_id, unit, period)
+    if product_ids is not None:
+        grouped = grouped.where(DailyProductUsageRollup.product_id.in_(list(product_ids)))
+    grouped = grouped.subquery()
+    stmt = select(
+        grouped.c.product_id, func.coalesce(Product.name, "Unknown"), grouped.c.unit, grouped.c.bucket,
+        grouped.c.quantity, grouped.c.uses
+    ).outerjoin(Product, Product.id == grouped.c.product_id)
+
+    positions = bucket_positions(starts)
+    series = {}
+    for product_id, product_name, product_unit, period_start, quantity, uses in db.connection().execute(stmt):
+        entry = series.get((product_id, product_unit))
+        if entry is None:
+            entry = series[(product_id, product_unit)] = {
+                "product_id": product_id,
+                "product_name": product_name,
+                "unit": product_unit,
+                "total": 0.0,
+                "quantity": [0.0] * len(starts),
+                "uses": [0] * len(starts)
+            }
+        index = positions[period_start]
+        entry["quantity"][index] = quantity or 0.0
+        entry["uses"][index] = uses or 0
+        entry["total"] += quantity or 0.0
+    return sorted(series.values(), key=lambda entry: (entry["product_id"], entry["unit"]))
+
+def meal_serving_series(
+    db: Session,
+    starts: List[date],
+    bucket: str,
+    date_from: date,
+    date_to: date,
+    meal_ids: Optional[Iterable[int]] = None
+) -> list:
+    """Servings and portions per meal (by id), one value per bucket of ``starts``"""
+    period = bucket_start(DailyMealRollup.day, bucket, db.get_bind().dialect.name)
+    grouped = select(
+        DailyMealRollup.meal_id,
+        period.label("bucket"),
+        func.sum(DailyMealRollup.servings_count).label("servings"),
+        func.sum(DailyMealRollup.portions_served).label("portions")
+    ).where(
+        DailyMealRollup.day >= date_from,
+        DailyMealRollup.day <= date_to
+    ).group_by(DailyMealRollup.meal_id, period)
+    if meal_ids is not None:
+        grouped = grouped.where(DailyMealRollup.meal_id.in_(list(meal_ids)))
+    grouped = grouped.subquery()
+    stmt = select(
+        grouped.c.meal_id, func.coalesce(Meal.name, "Unknown"), grouped.c.bucket, grouped.c.servings, grouped.c.portions
+    ).outerjoin(Meal, Meal.id == grouped.c.meal_id)
+
+    positions = bucket_positions(starts)
+    series = {}
+    for meal_id, meal_name, period_start, servings, portions in db.connection().execute(stmt):
+        entry = series.get(meal_id)
+        if entry is None:
+            entry = series[meal_id] = {
+                "meal_id": meal_id,
+                "meal_name": meal_name,
+                "total_servings": 0,
+                "total_portions": 0,
+                "servings": [0] * len(starts),
+                "portions": [0] * len(starts)
+            }
+        index = positions[period_start]
+        entry["servings"][index] = servings or 0
+        entry["portions"][index] = portions or 0
+        entry["total_servings"] += servings or 0
+        entry["total_portions"] += portions or 0
+    return sorted(series.values(), key=lambda entry: entry["meal_id"])
+
+def usage_totals(db: Session, since: date) -> list:
+    """Total usage per product (by id) since a day, in base units"""
+    unit = base_unit(DailyProductUsageRollup.unit).label("unit")
+    stmt = select(
+        Product.id,
+        Product.name,
+        unit,
+        func.sum(base_quantity(DailyProductUsageRollup.quantity_used, DailyProductUsageRollup.unit)).label("total_used")
+    ).join(
+        DailyProductUsageRollup, DailyProductUsageRollup.product_id == Product.id
+    ).where(
+        DailyProductUsageRollup.day >= since
+    ).group_by(Product.id, Product.name, unit).order_by(Product.name, Product.id)
+    return db.execute(stmt).all()
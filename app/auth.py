@@ -1,3 +1,10 @@
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -5,21 +12,198 @@ from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from app.catalog import USERS, catalog_versions
 from app.database import get_db
 from app.models import User
 
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Event stream tickets go in a URL (EventSource can't send headers), so they only open the stream and expire fast
+STREAM_TICKET_AUDIENCE = "events"
+STREAM_TICKET_SECONDS = 30
+
+# Bearer token a Prometheus scraper sends for /metrics and /health/pool; unset, only admins can read them
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+# How often each worker re-reads the users counter; a change made on another worker shows up within this
+USER_CACHE_SYNC_SECONDS = float(os.getenv("USER_CACHE_SYNC_SECONDS", "5"))
+
+# bcrypt runs in its own small executor; beyond workers + queue, requests get 503
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "8"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """Detached snapshot of a User row, safe to share between requests"""
+    id: int
+    username: str
+    email: str
+    role: str
+    is_active: bool
+    created_at: datetime
+
+    @classmethod
+    def from_user(cls, user: User) -> "AuthenticatedUser":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            role=user.role,
+            is_active=user.is_active,
+            created_at=user.created_at
+        )
+
+class UserCache:
+    """TTL-bounded LRU of authenticated principals keyed by username.
+
+    Each process has its own, so it is labelled with the users counter of
+    app.catalog. The worker that changes a user drops its entry at once; the
+    others re-read the counter at most every ``sync_interval`` seconds and
+    empty their cache when it moved (toggle-active bumps it), so a cache hit
+    costs no query in between.
+    """
+
+    def __init__(self, ttl: float, max_size: int, sync_interval: float = 0.0):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sync_interval = sync_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._synced_at = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def sync_due(self) -> bool:
+        synced_at = self._synced_at
+        return synced_at is None or time.monotonic() - synced_at >= self.sync_interval
+
+    def sync(self, version: int):
+        """Empty the cache if users changed since it was filled"""
+        with self._lock:
+            self._synced_at = time.monotonic()
+            if version != self._version:
+                self._generation += 1
+                self._entries.clear()
+                self._version = version
+
+    def get(self, username: str) -> Optional[AuthenticatedUser]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user: User, generation: Optional[int] = None) -> AuthenticatedUser:
+        """Cache ``user``, read after ``generation`` was taken; dropped if the cache was emptied since"""
+        principal = AuthenticatedUser.from_user(user)
+        if self.ttl > 0:
+            with self._lock:
+                if generation is not None and generation != self._generation:
+                    return principal
+                self._entries[principal.username] = (time.monotonic() + self.ttl, principal)
+                self._entries.move_to_end(principal.username)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "sync_seconds": self.sync_interval,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0
+            }
+
+user_cache = UserCache(ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE, sync_interval=USER_CACHE_SYNC_SECONDS)
+
+class PasswordHasher:
+    """Bounded executor for bcrypt work with admission control.
+
+    At most ``workers`` hashes run at once and ``max_queued`` more may wait;
+    anything beyond that is rejected with 503 instead of piling up request
+    threads. ``workers=0`` hashes inline in the calling thread.
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt") if workers > 0 else None
+        self._slots = threading.BoundedSemaphore(workers + max_queued) if workers > 0 else None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many sign-in requests, please try again",
+                headers={"Retry-After": "1"},
+            )
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queued": self.max_queued,
+                "in_flight": self._in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected
+            }
+
+password_hasher = PasswordHasher(workers=PASSWORD_HASH_WORKERS, max_queued=PASSWORD_HASH_QUEUE)
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.run(pwd_context.verify, plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.run(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -31,28 +215,49 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+def create_stream_ticket(user: AuthenticatedUser) -> str:
+    return create_access_token(
+        data={"sub": user.username, "aud": STREAM_TICKET_AUDIENCE}, expires_delta=timedelta(seconds=STREAM_TICKET_SECONDS)
+    )
+
+def user_from_token(token: str, db: Session, audience: Optional[str] = None) -> AuthenticatedUser:
+    """Resolve a bearer token (or, with ``audience``, a ticket for it) to an active user, or raise 401"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Without an audience, tokens that have one (stream tickets) are rejected
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], audience=audience)
         username: str = payload.get("sub")
-        if username is None:
+        if username is None or payload.get("aud") != audience:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    if user_cache.ttl > 0 and user_cache.sync_due():
+        user_cache.sync(catalog_versions(db, USERS)[USERS][0])
+    generation = user_cache.generation
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
+        db_user = db.query(User).filter(User.username == username).first()
+        if db_user is None:
+            raise credentials_exception
+        user = user_cache.put(db_user, generation)
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Inactive user",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+    return user_from_token(credentials.credentials, db)
+
 def require_role(required_roles: list):
-    def role_checker(current_user: User = Depends(get_current_user)):
+    def role_checker(current_user: AuthenticatedUser = Depends(get_current_user)):
         if current_user.role not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -60,3 +265,15 @@ def require_role(required_roles: list):
             )
         return current_user
     return role_checker
+
+def require_metrics_access(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+    """The scraper's METRICS_TOKEN or an admin's token; pool and load figures aren't for everyone"""
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials.encode(), METRICS_TOKEN.encode()):
+        return None
+    user = user_from_token(credentials.credentials, db)
+    if user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    return user
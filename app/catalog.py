@@ -0,0 +1,101 @@
+"""Version counters and conditional GET for the product and meal listings.
+
+Every transaction that changes a listing bumps its counter before commit, so
+the ETag is just the counters. Checking If-None-Match costs one tiny query
+and never loads or serializes the rows.
+
+A listing's version is the sum of VERSION_SHARDS counter rows and a writer
+bumps one of them at random, so concurrent servings and deliveries rarely
+queue on the same row lock. The bump flushes the transaction's pending
+changes first, which makes the counter the last lock every writer takes:
+writers lock products (or meals) and then a counter, never the other way
+round, and can't deadlock on each other.
+"""
+import random
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, Optional
+from fastapi import Request, Response
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import CatalogVersion
+
+PRODUCTS = "products"
+MEALS = "meals"
+# Not a listing: bumped when a user is (de)activated, so every worker drops its cached principals
+USERS = "users"
+CATALOGS = (PRODUCTS, MEALS, USERS)
+
+VERSION_SHARDS = 8
+
+def _shards(name: str) -> list:
+    # The first shard keeps the listing's own name, so existing counters carry on
+    return [name] + [f"{name}.{shard}" for shard in range(1, VERSION_SHARDS)]
+
+def ensure_catalog_versions(db: Session):
+    """Create the counter rows that don't exist yet; safe to run from several processes at once"""
+    rows = [
+        {"name": shard, "version": 1 if shard == name else 0, "updated_at": datetime.now()}
+        for name in CATALOGS for shard in _shards(name)
+    ]
+    upsert = dialect_insert(db)
+    if upsert is not None:
+        db.execute(upsert(CatalogVersion).on_conflict_do_nothing(index_elements=["name"]), rows)
+    else:
+        existing = set(db.execute(select(CatalogVersion.name)).scalars())
+        missing = [row for row in rows if row["name"] not in existing]
+        if missing:
+            db.execute(insert(CatalogVersion), missing)
+    db.commit()
+
+def bump_catalog(db: Session, *names: str):
+    """Mark listings as changed; call inside the writing transaction, right before commit"""
+    db.flush()
+    shard = random.randrange(VERSION_SHARDS)
+    db.execute(
+        update(CatalogVersion)
+        .where(CatalogVersion.name.in_([_shards(name)[shard] for name in names]))
+        .values(version=CatalogVersion.version + 1, updated_at=datetime.now())
+    )
+
+def catalog_versions(db: Session, *names: str) -> Dict[str, tuple]:
+    """{name: (version, last change or None)} of each listing"""
+    rows = db.execute(
+        select(CatalogVersion.name, CatalogVersion.version, CatalogVersion.updated_at)
+        .where(CatalogVersion.name.in_([shard for name in names for shard in _shards(name)]))
+    ).all()
+    versions = {name: (0, None) for name in names}
+    for row in rows:
+        name = row.name.partition(".")[0]
+        version, updated_at = versions[name]
+        if row.updated_at is not None and row.version and (updated_at is None or row.updated_at > updated_at):
+            updated_at = row.updated_at
+        versions[name] = (version + row.version, updated_at)
+    return versions
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison: W/"x" matches "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def not_modified(request: Request, response: Response, db: Session, *names: str) -> Optional[Response]:
+    """Set ETag/Last-Modified for a listing built from ``names``.
+
+    Returns a 304 response when the client already has this version, otherwise
+    None and the caller builds the body as usual. The counters are read before
+    the rows, so a body is never labelled with a newer version than it shows.
+    """
+    versions = catalog_versions(db, *names)
+    etag = '"' + "-".join(f"{name}.{versions[name][0]}" for name in names) + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    modified = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+    if modified:
+        headers["Last-Modified"] = format_datetime(max(modified).astimezone(timezone.utc), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
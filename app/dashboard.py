@@ -0,0 +1,129 @@
+"""Overview screen data: dashboard counters and low-stock alerts.
+
+The counters, the low-stock count included, come from one aggregate SELECT
+and the low-stock list from a second. Both are kept in a process-wide
+snapshot that is rebuilt after DASHBOARD_CACHE_TTL seconds, or on the next
+read after a write that changes stock or products.
+"""
+import os
+import threading
+import time
+from datetime import date
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.models import DailyMealRollup, MealServing, Product
+
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "5"))
+RECENT_SERVINGS = 5
+# Alerts listed by the overview and /api/products/low-stock/alerts unless asked for more
+LOW_STOCK_LIMIT = 100
+
+def dashboard_stats_statement(today: date):
+    """today_servings, low_stock_count, total_products and recent_servings in one round trip"""
+    recent = select(MealServing.id).order_by(MealServing.served_at.desc()).limit(RECENT_SERVINGS).subquery()
+    return select(
+        select(func.coalesce(func.sum(DailyMealRollup.portions_served), 0))
+        .where(DailyMealRollup.day == today).scalar_subquery().label("today_servings"),
+        select(func.count(Product.id))
+        .where(Product.quantity <= Product.minimum_quantity).scalar_subquery().label("low_stock_count"),
+        select(func.count(Product.id)).scalar_subquery().label("total_products"),
+        select(func.count()).select_from(recent).scalar_subquery().label("recent_servings"),
+    )
+
+def load_dashboard_stats(db: Session, today: Optional[date] = None) -> dict:
+    row = db.execute(dashboard_stats_statement(today or date.today())).one()
+    return dict(row._mapping)
+
+def low_stock_products(db: Session, limit: int = LOW_STOCK_LIMIT) -> list:
+    """The ``limit`` products lowest relative to their minimum, with only what an alert shows"""
+    rows = db.execute(
+        select(Product.id, Product.name, Product.quantity, Product.unit, Product.minimum_quantity)
+        .where(Product.quantity <= Product.minimum_quantity)
+        .order_by(Product.quantity - Product.minimum_quantity, Product.id)
+        .limit(limit)
+    ).all()
+    return [
+        {
+            "id": row.id,
+            "name": row.name,
+            "quantity": float(row.quantity),
+            "unit": row.unit,
+            "minimum_quantity": float(row.minimum_quantity)
+        }
+        for row in rows
+    ]
+
+def load_low_stock(db: Session, limit: int = LOW_STOCK_LIMIT) -> dict:
+    """Low-stock count and the top ``limit`` alerts"""
+    count = db.execute(
+        select(func.count(Product.id)).where(Product.quantity <= Product.minimum_quantity)
+    ).scalar_one()
+    return {"count": count, "products": low_stock_products(db, limit)}
+
+class DashboardCache:
+    """Short-lived snapshot of the overview data, shared by all requests"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None
+        self._expires_at = 0.0
+        self._day = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Only one request rebuilds an expired snapshot, the others wait for it
+        self._refresh_lock = threading.Lock()
+
+    def _fresh(self) -> Optional[dict]:
+        if self._snapshot is not None and time.monotonic() < self._expires_at and self._day == date.today():
+            return self._snapshot
+        return None
+
+    def get(self, db: Session) -> dict:
+        with self._lock:
+            snapshot = self._fresh()
+            if snapshot is not None:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+
+        with self._refresh_lock:
+            with self._lock:
+                snapshot = self._fresh()
+                generation = self._generation
+            if snapshot is not None:
+                return snapshot
+
+            today = date.today()
+            stats = load_dashboard_stats(db, today)
+            snapshot = {
+                "stats": stats,
+                "low_stock_alerts": {"count": stats["low_stock_count"], "products": low_stock_products(db)}
+            }
+            with self._lock:
+                # A write that committed while we were reading makes this snapshot stale already
+                if self.ttl > 0 and generation == self._generation:
+                    self._snapshot = snapshot
+                    self._expires_at = time.monotonic() + self.ttl
+                    self._day = today
+            return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "ttl_seconds": self.ttl,
+                "cached": self._snapshot is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+dashboard_cache = DashboardCache(DASHBOARD_CACHE_TTL)
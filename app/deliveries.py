@@ -0,0 +1,272 @@
+"""Bulk restocking from a delivery manifest (CSV or JSON).
+
+Rows are matched to products by id or by name (case-insensitive, through the
+lower(name) index), converted to each product's unit with the fixed-point
+unit engine and applied with one executemany UPDATE (and one INSERT for
+products created from the manifest) in a single transaction, with one stock
+ledger movement per product. Several rows for the same product add up, in
+manifest order.
+"""
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+from app.catalog import PRODUCTS, bump_catalog
+from app.dashboard import dashboard_cache
+from app.events import publish_resync
+from app.ledger import append_movements, stock_cache
+from app.models import Product
+from app.portions import refresh_products
+from app.stock import lock_products
+from app.units import UNITS, compatible, from_fixed, to_fixed
+
+DELIVERY_MAX_ROWS = int(os.getenv("DELIVERY_MAX_ROWS", "20000"))
+# Largest value a Numeric(10, 3) column holds
+MAX_QUANTITY = Decimal("9999999.999")
+# Names per IN (...) when matching, well under every driver's parameter limit
+MATCH_CHUNK = 1000
+MODES = ("add", "set")
+FIELDS = ("id", "name", "quantity", "unit", "delivery_date")
+
+def parse_manifest(body: bytes, content_type: str) -> List[dict]:
+    """Manifest rows as dicts; CSV needs a header row, JSON is a list of objects or {"rows": [...]}"""
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Manifest must be UTF-8")
+    if "json" in content_type:
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if isinstance(rows, dict):
+            rows = rows.get("rows")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise HTTPException(status_code=400, detail="JSON manifest must be a list of objects")
+    elif "csv" in content_type or content_type.startswith("text/plain"):
+        header = text.split("\n", 1)[0]
+        delimiter = max(",;\t", key=header.count)
+        reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+        reader.fieldnames = [field.strip().lower() for field in reader.fieldnames or []]
+        if "quantity" not in reader.fieldnames:
+            raise HTTPException(status_code=400, detail="CSV manifest needs a header row with a quantity column")
+        rows = list(reader)
+    else:
+        raise HTTPException(status_code=415, detail="Send the manifest as text/csv or application/json")
+    if not rows:
+        raise HTTPException(status_code=400, detail="Manifest has no rows")
+    if len(rows) > DELIVERY_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"Manifest has more than {DELIVERY_MAX_ROWS} rows")
+    return rows
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def clean_row(raw: dict, default_date: Optional[date]) -> dict:
+    """Validated row fields, or ValueError with the reason"""
+    row = {field: None if _blank(raw.get(field)) else raw.get(field) for field in FIELDS}
+    if row["id"] is None and row["name"] is None:
+        raise ValueError("Row needs a product id or name")
+    if row["id"] is not None:
+        # int() would truncate a JSON 1.5 to product 1 and take true as 1
+        if isinstance(row["id"], bool) or (isinstance(row["id"], float) and not row["id"].is_integer()):
+            raise ValueError(f"Invalid product id: {row['id']}")
+        try:
+            row["id"] = int(row["id"])
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid product id: {row['id']}")
+    if row["name"] is not None:
+        row["name"] = str(row["name"]).strip()
+    try:
+        quantity = Decimal(str(row["quantity"]).strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Invalid quantity: {row['quantity']}")
+    if not quantity.is_finite() or quantity < 0:
+        raise ValueError(f"Invalid quantity: {row['quantity']}")
+    row["quantity"] = quantity
+    if row["unit"] is not None:
+        row["unit"] = str(row["unit"]).strip()
+        if row["unit"] not in UNITS:
+            raise ValueError(f"Unknown unit: {row['unit']}")
+    if row["delivery_date"] is None:
+        row["delivery_date"] = default_date
+    else:
+        try:
+            row["delivery_date"] = date.fromisoformat(str(row["delivery_date"]).strip())
+        except ValueError:
+            raise ValueError(f"Invalid delivery_date: {row['delivery_date']}")
+    return row
+
+def match_products(db: Session, rows: List[dict]) -> Dict[str, list]:
+    """{lower(name): [product ids]} for the names of rows that have no id"""
+    names = sorted({row["name"].lower() for row in rows if row["id"] is None})
+    found = {}
+    for start in range(0, len(names), MATCH_CHUNK):
+        chunk = names[start:start + MATCH_CHUNK]
+        for product_id, name in db.execute(
+            select(Product.id, Product.name).where(func.lower(Product.name).in_(chunk)).order_by(Product.id)
+        ):
+            found.setdefault(name.lower(), []).append(product_id)
+    return found
+
+def apply_delivery(
+    db: Session,
+    raw_rows: List[dict],
+    mode: str = "add",
+    default_date: Optional[date] = None,
+    create_missing: bool = False,
+    all_or_nothing: bool = True,
+    dry_run: bool = False,
+    user_id: Optional[int] = None
+) -> dict:
+    """Apply a manifest and return the per-row report.
+
+    ``mode`` "add" adds the delivered quantities to the stock, "set" replaces
+    the stock with them (a stock-take). With ``all_or_nothing`` any failed row
+    rolls the whole manifest back; otherwise the valid rows are applied.
+    """
+    results, rows = [], []
+    for index, raw in enumerate(raw_rows):
+        result = {"row": index + 1, "product_id": None, "name": None, "status": "error", "quantity": None, "unit": None, "error": None}
+        results.append(result)
+        try:
+            row = clean_row(raw, default_date)
+        except ValueError as e:
+            result["error"] = str(e)
+            continue
+        result["product_id"], result["name"] = row["id"], row["name"]
+        rows.append((result, row))
+
+    by_name = match_products(db, [row for _, row in rows])
+    wanted = {row["id"] for _, row in rows if row["id"] is not None}
+    wanted.update(ids[0] for ids in by_name.values() if len(ids) == 1)
+    stock = lock_products(db, wanted, user_id)
+
+    # product_id (or lower(name) of a product to create) -> running state
+    pending = {}
+    for result, row in rows:
+        product_id = row["id"]
+        if product_id is None:
+            ids = by_name.get(row["name"].lower(), [])
+            if len(ids) > 1:
+                result["error"] = f"{len(ids)} products are named {row['name']}, use the product id"
+                continue
+            product_id = ids[0] if ids else None
+        elif row["name"] is not None and product_id in stock and stock[product_id]["name"].lower() != row["name"].lower():
+            result["error"] = f"Product {product_id} is {stock[product_id]['name']}, not {row['name']}"
+            continue
+
+        if product_id is None:
+            if not create_missing:
+                result["error"] = "Product not found"
+                continue
+            key = row["name"].lower()
+            state = pending.get(key)
+            if state is None:
+                state = {"create": True, "name": row["name"], "unit": row["unit"] or "g", "fixed": 0, "date": None}
+        elif product_id not in stock:
+            result["error"] = "Product not found"
+            continue
+        else:
+            key = product_id
+            state = pending.get(key)
+            if state is None:
+                product = stock[product_id]
+                start = to_fixed(product["quantity"], product["unit"]) if mode == "add" else 0
+                state = {"create": False, "id": product_id, "name": product["name"], "unit": product["unit"], "fixed": start, "date": None}
+
+        unit = row["unit"] or state["unit"]
+        if not compatible(state["unit"], unit):
+            result["error"] = f"Can't convert {unit} to {state['unit']}"
+            continue
+        total = state["fixed"] + to_fixed(row["quantity"], unit)
+        if from_fixed(total, state["unit"]) > MAX_QUANTITY:
+            result["error"] = f"Quantity would exceed {MAX_QUANTITY} {state['unit']}"
+            continue
+        state["fixed"] = total
+        if row["delivery_date"] is not None and (state["date"] is None or row["delivery_date"] > state["date"]):
+            state["date"] = row["delivery_date"]
+        pending[key] = state
+        result.update(status="created" if state["create"] else "updated", name=state["name"], unit=state["unit"])
+        result["state"] = state
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    accepted = bool(pending) and not (failed and all_or_nothing)
+    applied = accepted and not dry_run
+    if applied:
+        now = datetime.now()
+        kind = "delivery" if mode == "add" else "correction"
+        updates, movements = [], []
+        for state in pending.values():
+            if not state["create"]:
+                quantity = from_fixed(state["fixed"], state["unit"])
+                values = {"id": state["id"], "quantity": quantity, "updated_at": now}
+                # Rows without a date keep the product's last delivery date
+                if state["date"] is not None:
+                    values["delivery_date"] = state["date"]
+                updates.append(values)
+                change = to_fixed(quantity, state["unit"]) - stock[state["id"]]["position"].amount
+                if change:
+                    movements.append({"product_id": state["id"], "kind": kind, "amount": change, "user_id": user_id, "created_at": now})
+        if updates:
+            db.execute(update(Product), updates)
+        creates = [state for state in pending.values() if state["create"]]
+        if creates:
+            created = db.execute(
+                insert(Product).returning(Product.id, Product.name),
+                [
+                    {
+                        "name": state["name"],
+                        "quantity": from_fixed(state["fixed"], state["unit"]),
+                        "unit": state["unit"],
+                        "delivery_date": state["date"]
+                    }
+                    for state in creates
+                ]
+            ).all()
+            created_ids = {name.lower(): product_id for product_id, name in created}
+            for state in creates:
+                product_id = state["id"] = created_ids[state["name"].lower()]
+                movements.append({
+                    "product_id": product_id,
+                    "kind": "opening",
+                    "amount": to_fixed(from_fixed(state["fixed"], state["unit"]), state["unit"]),
+                    "user_id": user_id,
+                    "created_at": now
+                })
+        positions = append_movements(db, movements, {product_id: product["position"] for product_id, product in stock.items()})
+        bump_catalog(db, PRODUCTS)
+        db.commit()
+        stock_cache.store(positions)
+        refresh_products(db, [state["id"] for state in pending.values()])
+        dashboard_cache.invalidate()
+        # Screens reload rather than patching in thousands of rows one event each
+        publish_resync()
+    else:
+        db.rollback()
+
+    for result in results:
+        state = result.pop("state", None)
+        if state is not None:
+            result["product_id"] = state.get("id")
+            result["quantity"] = from_fixed(state["fixed"], state["unit"])
+            if failed and all_or_nothing:
+                result.update(status="skipped", error="Not applied: another row in the manifest failed")
+
+    return {
+        "applied": applied,
+        "dry_run": dry_run,
+        "mode": mode,
+        "rows": len(results),
+        # With dry_run, what would have been updated and created
+        "updated": sum(1 for state in pending.values() if not state["create"]) if accepted else 0,
+        "created": sum(1 for state in pending.values() if state["create"]) if accepted else 0,
+        "failed": failed,
+        "results": results
+    }
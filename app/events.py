@@ -0,0 +1,230 @@
+"""Server-sent change events for the kitchen screens.
+
+Write paths publish small events after they commit (new quantities, new
+possible_portions, new servings, catalog edits) and every connected screen
+patches its lists from them instead of reloading. Each event is encoded once,
+however many clients are listening, and nothing is built at all when nobody
+is. A client that falls too far behind gets a ``resync`` event and reloads.
+
+The broker lives in the process: with several server processes each one only
+reaches its own clients.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.ledger import Position
+from app.models import MealIngredient, Product
+from app.portions import get_meal_portions
+from app.schemas import ProductResponse
+
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_HISTORY_SIZE = int(os.getenv("EVENT_HISTORY_SIZE", "512"))
+EVENT_HEARTBEAT = float(os.getenv("EVENT_HEARTBEAT", "15"))
+# Streams end after this long and the browser reconnects, which re-checks the token
+# and keeps server shutdown from waiting on clients that never hang up
+EVENT_STREAM_MAX_AGE = float(os.getenv("EVENT_STREAM_MAX_AGE", "60"))
+# How long EventSource waits before reconnecting, in milliseconds
+EVENT_RETRY_MS = 3000
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def format_event(event_id: int, event_type: str, data) -> str:
+    payload = json.dumps(data, default=_json_default, separators=(",", ":"), ensure_ascii=False)
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+RESYNC = "event: resync\ndata: {}\n\n"
+KEEP_ALIVE = ": keep-alive\n\n"
+
+class EventBroker:
+    """Fan-out of published events to one bounded queue per connected client.
+
+    The last ``history_size`` events are kept so a client that reconnects with
+    Last-Event-ID gets exactly what it missed; if that is older than the
+    history it gets ``resync`` instead.
+    """
+
+    def __init__(self, queue_size: int, history_size: int, heartbeat: float, max_age: float):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.published = 0
+        self.replayed = 0
+        self.resyncs = 0
+        self._last_id = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = {}
+        self._left_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def listening(self) -> bool:
+        """Whether events are worth building; call before building one and skip it when False"""
+        # Clients between two connections still count, or they would miss what happened meanwhile
+        if self._subscribers or time.monotonic() - self._left_at < 2 * EVENT_RETRY_MS / 1000:
+            return True
+        if self._history:
+            # This change won't be recorded, so the history can't bring anyone up to date any more;
+            # burning an id makes every client that comes back resync
+            with self._lock:
+                self._history.clear()
+                self._last_id += 1
+        return False
+
+    def publish(self, event_type: str, data):
+        """Queue an event for every client; safe to call from the request threads"""
+        if not self.listening():
+            return
+        with self._lock:
+            self._last_id += 1
+            frame = format_event(self._last_id, event_type, data)
+            self._history.append((self._last_id, frame))
+            subscribers = list(self._subscribers.items())
+            self.published += 1
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, frame)
+            except RuntimeError:
+                # The client's event loop is gone
+                self._unsubscribe(queue)
+
+    def _deliver(self, queue: asyncio.Queue, frame: str):
+        try:
+            queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Too far behind to catch up event by event, have it reload instead
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+            with self._lock:
+                self.resyncs += 1
+
+    def _subscribe(self, last_event_id: Optional[int]) -> Tuple[asyncio.Queue, List[str]]:
+        queue = asyncio.Queue(self.queue_size)
+        with self._lock:
+            # Registering and reading the history under one lock means nothing is missed or sent twice
+            self._subscribers[queue] = asyncio.get_running_loop()
+            if last_event_id is None or last_event_id == self._last_id:
+                return queue, []
+            oldest = self._history[0][0] if self._history else self._last_id + 1
+            if oldest - 1 <= last_event_id < self._last_id:
+                missed = [frame for event_id, frame in self._history if event_id > last_event_id]
+                self.replayed += len(missed)
+                return queue, missed
+            # Too old, or from before a server restart
+            self.resyncs += 1
+            return queue, [RESYNC]
+
+    def _unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            if self._subscribers.pop(queue, None) is not None:
+                self._left_at = time.monotonic()
+
+    async def stream(self, last_event_id: Optional[int] = None):
+        """SSE body for one client, ends when the client disconnects or the stream reaches max_age"""
+        queue, missed = self._subscribe(last_event_id)
+        deadline = time.monotonic() + self.max_age
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            for frame in missed:
+                yield frame
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    frame = await asyncio.wait_for(queue.get(), min(self.heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    frame = KEEP_ALIVE
+                yield frame
+        finally:
+            self._unsubscribe(queue)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "last_event_id": self._last_id,
+                "history": len(self._history),
+                "published": self.published,
+                "replayed": self.replayed,
+                "resyncs": self.resyncs,
+                "queue_size": self.queue_size
+            }
+
+event_broker = EventBroker(
+    queue_size=EVENT_QUEUE_SIZE,
+    history_size=EVENT_HISTORY_SIZE,
+    heartbeat=EVENT_HEARTBEAT,
+    max_age=EVENT_STREAM_MAX_AGE
+)
+
+def _meal_portions(db: Session, product_ids: List[int]) -> List[dict]:
+    meal_ids = db.execute(
+        select(MealIngredient.meal_id).distinct().where(MealIngredient.product_id.in_(product_ids))
+    ).scalars().all()
+    portions = get_meal_portions(db, meal_ids)
+    return [{"id": meal_id, "possible_portions": portions[meal_id][0]} for meal_id in sorted(meal_ids)]
+
+def _movement_id(positions: Dict[int, Position], product_id: int) -> Optional[int]:
+    position = positions.get(product_id)
+    return position.movement_id if position is not None else None
+
+def publish_stock(db: Session, quantities: Dict[int, Decimal], positions: Dict[int, Position]):
+    """New {product_id: quantity} and possible_portions of the meals using them (call after commit).
+
+    Each quantity carries the ledger movement it is current as of. Writers
+    publish from their own threads once they commit, so two servings' events
+    can arrive in either order; clients keep the newest movement per product.
+    """
+    if not quantities or not event_broker.listening():
+        return
+    event_broker.publish("stock", {
+        "products": [
+            {"id": product_id, "quantity": quantities[product_id], "movement_id": _movement_id(positions, product_id)}
+            for product_id in sorted(quantities)
+        ],
+        "meals": _meal_portions(db, list(quantities))
+    })
+
+def publish_product(db: Session, product: Product, positions: Dict[int, Position]):
+    """A created or edited product in full, plus the meals whose portions it changes (call after commit).
+
+    ``positions`` are the ledger positions the write produced; without one
+    (no stock change) clients keep the quantity they have.
+    """
+    if not event_broker.listening():
+        return
+    event_broker.publish("product", {
+        "product": ProductResponse.model_validate(product).model_dump(mode="json"),
+        "movement_id": _movement_id(positions, product.id),
+        "meals": _meal_portions(db, [product.id])
+    })
+
+def publish_deleted(kind: str, object_id: int):
+    """``kind`` is "product" or "meal"; clients drop the row, meals using a product drop to 0 portions"""
+    event_broker.publish(f"{kind}_deleted", {"id": object_id})
+
+def publish_meal(meal: dict):
+    """A created or edited meal in the MealResponse shape"""
+    event_broker.publish("meal", meal)
+
+def publish_servings(servings: List[dict]):
+    """New servings in the MealServingResponse shape"""
+    if servings:
+        event_broker.publish("serving", {"servings": servings})
+
+def publish_resync():
+    """Too much changed to describe (e.g. a bulk import); every client reloads its lists"""
+    event_broker.publish("resync", {})
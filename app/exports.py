@@ -0,0 +1,107 @@
+"""Streaming CSV/NDJSON exports of the serving and usage history.
+
+Rows are read with ``yield_per`` (a server-side cursor on Postgres) and written
+out one batch at a time, so memory stays flat regardless of the date range.
+Each export opens its own session, which lives exactly as long as the stream.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterator, Optional
+from sqlalchemy import func, select
+from app.database import SessionLocal
+from app.models import Meal, MealServing, Product, ProductUsageLog, User
+
+EXPORT_BATCH_SIZE = 2000
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def _date_range(stmt, column, date_from: Optional[date], date_to: Optional[date]):
+    if date_from is not None:
+        stmt = stmt.where(column >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        stmt = stmt.where(column < datetime.combine(date_to + timedelta(days=1), time.min))
+    return stmt
+
+def servings_export_query(date_from: Optional[date] = None, date_to: Optional[date] = None):
+    stmt = select(
+        MealServing.id,
+        MealServing.served_at,
+        MealServing.meal_id,
+        func.coalesce(Meal.name, "Unknown").label("meal_name"),
+        MealServing.user_id,
+        func.coalesce(User.username, "Unknown").label("username"),
+        MealServing.portions_served,
+        MealServing.notes
+    ).outerjoin(
+        Meal, Meal.id == MealServing.meal_id
+    ).outerjoin(
+        User, User.id == MealServing.user_id
+    ).order_by(MealServing.served_at, MealServing.id)
+    return _date_range(stmt, MealServing.served_at, date_from, date_to)
+
+def usage_export_query(date_from: Optional[date] = None, date_to: Optional[date] = None):
+    stmt = select(
+        ProductUsageLog.id,
+        ProductUsageLog.used_at,
+        ProductUsageLog.product_id,
+        func.coalesce(Product.name, "Unknown").label("product_name"),
+        ProductUsageLog.quantity_used,
+        ProductUsageLog.unit,
+        ProductUsageLog.meal_serving_id,
+        MealServing.meal_id,
+        func.coalesce(Meal.name, "Unknown").label("meal_name"),
+        MealServing.user_id,
+        func.coalesce(User.username, "Unknown").label("username")
+    ).outerjoin(
+        Product, Product.id == ProductUsageLog.product_id
+    ).outerjoin(
+        MealServing, MealServing.id == ProductUsageLog.meal_serving_id
+    ).outerjoin(
+        Meal, Meal.id == MealServing.meal_id
+    ).outerjoin(
+        User, User.id == MealServing.user_id
+    ).order_by(ProductUsageLog.used_at, ProductUsageLog.id)
+    return _date_range(stmt, ProductUsageLog.used_at, date_from, date_to)
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+def stream_rows(stmt, fmt: str) -> Iterator[str]:
+    """Yield the result of ``stmt`` as CSV (with a header line) or NDJSON, one batch per chunk"""
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == "csv" else None
+        if writer is not None:
+            writer.writerow(columns)
+
+        for batch in result.partitions():
+            if writer is not None:
+                writer.writerows([_csv_value(value) for value in row] for row in batch)
+            else:
+                for row in batch:
+                    buffer.write(json.dumps({key: _json_value(value) for key, value in zip(columns, row)}, ensure_ascii=False))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue()
+
+def export_filename(kind: str, fmt: str, date_from: Optional[date], date_to: Optional[date]) -> str:
+    span = f"{date_from or 'start'}_{date_to or date.today()}"
+    return f"{kind}_{span}.{'csv' if fmt == 'csv' else 'ndjson'}"
@@ -0,0 +1,337 @@
+"""Stock depletion forecast: days until each product runs out and how much to reorder.
+
+Consumption is modelled per product from the daily usage rollup with
+exponential smoothing of the daily rate and one multiplicative factor per
+weekday (Holt-Winters without trend), so a kitchen that is closed at weekends
+doesn't spread Monday's usage over Saturday and Sunday.
+
+The models only ever look at complete days. They are fitted once from the
+last FORECAST_HISTORY_DAYS days and then stepped forward with each new day
+from the rollup, one small query per day. Forecasts are served from memory
+until the products catalog version changes, which every stock change bumps;
+then the stock and today's usage so far are read for the whole catalog in
+two queries and only the products whose inputs changed are forecast again.
+Past days edited afterwards (``python -m app.rollups rebuild``) are picked
+up on the next restart.
+"""
+import math
+import os
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import Float, cast, func, select
+from sqlalchemy.orm import Session
+from app.analytics import base_quantity, base_unit, bucket_positions, bucket_start, bucket_starts
+from app.catalog import PRODUCTS, catalog_versions
+from app.models import DailyProductUsageRollup, Product
+from app.units import BASE_UNITS, FACTORS
+
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "56"))
+# Stock that lasts longer than this is reported as not running out
+FORECAST_HORIZON_DAYS = 365
+# Smoothing of the daily rate and of the weekday factors
+ALPHA = 0.1
+GAMMA = 0.1
+# Weeks of history averaged into the first weekday factors, the rest is smoothed in day by day
+INITIAL_WEEKS = 4
+# A weekday whose factor is below this is treated as a closed day: it says nothing about the rate
+CLOSED_DAY = 0.05
+# Parameter sets whose forecasts are kept (and refreshed) for today
+RESULTS_KEPT = 8
+
+class UsageModel:
+    """Smoothed daily rate and weekday factors (Monday first, mean 1) of one product, in base units"""
+    __slots__ = ("level", "season", "variance")
+
+    def __init__(self, first_weekday: int, values: List[float]):
+        """Initial state from daily usage starting on ``first_weekday``: up to the first INITIAL_WEEKS
+        whole weeks are averaged (or the few days there are, without weekday factors), the rest is stepped"""
+        start = min(INITIAL_WEEKS, len(values) // 7) * 7 or len(values)
+        self.level = sum(values[:start]) / start
+        self.season = [1.0] * 7
+        if start >= 7 and self.level > 0:
+            for offset in range(7):
+                self.season[(first_weekday + offset) % 7] = sum(values[offset:start:7]) / (start // 7) / self.level
+        self.variance = sum(
+            (x - self.level * self.season[(first_weekday + offset) % 7]) ** 2 for offset, x in enumerate(values[:start])
+        ) / start
+        for offset in range(start, len(values)):
+            self.step((first_weekday + offset) % 7, values[offset])
+
+    def step(self, weekday: int, x: float):
+        factor = self.season[weekday]
+        error = x - self.level * factor
+        self.variance = ALPHA * error * error + (1 - ALPHA) * self.variance
+        if factor >= CLOSED_DAY:
+            self.level = ALPHA * x / factor + (1 - ALPHA) * self.level
+        if self.level > 0:
+            self.season[weekday] = GAMMA * x / self.level + (1 - GAMMA) * factor
+            # Keep the factors at mean 1 so that level stays the average daily usage
+            total = sum(self.season)
+            if total > 0:
+                self.season = [value * 7 / total for value in self.season]
+                self.level *= total / 7
+
+    def demand(self, today: date, used_today: float, days: float) -> float:
+        """Expected usage from now until ``days`` days from the start of today"""
+        rates = [self.level * self.season[(today.weekday() + offset) % 7] for offset in range(7)]
+        total = max(0.0, rates[0] - used_today) * min(1.0, days)
+        rest = max(0.0, days - 1)
+        weeks, rest = divmod(rest, 7)
+        total += weeks * self.level * 7
+        offset = 1
+        while rest > 0:
+            total += rates[offset % 7] * min(1.0, rest)
+            rest -= 1
+            offset += 1
+        return total
+
+    def days_left(self, today: date, used_today: float, stock: float) -> Optional[float]:
+        """Days from the start of today until ``stock`` is used up, None beyond the horizon"""
+        if stock <= 0:
+            return 0.0
+        if self.level <= 0:
+            return None
+        rates = [self.level * self.season[(today.weekday() + offset) % 7] for offset in range(7)]
+        # The part of today that is still ahead, then a whole number of weeks, then day by day
+        remaining, days = stock, 0.0
+        ahead = max(0.0, rates[0] - used_today)
+        if remaining <= ahead:
+            return remaining / ahead
+        remaining -= ahead
+        # Whole weeks that leave something for the last one, so the day it runs out is found below
+        weeks = max(0, math.ceil(remaining / (self.level * 7) - 1e-9) - 1)
+        remaining -= weeks * self.level * 7
+        days = 1.0 + weeks * 7
+        offset = 1
+        while days <= FORECAST_HORIZON_DAYS:
+            rate = rates[offset % 7]
+            # With a little slack for rounding, so stock that lasts exactly to a closed day isn't carried past it
+            if rate > 0 and remaining - rate <= stock * 1e-9:
+                return days + min(1.0, remaining / rate)
+            remaining -= rate
+            days += 1
+            offset += 1
+        return None
+
+def usage_rows(db: Session, date_from: date, date_to: date):
+    """(product_id, base unit, day, quantity in base units) from the daily rollup"""
+    day = bucket_start(DailyProductUsageRollup.day, "day", db.get_bind().dialect.name)
+    unit = base_unit(DailyProductUsageRollup.unit)
+    return db.connection().execute(
+        select(
+            DailyProductUsageRollup.product_id,
+            unit,
+            day,
+            cast(func.sum(base_quantity(DailyProductUsageRollup.quantity_used, DailyProductUsageRollup.unit)), Float)
+        ).where(
+            DailyProductUsageRollup.day >= date_from,
+            DailyProductUsageRollup.day <= date_to
+        ).group_by(DailyProductUsageRollup.product_id, unit, day)
+    ).all()
+
+def advance_models(models: Dict[tuple, UsageModel], rows, date_from: date, date_to: date):
+    """Step every model through [date_from, date_to]; days without a row used nothing"""
+    days = bucket_starts(date_from, date_to, "day")
+    positions = bucket_positions(days)
+    usage = {}
+    for product_id, unit, day, quantity in rows:
+        values = usage.get((product_id, unit))
+        if values is None:
+            values = usage[(product_id, unit)] = [0.0] * len(days)
+        values[positions[day]] = quantity or 0.0
+    weekdays = [day.weekday() for day in days]
+    for key in set(models) | set(usage):
+        values = usage.get(key)
+        model = models.get(key)
+        if model is None:
+            # History starts at the first day the product was used
+            first = next((index for index, x in enumerate(values) if x), None)
+            if first is not None:
+                models[key] = UsageModel(weekdays[first], values[first:])
+        else:
+            for weekday, x in zip(weekdays, values or [0.0] * len(days)):
+                model.step(weekday, x)
+
+def _round_up(value: float) -> float:
+    return math.ceil(round(value * 1000, 6)) / 1000
+
+def product_forecast(
+    product,
+    model: Optional[UsageModel],
+    used_today: float,
+    today: date,
+    lead_time_days: int,
+    cover_days: int,
+    safety_factor: float
+) -> dict:
+    """Forecast for one product; quantities in the product's unit"""
+    factor = FACTORS.get(product.unit, 1)
+    stock = float(product.quantity or 0) * factor
+    forecast = {
+        "product_id": product.id,
+        "product_name": product.name,
+        "unit": product.unit,
+        "quantity": float(product.quantity or 0),
+        "minimum_quantity": float(product.minimum_quantity or 0),
+        "daily_usage": 0.0,
+        "usage_by_weekday": [0.0] * 7,
+        "days_until_stockout": None,
+        "stockout_date": None,
+        "reorder_by": None,
+        "reorder_quantity": 0.0,
+        "needs_reorder": False
+    }
+    if model is None or model.level <= 0:
+        return forecast
+
+    safety = safety_factor * math.sqrt(model.variance * max(lead_time_days, 1))
+    target = model.demand(today, used_today, lead_time_days + cover_days) + safety
+    days = model.days_left(today, used_today, stock)
+    # When stock reaches the safety level, which is when a reorder must have arrived
+    reach = model.days_left(today, used_today, stock - safety)
+    forecast.update(
+        daily_usage=round(model.level / factor, 3),
+        usage_by_weekday=[round(model.level * value / factor, 3) for value in model.season],
+        reorder_quantity=_round_up(max(0.0, target - stock) / factor)
+    )
+    if days is not None:
+        forecast["days_until_stockout"] = round(days, 1)
+        forecast["stockout_date"] = (today + timedelta(days=int(days))).isoformat()
+    if reach is not None:
+        forecast["reorder_by"] = (today + timedelta(days=max(0, int(reach) - lead_time_days))).isoformat()
+        forecast["needs_reorder"] = reach <= lead_time_days
+    return forecast
+
+def _sort_key(forecast: dict):
+    days = forecast["days_until_stockout"]
+    return (days is None, days if days is not None else 0, forecast["product_id"])
+
+class ForecastCache:
+    """Fitted usage models and the latest catalog forecasts, shared by all requests.
+
+    ``_lock`` only guards the cached results and counters, so hits and stats()
+    never wait for a computation. The queries and the model fit run under
+    ``_fit_lock``, and callers asking for a key that is already being computed
+    wait for that result instead of computing it again.
+    """
+
+    def __init__(self, history_days: int):
+        self.history_days = history_days
+        self.hits = 0
+        self.misses = 0
+        self.recomputed = 0
+        self._models: Dict[tuple, UsageModel] = {}
+        self._fitted_through: Optional[date] = None
+        # (today, parameters) -> forecasts and the inputs each was computed from
+        self._entries = {}
+        # key -> Event set once the caller computing it has stored the result
+        self._pending: Dict[tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._fit_lock = threading.Lock()
+
+    def _fit(self, db: Session, through: date):
+        """Bring the models up to ``through``: refit from scratch, or step them through the new days"""
+        if self._fitted_through == through:
+            return
+        if self._fitted_through is None or (through - self._fitted_through).days > self.history_days:
+            self._models = {}
+            date_from = through - timedelta(days=self.history_days - 1)
+        else:
+            date_from = self._fitted_through + timedelta(days=1)
+        advance_models(self._models, usage_rows(db, date_from, through), date_from, through)
+        self._fitted_through = through
+
+    def get(
+        self,
+        db: Session,
+        lead_time_days: int = 3,
+        cover_days: int = 7,
+        safety_factor: float = 1.65,
+        today: Optional[date] = None
+    ) -> List[dict]:
+        """Forecasts of every product, soonest stockout first"""
+        today = today or date.today()
+        key = (today, lead_time_days, cover_days, safety_factor)
+        # Read before the stock, so forecasts are never labelled with a newer version than they show
+        version = catalog_versions(db, PRODUCTS)[PRODUCTS][0]
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry["version"] >= version:
+                    self.hits += 1
+                    return entry["forecasts"]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    self.misses += 1
+                    break
+            pending.wait()
+
+        try:
+            with self._fit_lock:
+                forecasts, inputs, recomputed = self._compute(
+                    db, today, entry, lead_time_days, cover_days, safety_factor
+                )
+            with self._lock:
+                self.recomputed += recomputed
+                self._entries = {
+                    other: value for other, value in self._entries.items()
+                    if other[0] == today and (other == key or len(self._entries) < RESULTS_KEPT)
+                }
+                self._entries[key] = {"version": version, "forecasts": forecasts, "inputs": inputs}
+            return forecasts
+        finally:
+            with self._lock:
+                self._pending.pop(key).set()
+
+    def _compute(self, db: Session, today: date, entry: Optional[dict], lead_time_days: int, cover_days: int,
+                 safety_factor: float):
+        """(forecasts, inputs, products recomputed); called with ``_fit_lock`` held"""
+        self._fit(db, today - timedelta(days=1))
+        used_today = {
+            (product_id, unit): quantity or 0.0
+            for product_id, unit, _, quantity in usage_rows(db, today, today)
+        }
+        products = db.connection().execute(
+            select(Product.id, Product.name, Product.unit, Product.quantity, Product.minimum_quantity)
+        ).all()
+        previous = entry["inputs"] if entry is not None else {}
+        inputs, forecasts, recomputed = {}, [], 0
+        for product in products:
+            usage_key = (product.id, BASE_UNITS.get(product.unit, product.unit))
+            used = used_today.get(usage_key, 0.0)
+            # The models only change with the day, which is part of the key
+            state = (tuple(product), used)
+            known = previous.get(product.id)
+            if known is not None and known[0] == state:
+                forecast = known[1]
+            else:
+                forecast = product_forecast(
+                    product, self._models.get(usage_key), used, today, lead_time_days, cover_days, safety_factor
+                )
+                recomputed += 1
+            inputs[product.id] = (state, forecast)
+            forecasts.append(forecast)
+        forecasts.sort(key=_sort_key)
+        return forecasts, inputs, recomputed
+
+    def clear(self):
+        with self._fit_lock, self._lock:
+            self._models, self._fitted_through = {}, None
+            self._entries = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "history_days": self.history_days,
+                "fitted_through": self._fitted_through.isoformat() if self._fitted_through else None,
+                "models": len(self._models),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "products_recomputed": self.recomputed,
+            }
+
+forecast_cache = ForecastCache(FORECAST_HISTORY_DAYS)
@@ -0,0 +1,378 @@
+"""Append-only stock ledger.
+
+Every change of a product's stock (opening balance, delivery, serving, manual
+correction) is a StockMovement row, and Product.quantity is only a projection
+of it kept for the listings, portions and reports. A product's stock is its
+latest StockSnapshot plus the movements after it. Writers add a snapshot
+whenever that tail reaches STOCK_SNAPSHOT_EVERY movements, and the process
+caches each product's position, so a stock check normally only reads the few
+movements other processes appended since.
+
+Writers append while holding the product's row lock (app.stock.lock_products),
+so each product's movements are committed in id order.
+
+``python -m app.ledger check`` compares the projection with the ledger,
+``--fix`` records corrections for the differences, and ``snapshot`` takes a
+snapshot of every product with a tail.
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import and_, exists, func, insert, or_, select
+from sqlalchemy.orm import Session
+from app.models import Product, StockMovement, StockSnapshot
+from app.units import from_fixed, to_fixed
+
+STOCK_SNAPSHOT_EVERY = int(os.getenv("STOCK_SNAPSHOT_EVERY", "200"))
+STOCK_CACHE_SIZE = int(os.getenv("STOCK_CACHE_SIZE", "20000"))
+# Past this many products a single snapshot + tail query is cheaper than one condition per cached product
+CACHED_TAIL_LIMIT = 100
+CHUNK = 1000
+
+KINDS = ("opening", "delivery", "serving", "correction")
+
+class Position(NamedTuple):
+    """Where a product stands in the ledger"""
+    movement_id: int  # last movement counted, 0 before the first one
+    amount: int  # stock in thousandths of the base unit
+    tail: int  # movements since the last snapshot
+
+NO_MOVEMENTS = Position(0, 0, 0)
+
+class StockCache:
+    """Last known ledger position per product, only ever moved forward"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._positions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, product_ids: Iterable[int]) -> Tuple[Dict[int, Position], List[int]]:
+        found, missing = {}, []
+        with self._lock:
+            for product_id in product_ids:
+                position = self._positions.get(product_id)
+                if position is None:
+                    missing.append(product_id)
+                else:
+                    found[product_id] = position
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def store(self, positions: Dict[int, Position]):
+        """Remember committed positions (call after commit)"""
+        with self._lock:
+            for product_id, position in positions.items():
+                known = self._positions.get(product_id)
+                if known is None or known.movement_id < position.movement_id:
+                    self._positions[product_id] = position
+            while len(self._positions) > self.max_size:
+                self._positions.popitem(last=False)
+
+    def drop(self, product_ids: Iterable[int]):
+        with self._lock:
+            for product_id in product_ids:
+                self._positions.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._positions),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "snapshot_every": STOCK_SNAPSHOT_EVERY
+            }
+
+stock_cache = StockCache(STOCK_CACHE_SIZE)
+
+def _latest_snapshots(product_ids: List[int]):
+    latest = select(
+        StockSnapshot.product_id, func.max(StockSnapshot.movement_id).label("movement_id")
+    ).where(StockSnapshot.product_id.in_(product_ids)).group_by(StockSnapshot.product_id).subquery()
+    return select(StockSnapshot.product_id, StockSnapshot.movement_id, StockSnapshot.amount).join(
+        latest, and_(StockSnapshot.product_id == latest.c.product_id, StockSnapshot.movement_id == latest.c.movement_id)
+    )
+
+def _from_snapshots(db: Session, product_ids: List[int]) -> Dict[int, Position]:
+    """Positions rebuilt from each product's latest snapshot plus all movements after it"""
+    snapshots = _latest_snapshots(product_ids).subquery()
+    positions = {product_id: NO_MOVEMENTS for product_id in product_ids}
+    for product_id, movement_id, amount in db.execute(select(snapshots)):
+        positions[product_id] = Position(movement_id, int(amount), 0)
+    tail = select(
+        StockMovement.product_id, func.sum(StockMovement.amount), func.max(StockMovement.id), func.count(StockMovement.id)
+    ).outerjoin(
+        snapshots, snapshots.c.product_id == StockMovement.product_id
+    ).where(
+        StockMovement.product_id.in_(product_ids),
+        StockMovement.id > func.coalesce(snapshots.c.movement_id, 0)
+    ).group_by(StockMovement.product_id)
+    for product_id, amount, movement_id, count in db.execute(tail):
+        positions[product_id] = Position(movement_id, positions[product_id].amount + int(amount), count)
+    return positions
+
+def _after(db: Session, bases: Dict[int, Position]) -> Dict[int, Position]:
+    """Move known positions forward by the movements appended after them, in one query"""
+    tail = select(
+        StockMovement.product_id, func.sum(StockMovement.amount), func.max(StockMovement.id), func.count(StockMovement.id)
+    ).where(
+        or_(*(and_(StockMovement.product_id == product_id, StockMovement.id > position.movement_id)
+              for product_id, position in bases.items()))
+    ).group_by(StockMovement.product_id)
+    positions = dict(bases)
+    for product_id, amount, movement_id, count in db.execute(tail):
+        position = bases[product_id]
+        positions[product_id] = Position(movement_id, position.amount + int(amount), position.tail + count)
+    return positions
+
+def read_positions(db: Session, product_ids: Iterable[int]) -> Dict[int, Position]:
+    """Current position of each product: cached position (or latest snapshot) plus the movements after it"""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    if len(product_ids) > CACHED_TAIL_LIMIT:
+        positions = {}
+        for start in range(0, len(product_ids), CHUNK):
+            positions.update(_from_snapshots(db, product_ids[start:start + CHUNK]))
+        return positions
+
+    bases, missing = stock_cache.lookup(product_ids)
+    if missing:
+        bases.update({product_id: NO_MOVEMENTS for product_id in missing})
+        for product_id, movement_id, amount in db.execute(_latest_snapshots(missing)):
+            bases[product_id] = Position(movement_id, int(amount), 0)
+    return _after(db, bases)
+
+def append_movements(db: Session, movements: List[dict], positions: Dict[int, Position]) -> Dict[int, Position]:
+    """Insert movements in order and snapshot the products whose tail got long.
+
+    ``movements`` are StockMovement dicts (product_id, kind, amount, created_at,
+    optionally meal_serving_id, user_id, note) and ``positions`` the positions
+    of their products, read under the row locks. Returns the new positions,
+    which the caller hands to stock_cache.store after commit.
+    """
+    if not movements:
+        return {}
+    # Unordered RETURNING keeps the insert batched on every driver; only each product's last id matters
+    inserted = db.execute(
+        insert(StockMovement).returning(StockMovement.product_id, StockMovement.id), movements
+    ).all()
+    last_ids, counts = {}, {}
+    for product_id, movement_id in inserted:
+        last_ids[product_id] = max(movement_id, last_ids.get(product_id, 0))
+        counts[product_id] = counts.get(product_id, 0) + 1
+    amounts, taken_at = {}, {}
+    for movement in movements:
+        product_id = movement["product_id"]
+        amounts[product_id] = amounts.get(product_id, 0) + movement["amount"]
+        taken_at[product_id] = movement["created_at"]
+    moved = {}
+    for product_id, movement_id in last_ids.items():
+        position = positions.get(product_id, NO_MOVEMENTS)
+        moved[product_id] = Position(movement_id, position.amount + amounts[product_id], position.tail + counts[product_id])
+
+    due = [product_id for product_id, position in moved.items() if position.tail >= STOCK_SNAPSHOT_EVERY]
+    if due:
+        db.execute(insert(StockSnapshot), [
+            {
+                "product_id": product_id,
+                "movement_id": moved[product_id].movement_id,
+                "amount": moved[product_id].amount,
+                "taken_at": taken_at[product_id]
+            }
+            for product_id in due
+        ])
+        for product_id in due:
+            moved[product_id] = moved[product_id]._replace(tail=0)
+    return moved
+
+def _openings(products: Dict[int, tuple], positions: Dict[int, Position], user_id: Optional[int] = None) -> List[dict]:
+    now = datetime.now()
+    return [
+        {
+            "product_id": product_id,
+            "kind": "opening",
+            "amount": to_fixed(products[product_id][0] or 0, products[product_id][1]),
+            "user_id": user_id,
+            "created_at": now
+        }
+        for product_id in sorted(products) if positions[product_id].movement_id == 0
+    ]
+
+def locked_positions(db: Session, products: Dict[int, tuple], user_id: Optional[int] = None) -> Dict[int, Position]:
+    """Positions of products the caller holds row locks on, given {product_id: (quantity, unit)}.
+
+    A product without any movement yet (inserted directly, or from before the
+    ledger) gets an opening movement of its current quantity first.
+    """
+    positions = read_positions(db, products.keys())
+    openings = _openings(products, positions, user_id)
+    if openings:
+        positions.update(append_movements(db, openings, positions))
+    return positions
+
+def stock_as_of(db: Session, at: datetime, product_ids: Optional[Iterable[int]] = None) -> List[dict]:
+    """Stock of every existing product (or the given ones) as it was at ``at``, in each product's current unit"""
+    latest = select(
+        StockSnapshot.product_id, func.max(StockSnapshot.movement_id).label("movement_id")
+    ).where(StockSnapshot.taken_at <= at).group_by(StockSnapshot.product_id)
+    tail = select(
+        StockMovement.product_id, func.sum(StockMovement.amount).label("amount"), func.max(StockMovement.id).label("movement_id")
+    ).where(StockMovement.created_at <= at)
+    products = select(Product.id, Product.name, Product.unit).order_by(Product.id)
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        latest = latest.where(StockSnapshot.product_id.in_(product_ids))
+        tail = tail.where(StockMovement.product_id.in_(product_ids))
+        products = products.where(Product.id.in_(product_ids))
+    latest = latest.subquery()
+    snapshots = select(StockSnapshot.product_id, StockSnapshot.movement_id, StockSnapshot.amount).join(
+        latest, and_(StockSnapshot.product_id == latest.c.product_id, StockSnapshot.movement_id == latest.c.movement_id)
+    ).subquery()
+    tail = tail.outerjoin(
+        snapshots, snapshots.c.product_id == StockMovement.product_id
+    ).where(
+        StockMovement.id > func.coalesce(snapshots.c.movement_id, 0)
+    ).group_by(StockMovement.product_id)
+
+    positions = {product_id: (movement_id, int(amount)) for product_id, movement_id, amount in db.execute(select(snapshots))}
+    for product_id, amount, movement_id in db.execute(tail):
+        base = positions.get(product_id, (0, 0))[1]
+        positions[product_id] = (movement_id, base + int(amount))
+    levels = []
+    for product_id, name, unit in db.execute(products):
+        movement_id, amount = positions.get(product_id, (None, 0))
+        levels.append({
+            "product_id": product_id,
+            "product_name": name,
+            "unit": unit,
+            "quantity": from_fixed(amount, unit),
+            "last_movement_id": movement_id
+        })
+    return levels
+
+def open_missing_products(db: Session) -> int:
+    """Opening movements for products that have none (first start with the ledger, or rows inserted directly).
+
+    Like every other writer of openings it holds the product row locks and
+    checks the ledger again under them, so a serving, or another process
+    running this, can't open the same product twice.
+    """
+    candidates = db.execute(
+        select(Product.id).where(~exists().where(StockMovement.product_id == Product.id)).order_by(Product.id)
+    ).scalars().all()
+    opened = 0
+    for start in range(0, len(candidates), CHUNK):
+        rows = db.execute(
+            select(Product.id, Product.quantity, Product.unit)
+            .where(Product.id.in_(candidates[start:start + CHUNK]))
+            .order_by(Product.id)
+            .with_for_update()
+        ).all()
+        products = {row.id: (row.quantity, row.unit) for row in rows}
+        positions = read_positions(db, products.keys())
+        openings = _openings(products, positions)
+        positions = append_movements(db, openings, positions)
+        db.commit()
+        stock_cache.store(positions)
+        opened += len(openings)
+    return opened
+
+def projection_drift(db: Session) -> List[tuple]:
+    """(product_id, projected quantity, ledger quantity, unit) for products where Product.quantity disagrees with the ledger"""
+    products = db.execute(select(Product.id, Product.quantity, Product.unit).order_by(Product.id)).all()
+    drift = []
+    for start in range(0, len(products), CHUNK):
+        chunk = products[start:start + CHUNK]
+        positions = _from_snapshots(db, [row.id for row in chunk])
+        for row in chunk:
+            amount = positions[row.id].amount
+            if positions[row.id].movement_id and to_fixed(row.quantity or 0, row.unit) != amount:
+                drift.append((row.id, row.quantity, from_fixed(amount, row.unit), row.unit))
+    return drift
+
+def snapshot_all(db: Session) -> int:
+    """Snapshot every product that has movements since its last snapshot"""
+    product_ids = db.execute(select(Product.id)).scalars().all()
+    taken = 0
+    for start in range(0, len(product_ids), CHUNK):
+        positions = _from_snapshots(db, product_ids[start:start + CHUNK])
+        due = [(product_id, position) for product_id, position in positions.items() if position.tail > 0]
+        if due:
+            taken_at = dict(db.execute(
+                select(StockMovement.id, StockMovement.created_at)
+                .where(StockMovement.id.in_([position.movement_id for _, position in due]))
+            ).all())
+            db.execute(insert(StockSnapshot), [
+                {
+                    "product_id": product_id,
+                    "movement_id": position.movement_id,
+                    "amount": position.amount,
+                    "taken_at": taken_at[position.movement_id]
+                }
+                for product_id, position in due
+            ])
+            taken += len(due)
+    db.commit()
+    return taken
+
+def main():
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+
+    parser = argparse.ArgumentParser(prog="python -m app.ledger", description="Maintain the stock ledger")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    check_parser = subcommands.add_parser("check", help="compare Product.quantity with the ledger")
+    check_parser.add_argument("--fix", action="store_true", help="record correction movements for the differences")
+    subcommands.add_parser("snapshot", help="snapshot every product with movements since its last snapshot")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        opened = open_missing_products(db)
+        if opened:
+            print(f"Opened {opened} products")
+        if args.command == "snapshot":
+            print(f"Took {snapshot_all(db)} snapshots")
+            return
+        drift = projection_drift(db)
+        for product_id, projected, ledger, unit in drift:
+            print(f"product {product_id}: quantity {projected} {unit}, ledger {ledger} {unit}")
+        print(f"{len(drift)} products differ from the ledger")
+        if drift and args.fix:
+            # The projection is what people saw and counted, so the ledger is brought in line with it
+            from app.stock import lock_products
+            stock = lock_products(db, [product_id for product_id, _, _, _ in drift])
+            projected = dict(db.execute(
+                select(Product.id, Product.quantity).where(Product.id.in_(list(stock)))
+            ).all())
+            now = datetime.now()
+            positions = append_movements(db, [
+                {
+                    "product_id": product_id,
+                    "kind": "correction",
+                    "amount": to_fixed(projected[product_id] or 0, product["unit"]) - product["position"].amount,
+                    "note": "ledger check",
+                    "created_at": now
+                }
+                for product_id, product in stock.items()
+            ], {product_id: product["position"] for product_id, product in stock.items()})
+            db.commit()
+            stock_cache.store(positions)
+            print(f"Recorded {len(positions)} corrections")
+
+if __name__ == "__main__":
+    main()
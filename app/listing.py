@@ -0,0 +1,115 @@
+"""Search, sort and keyset pagination for the product and user listings.
+
+Pages are read by seeking past the last (sort key, id) pair instead of with
+OFFSET, so page 200 costs the same as page 1. The next-page cursor goes out
+in X-Next-Cursor, and X-Total-Count is only counted for the first page;
+later pages reuse the total the client already has.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import DateTime, and_, func, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+@dataclass(frozen=True)
+class SortKey:
+    column: object
+    parse: Callable
+    nullable: bool = False
+
+def name_search(column, q: str, match: str, dialect: str):
+    """Case-insensitive prefix or substring match, shaped so the search indexes can serve it"""
+    lowered, needle = func.lower(column), func.lower(q)
+    if match == "prefix" and dialect == "sqlite":
+        # SQLite uses the lower(column) index for a range, not for LIKE on an expression
+        return and_(lowered >= needle, lowered < needle.concat("\U0010ffff"))
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"{escaped}%" if match == "prefix" else f"%{escaped}%"
+    return lowered.like(func.lower(pattern), escape="\\")
+
+# SQLite keeps DateTime as text: server_default=func.now() writes no fraction, bound datetimes six digits
+SQLITE_DATETIME = "%Y-%m-%d %H:%M:%f"
+
+def _comparable(expression, column, dialect: str):
+    """``expression`` in a form that sorts and compares the same way on both sides of a cursor"""
+    if dialect == "sqlite" and isinstance(column.type, DateTime):
+        return func.strftime(SQLITE_DATETIME, expression)
+    return expression
+
+def _cursor_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, _cursor_value(value), row_id]).encode()).decode()
+
+def decode_cursor(cursor: str, sort: str, key: SortKey):
+    try:
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_sort != sort:
+            raise ValueError("cursor belongs to another sort order")
+        return (None if value is None else key.parse(value)), int(row_id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_sort(sort: str, keys: Dict[str, SortKey]):
+    """``name`` or ``-name`` -> (SortKey, descending)"""
+    field = sort.lstrip("-")
+    if field not in keys:
+        raise HTTPException(status_code=400, detail=f"Unknown sort key, use one of: {', '.join(sorted(keys))}")
+    return keys[field], sort.startswith("-")
+
+def _after(key: SortKey, id_column, value, row_id: int, descending: bool, dialect: str):
+    """Rows after (value, row_id) in the page order; NULL keys always come last"""
+    column = key.column
+    if value is None:
+        return and_(column.is_(None), id_column < row_id if descending else id_column > row_id)
+    pair = tuple_(_comparable(column, column, dialect), id_column)
+    bound = tuple_(_comparable(value, column, dialect), row_id)
+    after = pair < bound if descending else pair > bound
+    return or_(after, column.is_(None)) if key.nullable else after
+
+def paginate(
+    db: Session,
+    response: Response,
+    stmt,
+    id_column,
+    sort: str,
+    keys: Dict[str, SortKey],
+    cursor: Optional[str],
+    limit: Optional[int]
+) -> list:
+    """Run one page of ``stmt`` (a select of one entity) and set X-Total-Count / X-Next-Cursor.
+
+    Without ``limit`` every matching row is returned in one response.
+    """
+    key, descending = parse_sort(sort, keys)
+    dialect = db.get_bind().dialect.name
+    if limit is None:
+        cursor = None
+    elif cursor is None:
+        total = db.execute(select(func.count()).select_from(stmt.order_by(None).subquery())).scalar_one()
+        response.headers["X-Total-Count"] = str(total)
+    else:
+        stmt = stmt.where(_after(key, id_column, *decode_cursor(cursor, sort, key), descending, dialect))
+
+    column = _comparable(key.column, key.column, dialect)
+    ordering = (column.desc(), id_column.desc()) if descending else (column.asc(), id_column.asc())
+    if key.nullable:
+        ordering = (ordering[0].nulls_last(), ordering[1])
+    stmt = stmt.add_columns(key.column.label("sort_value")).order_by(*ordering)
+    rows = db.execute(stmt if limit is None else stmt.limit(limit + 1)).all()
+    if limit is None:
+        response.headers["X-Total-Count"] = str(len(rows))
+    elif len(rows) > limit:
+        rows = rows[:limit]
+        last, value = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(sort, value, last.id)
+    return [row[0] for row in rows]
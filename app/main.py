@@ -1,17 +1,38 @@
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
+from anyio import to_thread
 import os
+from typing import Optional
 
-from app.routers import products, meals, servings, reports, auth, users
-from app.database import engine, Base
-from app.auth import get_current_user
+from app.routers import products, meals, servings, reports, auth, users, events
+from app.database import engine, Base, SessionLocal, DB_THREADPOOL_SIZE, ensure_indexes, pool_metrics, startup_lock
+from app.auth import get_current_user, require_metrics_access
+from app.catalog import ensure_catalog_versions
+from app.ledger import open_missing_products
+from app.models import User
+from app.metrics import MetricsMiddleware, instrument_queries, request_metrics
+from app.rollups import backfill_if_empty
+from app.serialization import FastJSONResponse
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+instrument_queries(engine)
 
-app = FastAPI(title="Kindergarten Management System", version="1.0.0")
+# Create tables and backfill, one worker at a time
+with startup_lock(engine):
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes(engine)
+    with SessionLocal() as db:
+        ensure_catalog_versions(db)
+        backfill_if_empty(db)
+        open_missing_products(db)
+
+app = FastAPI(title="Kindergarten Management System", version="1.0.0", default_response_class=FastJSONResponse)
+
+@app.on_event("startup")
+async def configure_threadpool():
+    # Sync (def) route handlers and dependencies run in this pool, keep the event loop free
+    to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
 
 # CORS middleware
 app.add_middleware(
@@ -21,6 +42,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so it times everything the other middleware does too
+app.add_middleware(MetricsMiddleware)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -32,6 +55,7 @@ app.include_router(products.router, prefix="/api/products", tags=["Products"])
 app.include_router(meals.router, prefix="/api/meals", tags=["Meals"])
 app.include_router(servings.router, prefix="/api/servings", tags=["Servings"])
 app.include_router(reports.router, prefix="/api/reports", tags=["Reports"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
 
 @app.get("/")
 async def read_root():
@@ -41,6 +65,14 @@ async def read_root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics(current_user: Optional[User] = Depends(require_metrics_access)):
+    return PlainTextResponse(request_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/pool")
+async def pool_health(current_user: Optional[User] = Depends(require_metrics_access)):
+    return pool_metrics.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,210 @@
+"""Per-request latency and SQL metrics, exported in the Prometheus text format at /metrics.
+
+MetricsMiddleware times every request and labels it with its route template
+(``/api/meals/{meal_id}``, not the URL). Engine hooks on before/after
+cursor_execute add each statement's count and time to the request that ran
+it, found through a context variable; FastAPI copies the context into the
+worker thread of a sync handler, so the hooks see the request there too.
+A request that runs more statements than REQUEST_QUERY_BUDGET is logged with
+the statement it repeated most, which is how an N+1 loop shows up.
+The page includes the connection pool gauges, so like /health/pool it needs
+METRICS_TOKEN or an admin's token.
+"""
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from app.database import pool_metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements one request may run before it's logged; 0 turns the check off
+REQUEST_QUERY_BUDGET = int(os.getenv("REQUEST_QUERY_BUDGET", "20"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500)
+
+class RequestQueries:
+    """Statements run on behalf of one request"""
+    __slots__ = ("count", "seconds", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+
+    def lines(self, name: str, labels: str) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+class RouteStats:
+    __slots__ = ("latency", "queries", "db_seconds", "over_budget")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = Histogram(LATENCY_BUCKETS)
+        self.over_budget = 0
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _statement(statement: str) -> str:
+    return " ".join(statement.split())[:500]
+
+class RequestMetrics:
+    """Counters fed by MetricsMiddleware and the engine's cursor events"""
+
+    def __init__(self, query_budget: int = REQUEST_QUERY_BUDGET):
+        self._lock = threading.Lock()
+        self.query_budget = query_budget
+        self.routes = {}
+        self.responses = Counter()
+        self.in_progress = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # A connection runs one statement at a time; one that failed just leaves its start to be overwritten
+        conn.info["query_start"] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"]
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += elapsed
+        request = _current.get()
+        # Statements outside a request (startup, background refreshes) only count in the totals
+        if request is not None:
+            request.count += 1
+            request.seconds += elapsed
+            request.statements[statement] += 1
+
+    def start(self) -> RequestQueries:
+        with self._lock:
+            self.in_progress += 1
+        return RequestQueries()
+
+    def finish(self, method: str, route: str, status: int, seconds: float, queries: RequestQueries):
+        over_budget = 0 < self.query_budget < queries.count
+        with self._lock:
+            self.in_progress -= 1
+            stats = self.routes.get((method, route))
+            if stats is None:
+                stats = self.routes[(method, route)] = RouteStats()
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries.count)
+            stats.db_seconds.observe(queries.seconds)
+            stats.over_budget += over_budget
+            self.responses[(method, route, status)] += 1
+        if over_budget:
+            statement, repeats = queries.statements.most_common(1)[0]
+            logger.warning(
+                "%s %s ran %d queries (budget %d) in %.1f ms, %.1f ms in the database; most repeated (%dx): %s",
+                method, route, queries.count, self.query_budget, seconds * 1000, queries.seconds * 1000,
+                repeats, _statement(statement)
+            )
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        with self._lock:
+            routes = sorted(self.routes.items())
+            lines = [
+                "# HELP http_requests_total Requests by route and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{_label(route)}",status="{status}"}} {count}')
+            lines += ["# HELP http_requests_in_progress Requests being handled.", "# TYPE http_requests_in_progress gauge",
+                      f"http_requests_in_progress {self.in_progress}"]
+            for name, kind, help_text, value in (
+                ("http_request_duration_seconds", "histogram", "Request latency.", lambda stats: stats.latency),
+                ("http_request_db_queries", "histogram", "SQL statements per request.", lambda stats: stats.queries),
+                ("http_request_db_seconds", "histogram", "Time per request spent in SQL statements.", lambda stats: stats.db_seconds),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for (method, route), stats in routes:
+                    lines += value(stats).lines(name, f'method="{method}",route="{_label(route)}"')
+            lines += [
+                "# HELP http_requests_over_query_budget_total Requests that ran more statements than the query budget.",
+                "# TYPE http_requests_over_query_budget_total counter",
+            ]
+            for (method, route), stats in routes:
+                lines.append(f'http_requests_over_query_budget_total{{method="{method}",route="{_label(route)}"}} {stats.over_budget}')
+            lines += [
+                "# HELP db_queries_total SQL statements run, in requests or not.", "# TYPE db_queries_total counter",
+                f"db_queries_total {self.queries}",
+                "# HELP db_query_seconds_total Time spent in SQL statements.", "# TYPE db_query_seconds_total counter",
+                f"db_query_seconds_total {self.query_seconds:.6f}",
+            ]
+        for key, value in pool_metrics.snapshot().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = "db_pool_" + key.removeprefix("pool_")
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+request_metrics = RequestMetrics()
+
+def instrument_queries(bind, metrics: RequestMetrics = request_metrics):
+    event.listen(bind, "before_cursor_execute", metrics.before_cursor_execute)
+    event.listen(bind, "after_cursor_execute", metrics.after_cursor_execute)
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request and collecting the statements it runs"""
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        queries = self.metrics.start()
+        token = _current.set(queries)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            _current.reset(token)
+            # The router stores the matched APIRoute in the scope; anything else (static files, 404s) shares one label
+            route = scope.get("route")
+            self.metrics.finish(scope["method"], getattr(route, "path", "other"), status, time.perf_counter() - start, queries)
@@ -1,8 +1,20 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, DECIMAL, Numeric
+from sqlalchemy import BigInteger, Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Text, DECIMAL, Numeric, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
+def search_indexes(table: str, name: str, column):
+    """lower(column) btree for sorting and prefix ranges, plus a trigram index for substring search on Postgres"""
+    return (
+        Index(f"ix_{table}_{name}_lower", func.lower(column)),
+        Index(
+            f"ix_{table}_{name}_trgm",
+            func.lower(column).label("lowered"),
+            postgresql_using="gin",
+            postgresql_ops={"lowered": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
+
 class User(Base):
     __tablename__ = "users"
     
@@ -14,6 +26,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, server_default=func.now())
     
+    __table_args__ = search_indexes("users", "username", username)
+    
     meal_servings = relationship("MealServing", back_populates="user")
 
 class Product(Base):
@@ -24,10 +38,12 @@ class Product(Base):
     quantity = Column(Numeric(10, 3), default=0)
     unit = Column(String(20), default="g")
     minimum_quantity = Column(Numeric(10, 3), default=100)
-    delivery_date = Column(Date)
+    delivery_date = Column(Date, index=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
+    __table_args__ = search_indexes("products", "name", name)
+    
     meal_ingredients = relationship("MealIngredient", back_populates="product")
     usage_logs = relationship("ProductUsageLog", back_populates="product")
 
@@ -48,8 +64,8 @@ class MealIngredient(Base):
     __tablename__ = "meal_ingredients"
     
     id = Column(Integer, primary_key=True, index=True)
-    meal_id = Column(Integer, ForeignKey("meals.id"))
-    product_id = Column(Integer, ForeignKey("products.id"))
+    meal_id = Column(Integer, ForeignKey("meals.id"), index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     quantity = Column(Numeric(10, 3))
     unit = Column(String(20), default="g")
     
@@ -58,6 +74,12 @@ class MealIngredient(Base):
 
 class MealServing(Base):
     __tablename__ = "meal_servings"
+    # History is listed newest first and paged by (served_at, id), optionally per meal or per user
+    __table_args__ = (
+        Index("ix_meal_servings_served_at_id", "served_at", "id"),
+        Index("ix_meal_servings_meal_id_served_at_id", "meal_id", "served_at", "id"),
+        Index("ix_meal_servings_user_id_served_at_id", "user_id", "served_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     meal_id = Column(Integer, ForeignKey("meals.id"))
@@ -72,13 +94,16 @@ class MealServing(Base):
 
 class ProductUsageLog(Base):
     __tablename__ = "product_usage_log"
+    __table_args__ = (
+        Index("ix_product_usage_log_product_id_used_at", "product_id", "used_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"))
-    meal_serving_id = Column(Integer, ForeignKey("meal_servings.id"))
+    meal_serving_id = Column(Integer, ForeignKey("meal_servings.id"), index=True)
     quantity_used = Column(Numeric(10, 3))
     unit = Column(String(20), default="g")
-    used_at = Column(DateTime, server_default=func.now())
+    used_at = Column(DateTime, server_default=func.now(), index=True)
     
     product = relationship("Product", back_populates="usage_logs")
     meal_serving = relationship("MealServing", back_populates="usage_logs")
@@ -94,3 +119,64 @@ class MonthlyReport(Base):
     efficiency_percentage = Column(DECIMAL(5,2))
     is_suspicious = Column(Boolean, default=False)
     created_at = Column(DateTime, server_default=func.now())
+
+# Daily rollups, maintained in the same transaction as each serving.
+# No foreign keys: deleting a meal or product must not touch its history.
+class DailyMealRollup(Base):
+    __tablename__ = "daily_meal_rollups"
+    __table_args__ = (UniqueConstraint("day", "meal_id", name="uq_daily_meal_rollups_day_meal"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    meal_id = Column(Integer, nullable=False)
+    servings_count = Column(Integer, default=0)
+    portions_served = Column(Integer, default=0)
+
+class DailyProductUsageRollup(Base):
+    __tablename__ = "daily_product_usage_rollups"
+    __table_args__ = (UniqueConstraint("day", "product_id", "unit", name="uq_daily_product_usage_rollups_day_product_unit"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    product_id = Column(Integer, nullable=False)
+    unit = Column(String(20), nullable=False)
+    quantity_used = Column(Numeric(14, 3), default=0)
+    uses_count = Column(Integer, default=0)
+
+# Stock ledger: every change of a product's stock is appended here, Product.quantity is a projection of it.
+# Amounts are signed integers of thousandths of the product's base unit (see app.units.to_fixed).
+# No foreign keys, for the same reason as the rollups.
+class StockMovement(Base):
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_product_id_id", "product_id", "id"),
+        Index("ix_stock_movements_created_at", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)
+    amount = Column(BigInteger, nullable=False)
+    meal_serving_id = Column(Integer, index=True)
+    user_id = Column(Integer)
+    note = Column(String(200))
+    created_at = Column(DateTime, nullable=False)
+
+# A product's stock after one of its movements, so reading the stock only sums the movements after it
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (UniqueConstraint("product_id", "movement_id", name="uq_stock_snapshots_product_movement"),)
+    
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, nullable=False)
+    movement_id = Column(Integer, nullable=False)
+    amount = Column(BigInteger, nullable=False)
+    taken_at = Column(DateTime, nullable=False)
+
+# One row per cacheable listing, bumped in every transaction that changes it (ETag source)
+class CatalogVersion(Base):
+    __tablename__ = "catalog_versions"
+    
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, server_default=func.now())
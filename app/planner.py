@@ -0,0 +1,179 @@
+"""Menu planning: which meals, and how many portions of each, the current stock allows.
+
+Every meal becomes a vector of what one portion needs per product, in the
+fixed-point units of app.units, so plans never take more than the stock.
+Choosing portion counts is an integer packing problem. It is solved greedily:
+each step adds portions to the meal whose portion uses the smallest share of
+the stock that is left, so meals on scarce products give way to the ones that
+aren't. A portion's cost only ever rises as stock is used, which lets a heap
+keep meals in order while only re-costing the meal at its top. A few ways of
+costing a portion are tried and the largest plan wins.
+"""
+import heapq
+import math
+from typing import Dict, Iterable, Optional
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from app.models import Meal
+from app.portions import get_meal_portions
+from app.units import from_fixed, to_fixed
+
+# Each step takes this share of the portions the chosen meal still allows, so
+# big plans take a few dozen steps rather than one per portion
+STEP_DIVISOR = 4
+
+def requirement_matrix(entries: Dict[int, tuple]):
+    """({meal_id: {product_id: fixed amount per portion}}, {product_id: fixed stock}, {product_id: row})
+    for the meals that can be made at all"""
+    requirements, products = {}, {}
+    for meal_id, (portions, rows) in entries.items():
+        # Any portions at all means every product exists, is in stock and in a compatible unit
+        if portions <= 0:
+            continue
+        needs = {}
+        for row in rows:
+            product_id = row.product_id
+            needs[product_id] = needs.get(product_id, 0) + to_fixed(row.quantity, row.unit)
+            products.setdefault(product_id, row)
+        needs = {product_id: amount for product_id, amount in needs.items() if amount > 0}
+        if needs:
+            requirements[meal_id] = needs
+    stock = {product_id: to_fixed(row.product_quantity, row.product_unit) for product_id, row in products.items()}
+    return requirements, stock, products
+
+# What one more portion of a meal costs, given what each product has left
+# (``remaining``) and had at the start (``stock``). Each is the best choice on
+# some catalogs, so the planner tries all of them and keeps the largest plan.
+COSTS = (
+    # Share of what's left of each product, summed
+    lambda needs, remaining, stock: sum(amount / remaining[product_id] for product_id, amount in needs.items()),
+    # Share of what's left of the scarcest product
+    lambda needs, remaining, stock: max(amount / remaining[product_id] for product_id, amount in needs.items()),
+    # Share of the starting stock, summed
+    lambda needs, remaining, stock: sum(amount / stock[product_id] for product_id, amount in needs.items()),
+)
+
+def greedy(
+    requirements: Dict[int, Dict[int, int]],
+    stock: Dict[int, int],
+    cost,
+    target: Optional[int] = None,
+    max_per_meal: Optional[int] = None,
+    max_meals: Optional[int] = None
+) -> Dict[int, int]:
+    """{meal_id: portions} that fits in ``stock``, adding portions to the cheapest meal by ``cost`` first"""
+    remaining = dict(stock)
+    planned = {}
+    total = 0
+
+    def allowed(meal_id: int) -> int:
+        needs = requirements[meal_id]
+        count = min(remaining[product_id] // amount for product_id, amount in needs.items())
+        if max_per_meal is not None:
+            count = min(count, max_per_meal - planned.get(meal_id, 0))
+        if target is not None:
+            count = min(count, target - total)
+        return count
+
+    heap = [(cost(requirements[meal_id], remaining, stock), meal_id) for meal_id in requirements if allowed(meal_id) > 0]
+    heapq.heapify(heap)
+    while heap and (target is None or total < target):
+        _, meal_id = heapq.heappop(heap)
+        if max_meals is not None and meal_id not in planned and len(planned) >= max_meals:
+            continue
+        count = allowed(meal_id)
+        # Stock only goes down, so a meal that can't be made now never can again
+        if count <= 0:
+            continue
+        needs = requirements[meal_id]
+        current = cost(needs, remaining, stock)
+        if heap and current > heap[0][0]:
+            heapq.heappush(heap, (current, meal_id))
+            continue
+        step = max(1, count // STEP_DIVISOR)
+        for product_id, amount in needs.items():
+            remaining[product_id] -= amount * step
+        planned[meal_id] = planned.get(meal_id, 0) + step
+        total += step
+        if allowed(meal_id) > 0:
+            heapq.heappush(heap, (cost(needs, remaining, stock), meal_id))
+    return planned
+
+def solve(
+    requirements: Dict[int, Dict[int, int]],
+    stock: Dict[int, int],
+    target: Optional[int] = None,
+    max_per_meal: Optional[int] = None,
+    max_meals: Optional[int] = None
+) -> Dict[int, int]:
+    """{meal_id: portions} that fits in ``stock``, with as many portions as possible (at most ``target``)"""
+    best = {}
+    for cost in COSTS:
+        planned = greedy(requirements, stock, cost, target, max_per_meal, max_meals)
+        if sum(planned.values()) > sum(best.values()):
+            best = planned
+        if target is not None and sum(best.values()) >= target:
+            break
+    return best
+
+def plan_menu(
+    db: Session,
+    target: Optional[int] = None,
+    meal_ids: Optional[Iterable[int]] = None,
+    max_per_meal: Optional[int] = None,
+    max_share: Optional[float] = None,
+    max_meals: Optional[int] = None
+) -> dict:
+    """Plan portions of the active meals (or of ``meal_ids``) from current stock.
+
+    Without ``target`` the plan serves as many portions as the stock allows;
+    with it, up to ``target`` portions. ``max_per_meal`` and ``max_share`` (of
+    the target) cap each meal, ``max_meals`` caps how many different meals
+    are cooked.
+    """
+    if max_share is not None:
+        if target is None:
+            raise HTTPException(status_code=400, detail="max_share needs a target")
+        limit = max(1, math.floor(max_share * target))
+        max_per_meal = limit if max_per_meal is None else min(max_per_meal, limit)
+
+    query = db.query(Meal.id, Meal.name).filter(Meal.is_active == True)
+    if meal_ids is not None:
+        query = query.filter(Meal.id.in_(list(meal_ids)))
+    names = dict(query.all())
+    # Cached meals cost nothing, the rest come from one ingredient matrix query
+    requirements, stock, products = requirement_matrix(get_meal_portions(db, names))
+    planned = solve(requirements, stock, target, max_per_meal, max_meals)
+
+    used = {}
+    for meal_id, portions in planned.items():
+        for product_id, amount in requirements[meal_id].items():
+            used[product_id] = used.get(product_id, 0) + amount * portions
+    # A product is limiting when what's left of it can't make another portion of a meal that needs it
+    short = {
+        product_id for meal_id, needs in requirements.items()
+        for product_id, amount in needs.items() if stock[product_id] - used.get(product_id, 0) < amount
+    }
+    total = sum(planned.values())
+    return {
+        "target": target,
+        "total_portions": total,
+        "target_met": target is None or total >= target,
+        "candidate_meals": len(requirements),
+        "meals": sorted(
+            ({"meal_id": meal_id, "meal_name": names[meal_id], "portions": portions} for meal_id, portions in planned.items()),
+            key=lambda meal: (-meal["portions"], meal["meal_id"])
+        ),
+        "products": [
+            {
+                "product_id": product_id,
+                "product_name": products[product_id].product_name,
+                "unit": products[product_id].product_unit,
+                "available": float(from_fixed(stock[product_id], products[product_id].product_unit)),
+                "used": float(from_fixed(amount, products[product_id].product_unit)),
+                "remaining": float(from_fixed(stock[product_id] - amount, products[product_id].product_unit)),
+                "limiting": product_id in short
+            }
+            for product_id, amount in sorted(used.items())
+        ]
+    }
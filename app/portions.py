@@ -0,0 +1,212 @@
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.catalog import MEALS, PRODUCTS, catalog_versions
+from app.models import Meal, MealIngredient, Product
+from app.units import max_portions
+
+def load_ingredient_matrix(
+    db: Session,
+    meal_ids: Optional[Iterable[int]] = None,
+    active_only: bool = False
+) -> Dict[int, list]:
+    """Load meal -> ingredient -> product rows in a single query, grouped by meal id"""
+    stmt = select(
+        MealIngredient.meal_id,
+        MealIngredient.id,
+        MealIngredient.product_id,
+        MealIngredient.quantity,
+        MealIngredient.unit,
+        Product.id.label("stock_product_id"),
+        Product.name.label("product_name"),
+        Product.quantity.label("product_quantity"),
+        Product.unit.label("product_unit"),
+    ).outerjoin(
+        Product, Product.id == MealIngredient.product_id
+    ).order_by(MealIngredient.meal_id, MealIngredient.id)
+
+    if meal_ids is not None:
+        stmt = stmt.where(MealIngredient.meal_id.in_(list(meal_ids)))
+    if active_only:
+        stmt = stmt.join(Meal, Meal.id == MealIngredient.meal_id).where(Meal.is_active == True)
+
+    matrix = defaultdict(list)
+    for row in db.execute(stmt):
+        matrix[row.meal_id].append(row)
+    return matrix
+
+def portions_from_rows(rows: list) -> int:
+    """Calculate how many portions can be made from one meal's ingredient rows"""
+    # A missing product has no quantity, which max_portions treats as empty stock
+    return max_portions(
+        (row.product_quantity if row.stock_product_id is not None else None, row.product_unit, row.quantity, row.unit)
+        for row in rows
+    )
+
+def compute_possible_portions(matrix: Dict[int, list], meal_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Compute possible_portions for every meal of the matrix in one pass"""
+    if meal_ids is None:
+        meal_ids = matrix.keys()
+    return {meal_id: portions_from_rows(matrix.get(meal_id, [])) for meal_id in meal_ids}
+
+def ingredient_dicts(rows: list, unknown_name: str = "Unknown") -> List[dict]:
+    """Build the MealIngredientResponse dicts from matrix rows"""
+    return [
+        {
+            "id": row.id,
+            "product_id": row.product_id if row.product_id is not None else -1,
+            "quantity": float(row.quantity),
+            "unit": row.unit,
+            "product_name": row.product_name if row.stock_product_id is not None else unknown_name
+        }
+        for row in rows
+    ]
+
+class PortionCache:
+    """Bounded LRU cache of per-meal ingredient rows and possible_portions.
+
+    A product -> meals reverse index lets stock and recipe writes refresh only
+    the meals that use the changed products. The cache is per process, so it
+    is also labelled with the product and meal listing versions (app.catalog)
+    it was filled at: every lookup reads them first, and a write made by any
+    worker empties it. Set PORTION_CACHE_ENABLED=0 to turn it off.
+    """
+
+    def __init__(self, max_size: int = 1000, enabled: bool = True):
+        self.max_size = max_size
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+        self._versions = None
+        self._entries = OrderedDict()
+        self._product_meals = defaultdict(set)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def sync(self, versions: tuple):
+        """Empty the cache if the listings changed since it was filled (read ``versions`` before any rows)"""
+        with self._lock:
+            if versions != self._versions:
+                self._generation += 1
+                self._entries.clear()
+                self._product_meals.clear()
+                self._versions = versions
+                self.resets += 1
+
+    def lookup(self, meal_ids: Iterable[int]) -> Tuple[Dict[int, tuple], List[int]]:
+        """Return ({meal_id: (portions, rows)}, missing_meal_ids)"""
+        found, missing = {}, []
+        with self._lock:
+            for meal_id in meal_ids:
+                entry = self._entries.get(meal_id) if self.enabled else None
+                if entry is None:
+                    missing.append(meal_id)
+                else:
+                    self._entries.move_to_end(meal_id)
+                    found[meal_id] = entry
+            if self.enabled:
+                self.hits += len(found)
+                self.misses += len(missing)
+        return found, missing
+
+    def store(self, entries: Dict[int, tuple], generation: int):
+        """Cache freshly computed entries unless an invalidation happened since they were loaded"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            for meal_id, entry in entries.items():
+                self._drop(meal_id)
+                self._entries[meal_id] = entry
+                for row in entry[1]:
+                    self._product_meals[row.product_id].add(meal_id)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_products(self, product_ids: Iterable[int]) -> Set[int]:
+        """Drop every cached meal that uses one of the products, return their ids"""
+        with self._lock:
+            self._generation += 1
+            affected = set()
+            for product_id in product_ids:
+                affected |= self._product_meals.get(product_id, set())
+            for meal_id in affected:
+                self._drop(meal_id)
+        return affected
+
+    def invalidate_meals(self, meal_ids: Iterable[int]):
+        with self._lock:
+            self._generation += 1
+            for meal_id in meal_ids:
+                self._drop(meal_id)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._product_meals.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "resets": self.resets
+            }
+
+    def _drop(self, meal_id: int):
+        entry = self._entries.pop(meal_id, None)
+        if entry is None:
+            return
+        for row in entry[1]:
+            meals = self._product_meals.get(row.product_id)
+            if meals is not None:
+                meals.discard(meal_id)
+                if not meals:
+                    del self._product_meals[row.product_id]
+
+portion_cache = PortionCache(
+    max_size=int(os.getenv("PORTION_CACHE_SIZE", "1000")),
+    enabled=os.getenv("PORTION_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+)
+
+def get_meal_portions(db: Session, meal_ids: Iterable[int]) -> Dict[int, tuple]:
+    """Return {meal_id: (possible_portions, ingredient_rows)}, served from the cache where possible"""
+    meal_ids = list(meal_ids)
+    if portion_cache.enabled:
+        versions = catalog_versions(db, PRODUCTS, MEALS)
+        portion_cache.sync((versions[PRODUCTS][0], versions[MEALS][0]))
+    found, missing = portion_cache.lookup(meal_ids)
+    if missing:
+        generation = portion_cache.generation
+        matrix = load_ingredient_matrix(db, meal_ids=missing)
+        loaded = {meal_id: (portions_from_rows(matrix.get(meal_id, [])), matrix.get(meal_id, [])) for meal_id in missing}
+        portion_cache.store(loaded, generation)
+        found.update(loaded)
+    return found
+
+def refresh_products(db: Session, product_ids: Iterable[int]):
+    """Recompute the cached meals that use any of the given products (call after commit)"""
+    affected = portion_cache.invalidate_products(product_ids)
+    if affected:
+        get_meal_portions(db, affected)
+
+def refresh_meals(db: Session, meal_ids: Iterable[int]):
+    """Recompute the given meals after a recipe change (call after commit)"""
+    meal_ids = list(meal_ids)
+    portion_cache.invalidate_meals(meal_ids)
+    get_meal_portions(db, meal_ids)
@@ -0,0 +1,134 @@
+"""Daily rollups of servings and product usage.
+
+Reports read these small per-day tables instead of scanning meal_servings and
+product_usage_log. serve/serve_batch update them in the serving transaction;
+``python -m app.rollups rebuild`` backfills them from the raw history.
+"""
+import argparse
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import DailyMealRollup, DailyProductUsageRollup, MealServing, ProductUsageLog
+
+def _upsert_add(db: Session, model, rows: list, keys: tuple, counters: tuple):
+    """Insert rows, or add their counters to the existing row with the same keys"""
+    if not rows:
+        return
+    upsert = dialect_insert(db)
+    if upsert is not None:
+        stmt = upsert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters}
+        )
+        db.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = db.execute(
+            update(model)
+            .where(*[getattr(model, key) == row[key] for key in keys])
+            .values({name: getattr(model, name) + row[name] for name in counters})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(model), [row])
+
+def record_servings(db: Session, servings: Iterable[dict]):
+    """Add servings ({meal_id, portions_served, served_at}) to the daily meal rollup"""
+    totals = defaultdict(lambda: [0, 0])
+    for serving in servings:
+        if serving["meal_id"] is None:
+            continue
+        key = (serving["served_at"].date(), serving["meal_id"])
+        totals[key][0] += 1
+        totals[key][1] += serving["portions_served"]
+    _upsert_add(
+        db, DailyMealRollup,
+        [
+            {"day": day, "meal_id": meal_id, "servings_count": count, "portions_served": portions}
+            for (day, meal_id), (count, portions) in totals.items()
+        ],
+        keys=("day", "meal_id"),
+        counters=("servings_count", "portions_served")
+    )
+
+def record_usage(db: Session, logs: Iterable[dict]):
+    """Add usage log rows ({product_id, quantity_used, unit, used_at}) to the daily product rollup"""
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for log in logs:
+        key = (log["used_at"].date(), log["product_id"], log["unit"])
+        totals[key][0] += Decimal(log["quantity_used"])
+        totals[key][1] += 1
+    _upsert_add(
+        db, DailyProductUsageRollup,
+        [
+            {"day": day, "product_id": product_id, "unit": unit, "quantity_used": quantity, "uses_count": count}
+            for (day, product_id, unit), (quantity, count) in totals.items()
+        ],
+        keys=("day", "product_id", "unit"),
+        counters=("quantity_used", "uses_count")
+    )
+
+def rebuild(db: Session, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Recompute both rollups from meal_servings and product_usage_log for a date range (inclusive)"""
+    served_day = func.date(MealServing.served_at)
+    used_day = func.date(ProductUsageLog.used_at)
+
+    servings = select(
+        served_day, MealServing.meal_id, func.count(MealServing.id), func.coalesce(func.sum(MealServing.portions_served), 0)
+    ).where(MealServing.meal_id.isnot(None)).group_by(served_day, MealServing.meal_id)
+    usage = select(
+        used_day, ProductUsageLog.product_id, func.coalesce(ProductUsageLog.unit, "g"),
+        func.sum(ProductUsageLog.quantity_used), func.count(ProductUsageLog.id)
+    ).where(ProductUsageLog.product_id.isnot(None)).group_by(used_day, ProductUsageLog.product_id, func.coalesce(ProductUsageLog.unit, "g"))
+
+    clear_meals = delete(DailyMealRollup)
+    clear_usage = delete(DailyProductUsageRollup)
+    if date_from is not None:
+        start = datetime.combine(date_from, time.min)
+        servings = servings.where(MealServing.served_at >= start)
+        usage = usage.where(ProductUsageLog.used_at >= start)
+        clear_meals = clear_meals.where(DailyMealRollup.day >= date_from)
+        clear_usage = clear_usage.where(DailyProductUsageRollup.day >= date_from)
+    if date_to is not None:
+        end = datetime.combine(date_to + timedelta(days=1), time.min)
+        servings = servings.where(MealServing.served_at < end)
+        usage = usage.where(ProductUsageLog.used_at < end)
+        clear_meals = clear_meals.where(DailyMealRollup.day <= date_to)
+        clear_usage = clear_usage.where(DailyProductUsageRollup.day <= date_to)
+
+    db.execute(clear_meals)
+    db.execute(clear_usage)
+    db.execute(insert(DailyMealRollup).from_select(["day", "meal_id", "servings_count", "portions_served"], servings))
+    db.execute(insert(DailyProductUsageRollup).from_select(["day", "product_id", "unit", "quantity_used", "uses_count"], usage))
+    db.commit()
+
+def backfill_if_empty(db: Session):
+    """Build the rollups on first start after upgrading, when history exists but rollups don't"""
+    if db.query(DailyMealRollup.id).first() is None and db.query(MealServing.id).first() is not None:
+        rebuild(db)
+
+def main():
+    from app.database import Base, SessionLocal, engine
+
+    Base.metadata.create_all(bind=engine)
+
+    parser = argparse.ArgumentParser(prog="python -m app.rollups", description="Maintain the daily report rollups")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subcommands.add_parser("rebuild", help="backfill rollups from meal_servings and product_usage_log")
+    rebuild_parser.add_argument("--from", dest="date_from", type=date.fromisoformat, help="first day (YYYY-MM-DD)")
+    rebuild_parser.add_argument("--to", dest="date_to", type=date.fromisoformat, help="last day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        rebuild(db, args.date_from, args.date_to)
+        meals = db.query(func.count(DailyMealRollup.id)).scalar()
+        usage = db.query(func.count(DailyProductUsageRollup.id)).scalar()
+    print(f"Rebuilt rollups: {meals} meal-days, {usage} product-days")
+
+if __name__ == "__main__":
+    main()
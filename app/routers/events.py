@@ -0,0 +1,39 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Query
+from fastapi.responses import StreamingResponse
+from app.database import SessionLocal
+from app.models import User
+from app.auth import STREAM_TICKET_AUDIENCE, STREAM_TICKET_SECONDS, create_stream_ticket, get_current_user, require_role, user_from_token
+from app.events import event_broker
+
+router = APIRouter()
+
+def get_stream_user(ticket: str = Query(..., description="From POST /api/events/ticket")):
+    # EventSource can't send an Authorization header, so a short-lived ticket comes in the query string
+    # instead of the bearer token, which would end up in access and proxy logs.
+    # The session is closed right away rather than held open for the life of the stream.
+    with SessionLocal() as db:
+        return user_from_token(ticket, db, audience=STREAM_TICKET_AUDIENCE)
+
+@router.post("/ticket")
+async def create_ticket(current_user: User = Depends(get_current_user)):
+    """Short-lived ticket for opening the event stream; get a new one for every connection"""
+    return {"ticket": create_stream_ticket(current_user), "expires_in": STREAM_TICKET_SECONDS}
+
+@router.get("/")
+async def stream_events(
+    last_event_id: Optional[str] = Header(None),
+    since: Optional[str] = Query(None, description="Last event id seen, for clients that reconnect by hand"),
+    current_user: User = Depends(get_stream_user)
+):
+    # The browser sends Last-Event-ID itself when it reconnects
+    resume_from = last_event_id or since
+    return StreamingResponse(
+        event_broker.stream(int(resume_from) if resume_from and resume_from.isdigit() else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/stats")
+async def get_event_stats(current_user: User = Depends(require_role(["admin"]))):
+    return event_broker.stats()
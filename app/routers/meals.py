@@ -1,123 +1,81 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Meal, MealIngredient, Product, User
-from app.schemas import MealCreate, MealUpdate, MealResponse, MealIngredientResponse
+from app.models import Meal, MealIngredient, User
+from app.schemas import MealCreate, MealUpdate, MealResponse, MealIngredientResponse, MenuPlanResponse
 from app.auth import get_current_user, require_role
+from app.catalog import MEALS, PRODUCTS, bump_catalog, not_modified
+from app.events import publish_deleted, publish_meal
+from app.planner import plan_menu
+from app.portions import get_meal_portions, ingredient_dicts, portion_cache, refresh_meals
+from app.serialization import json_response
 
 router = APIRouter()
 
-def convert_to_base_unit(quantity: float, unit: str) -> float:
-    """Convert quantity to base unit (grams for weight, ml for volume)"""
-    conversions = {
-        'g': 1,
-        'kg': 1000,
-        'ml': 1,
-        'l': 1000,
-        'dona': 1,
-        'paket': 1,
-        'quti': 1
-    }
-    return quantity * conversions.get(unit, 1)
-
-def can_make_portions(product_quantity: float, product_unit: str, needed_quantity: float, needed_unit: str) -> int:
-    """Calculate how many portions can be made considering units"""
-    # Convert both to base units for comparison
-    product_base = convert_to_base_unit(product_quantity, product_unit)
-    needed_base = convert_to_base_unit(needed_quantity, needed_unit)
-    
-    # For weight/volume units, we can convert and compare
-    if product_unit in ['g', 'kg'] and needed_unit in ['g', 'kg']:
-        return int(product_base // needed_base) if needed_base > 0 else 0
-    elif product_unit in ['ml', 'l'] and needed_unit in ['ml', 'l']:
-        return int(product_base // needed_base) if needed_base > 0 else 0
-    # For discrete units (dona, paket, quti), units must match
-    elif product_unit == needed_unit and product_unit in ['dona', 'paket', 'quti']:
-        return int(product_quantity // needed_quantity) if needed_quantity > 0 else 0
-    else:
-        # Can't compare different unit types
-        return 0
-
-def calculate_possible_portions(meal: Meal, db: Session) -> int:
-    """Calculate how many portions can be made from available ingredients"""
-    if not meal.ingredients:
-        return 0
-    
-    min_portions = float('inf')
-    for ingredient in meal.ingredients:
-        product = db.query(Product).filter(Product.id == ingredient.product_id).first()
-        if product and product.quantity > 0:
-            possible_portions = can_make_portions(
-                product.quantity, product.unit,
-                ingredient.quantity, ingredient.unit
-            )
-            min_portions = min(min_portions, possible_portions)
-        else:
-            return 0
-    
-    return int(min_portions) if min_portions != float('inf') else 0
-
 @router.get("/", response_model=List[MealResponse])
-async def get_meals(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_meals(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # possible_portions and product names depend on the products too
+    cached = not_modified(request, response, db, MEALS, PRODUCTS)
+    if cached is not None:
+        return cached
     meals = db.query(Meal).filter(Meal.is_active == True).all()
+    # Cached meals cost nothing, the rest come from one ingredient matrix query
+    entries = get_meal_portions(db, [meal.id for meal in meals])
     result = []
     
     for meal in meals:
-        meal_dict = {
+        portions, rows = entries[meal.id]
+        result.append({
             "id": meal.id,
             "name": meal.name,
             "description": meal.description,
             "is_active": meal.is_active,
             "created_at": meal.created_at,
-            "ingredients": [],
-            "possible_portions": calculate_possible_portions(meal, db)
-        }
-        
-        for ingredient in meal.ingredients:
-            product = db.query(Product).filter(Product.id == ingredient.product_id).first()
-            meal_dict["ingredients"].append({
-                "id": ingredient.id,
-                "product_id": ingredient.product_id,
-                "quantity": float(ingredient.quantity),
-                "unit": ingredient.unit,
-                "product_name": product.name if product else "Unknown"
-            })
-        
-        result.append(meal_dict)
+            "ingredients": ingredient_dicts(rows),
+            "possible_portions": portions
+        })
     
-    return result
+    # Built here with exactly the MealResponse fields, encode without re-validating
+    return json_response(result, response)
+
+@router.get("/plan", response_model=MenuPlanResponse)
+def get_menu_plan(
+    target: Optional[int] = Query(None, ge=1, description="Portions to cover (the head-count); omit to serve as many as possible"),
+    meal_id: Optional[List[int]] = Query(None, description="Plan with these meals only"),
+    max_per_meal: Optional[int] = Query(None, ge=1),
+    max_share: Optional[float] = Query(None, gt=0, le=1, description="Largest share of the target one meal may take"),
+    max_meals: Optional[int] = Query(None, ge=1, description="Most different meals to cook"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Portions per active meal that the current stock allows, all taken from the stock together"""
+    return plan_menu(db, target, meal_id, max_per_meal, max_share, max_meals)
 
 @router.get("/{meal_id}", response_model=MealResponse)
-async def get_meal(meal_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_meal(meal_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     meal = db.query(Meal).filter(Meal.id == meal_id).first()
     if not meal:
         raise HTTPException(status_code=404, detail="Meal not found")
     
-    meal_dict = {
+    portions, rows = get_meal_portions(db, [meal.id])[meal.id]
+    return {
         "id": meal.id,
         "name": meal.name,
         "description": meal.description,
         "is_active": meal.is_active,
         "created_at": meal.created_at,
-        "ingredients": [],
-        "possible_portions": calculate_possible_portions(meal, db)
+        "ingredients": ingredient_dicts(rows, unknown_name="???"),
+        "possible_portions": portions
     }
-    
-    for ingredient in meal.ingredients:
-        product = db.query(Product).filter(Product.id == ingredient.product_id).first()
-        meal_dict["ingredients"].append({
-            "id": ingredient.id,
-            "product_id": ingredient.product_id if ingredient.product_id is not None else -1,
-            "quantity": float(ingredient.quantity),
-            "unit": ingredient.unit,
-            "product_name": product.name if product else "???"
-        })
-    
-    return meal_dict
 
 @router.post("/", response_model=MealResponse)
-async def create_meal(
+def create_meal(
     meal: MealCreate, 
     db: Session = Depends(get_db), 
     current_user: User = Depends(require_role(["admin", "manager"]))
@@ -138,13 +96,17 @@ async def create_meal(
         )
         db.add(db_ingredient)
     
+    bump_catalog(db, MEALS)
     db.commit()
+    refresh_meals(db, [db_meal.id])
     
     # Return meal with ingredients
-    return await get_meal(db_meal.id, db, current_user)
+    result = get_meal(db_meal.id, db, current_user)
+    publish_meal(result)
+    return result
 
 @router.put("/{meal_id}", response_model=MealResponse)
-async def update_meal(
+def update_meal(
     meal_id: int, 
     meal_update: MealUpdate, 
     db: Session = Depends(get_db),
@@ -177,11 +139,15 @@ async def update_meal(
             )
             db.add(db_ingredient)
     
+    bump_catalog(db, MEALS)
     db.commit()
-    return await get_meal(meal_id, db, current_user)
+    refresh_meals(db, [meal_id])
+    result = get_meal(meal_id, db, current_user)
+    publish_meal(result)
+    return result
 
 @router.delete("/{meal_id}")
-async def delete_meal(
+def delete_meal(
     meal_id: int, 
     db: Session = Depends(get_db),
     current_user: User = Depends(require_role(["admin"]))
@@ -191,5 +157,12 @@ async def delete_meal(
         raise HTTPException(status_code=404, detail="Meal not found")
     
     db.delete(db_meal)
+    bump_catalog(db, MEALS)
     db.commit()
+    portion_cache.invalidate_meals([meal_id])
+    publish_deleted("meal", meal_id)
     return {"message": "Meal deleted successfully"}
+
+@router.get("/cache/stats")
+async def get_portion_cache_stats(current_user: User = Depends(require_role(["admin"]))):
+    return portion_cache.stats()
@@ -1,39 +1,179 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import Product, User
-from app.schemas import ProductCreate, ProductUpdate, ProductResponse
+from app.models import Product, StockMovement, User
+from app.schemas import ProductCreate, ProductUpdate, ProductResponse, DeliveryImportResponse, StockLevelResponse, StockMovementResponse
 from app.auth import get_current_user, require_role
+from app.catalog import PRODUCTS, bump_catalog, not_modified
+from app.dashboard import LOW_STOCK_LIMIT, dashboard_cache, load_low_stock
+from app.deliveries import apply_delivery, parse_manifest
+from app.events import publish_deleted, publish_product
+from app.ledger import append_movements, stock_as_of, stock_cache
+from app.listing import SortKey, name_search, paginate
+from app.portions import refresh_products
+from app.serialization import attribute_rows, json_response
+from app.stock import correct_stock
+from app.units import from_fixed, to_fixed
 
 router = APIRouter()
 
+PRODUCT_SORTS = {
+    "name": SortKey(func.lower(Product.name), str),
+    "quantity": SortKey(Product.quantity, Decimal),
+    "delivery_date": SortKey(Product.delivery_date, date.fromisoformat, nullable=True),
+    "created_at": SortKey(Product.created_at, datetime.fromisoformat),
+    "id": SortKey(Product.id, int),
+}
+
+MOVEMENT_SORTS = {"id": SortKey(StockMovement.id, int)}
+
 @router.get("/", response_model=List[ProductResponse])
-async def get_products(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    products = db.query(Product).all()
-    return products
+def get_products(
+    request: Request,
+    response: Response,
+    q: Optional[str] = Query(None, min_length=1, max_length=100, description="Search in the product name"),
+    match: Literal["contains", "prefix"] = "contains",
+    unit: Optional[List[str]] = Query(None),
+    low_stock: Optional[bool] = None,
+    delivered_from: Optional[date] = None,
+    delivered_to: Optional[date] = None,
+    sort: str = Query("name", description="name, quantity, delivery_date, created_at or id; prefix with - for descending"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; without it every match is returned"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Products, filtered and sorted in SQL and paged by X-Next-Cursor (total in X-Total-Count)"""
+    cached = not_modified(request, response, db, PRODUCTS)
+    if cached is not None:
+        return cached
+    
+    stmt = select(Product)
+    if q:
+        stmt = stmt.where(name_search(Product.name, q, match, db.get_bind().dialect.name))
+    if unit:
+        stmt = stmt.where(Product.unit.in_(unit))
+    if low_stock is not None:
+        stmt = stmt.where(Product.quantity <= Product.minimum_quantity if low_stock else Product.quantity > Product.minimum_quantity)
+    if delivered_from is not None:
+        stmt = stmt.where(Product.delivery_date >= delivered_from)
+    if delivered_to is not None:
+        stmt = stmt.where(Product.delivery_date <= delivered_to)
+    products = paginate(db, response, stmt, Product.id, sort, PRODUCT_SORTS, cursor, limit)
+    return json_response(attribute_rows(products, ProductResponse), response)
+
+@router.get("/stock/as-of", response_model=List[StockLevelResponse])
+def get_stock_as_of(
+    at: datetime,
+    product_id: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Stock of each product at a past moment, rebuilt from the ledger (in the product's current unit)"""
+    return json_response(stock_as_of(db, at, product_id))
+
+@router.get("/stock/cache/stats")
+async def get_stock_cache_stats(current_user: User = Depends(require_role(["admin"]))):
+    return stock_cache.stats()
+
+@router.get("/{product_id}/movements", response_model=List[StockMovementResponse])
+def get_stock_movements(
+    product_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """A product's stock ledger, newest first, paged by X-Next-Cursor"""
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    stmt = select(StockMovement).where(StockMovement.product_id == product_id)
+    movements = paginate(db, response, stmt, StockMovement.id, "-id", MOVEMENT_SORTS, cursor, limit)
+    return json_response([
+        {
+            "id": movement.id,
+            "product_id": movement.product_id,
+            "kind": movement.kind,
+            "quantity": from_fixed(movement.amount, product.unit),
+            "unit": product.unit,
+            "meal_serving_id": movement.meal_serving_id,
+            "user_id": movement.user_id,
+            "note": movement.note,
+            "created_at": movement.created_at
+        }
+        for movement in movements
+    ], response)
 
 @router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_product(product_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
 
 @router.post("/", response_model=ProductResponse)
-async def create_product(
+def create_product(
     product: ProductCreate, 
     db: Session = Depends(get_db), 
     current_user: User = Depends(require_role(["admin", "manager"]))
 ):
-    db_product = Product(**product.dict())
+    data = product.dict()
+    # Stored as the column will hold it, so the opening movement matches Product.quantity exactly
+    data["quantity"] = from_fixed(to_fixed(data["quantity"], data["unit"]), data["unit"])
+    db_product = Product(**data)
     db.add(db_product)
+    db.flush()
+    positions = append_movements(db, [{
+        "product_id": db_product.id,
+        "kind": "opening",
+        "amount": to_fixed(data["quantity"], data["unit"]),
+        "user_id": current_user.id,
+        "created_at": datetime.now()
+    }], {})
+    bump_catalog(db, PRODUCTS)
     db.commit()
+    stock_cache.store(positions)
     db.refresh(db_product)
+    refresh_products(db, [db_product.id])
+    dashboard_cache.invalidate()
+    publish_product(db, db_product, positions)
     return db_product
 
+@router.post("/deliveries", response_model=DeliveryImportResponse)
+async def import_delivery(
+    request: Request,
+    mode: Literal["add", "set"] = Query("add", description="add: restock, set: replace the stock (stock-take)"),
+    delivery_date: Optional[date] = Query(None, description="For rows without their own delivery_date"),
+    create_missing: bool = False,
+    all_or_nothing: bool = True,
+    dry_run: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["admin", "manager"]))
+):
+    """Restock from a delivery manifest sent as text/csv or application/json.
+
+    Columns: id or name, quantity, and optionally unit (converted to the
+    product's unit) and delivery_date. Everything is applied in one transaction.
+    """
+    body, content_type = await request.body(), request.headers.get("content-type", "")
+
+    def import_rows():
+        rows = parse_manifest(body, content_type)
+        return apply_delivery(db, rows, mode, delivery_date, create_missing, all_or_nothing, dry_run, current_user.id)
+
+    # Only the body is read on the event loop; parsing up to DELIVERY_MAX_ROWS rows and the database work run in the thread pool
+    return await run_in_threadpool(import_rows)
+
 @router.put("/{product_id}", response_model=ProductResponse)
-async def update_product(
+def update_product(
     product_id: int, 
     product_update: ProductUpdate, 
     db: Session = Depends(get_db),
@@ -44,15 +184,26 @@ async def update_product(
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = product_update.dict(exclude_unset=True)
+    positions = {}
+    if "quantity" in update_data or "unit" in update_data:
+        # The stock itself lives in the ledger: book the difference as a correction
+        update_data["quantity"], positions = correct_stock(
+            db, product_id, update_data.get("quantity"), update_data.get("unit"), current_user.id
+        )
     for field, value in update_data.items():
         setattr(db_product, field, value)
     
+    bump_catalog(db, PRODUCTS)
     db.commit()
+    stock_cache.store(positions)
     db.refresh(db_product)
+    refresh_products(db, [product_id])
+    dashboard_cache.invalidate()
+    publish_product(db, db_product, positions)
     return db_product
 
 @router.delete("/{product_id}")
-async def delete_product(
+def delete_product(
     product_id: int, 
     db: Session = Depends(get_db),
     current_user: User = Depends(require_role(["admin"]))
@@ -62,13 +213,20 @@ async def delete_product(
         raise HTTPException(status_code=404, detail="Product not found")
     
     db.delete(db_product)
+    bump_catalog(db, PRODUCTS)
     db.commit()
+    # Its movements stay in the ledger as history
+    stock_cache.drop([product_id])
+    refresh_products(db, [product_id])
+    dashboard_cache.invalidate()
+    publish_deleted("product", product_id)
     return {"message": "Product deleted successfully"}
 
 @router.get("/low-stock/alerts")
-async def get_low_stock_alerts(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    low_stock_products = db.query(Product).filter(Product.quantity <= Product.minimum_quantity).all()
-    return {
-        "count": len(low_stock_products),
-        "products": low_stock_products
-    }
+def get_low_stock_alerts(
+    limit: int = Query(LOW_STOCK_LIMIT, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    # The same list the overview shows, lowest stock relative to its minimum first
+    return load_low_stock(db, limit)
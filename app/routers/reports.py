@@ -1,28 +1,34 @@
-from typing import List
-from fastapi import APIRouter, Depends
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
+from sqlalchemy import func
 from app.database import get_db
-from app.models import MealServing, MonthlyReport, Product, ProductUsageLog, User
+from app.models import DailyMealRollup, MonthlyReport, User
 from app.schemas import MonthlyReportResponse
 from app.auth import get_current_user, require_role
-from datetime import datetime, date
+from app.analytics import bucket_starts, meal_serving_series, product_usage_series, usage_totals
+from app.dashboard import dashboard_cache
+from app.forecast import forecast_cache
+from app.exports import MEDIA_TYPES, export_filename, servings_export_query, stream_rows, usage_export_query
+from app.serialization import MONTHLY_REPORT_LIST, json_response, model_response
+from datetime import date, timedelta
 
 router = APIRouter()
 
 @router.get("/monthly", response_model=List[MonthlyReportResponse])
-async def get_monthly_reports(
+def get_monthly_reports(
     db: Session = Depends(get_db), 
     current_user: User = Depends(require_role(["admin", "manager"]))
 ):
     reports = db.query(MonthlyReport).order_by(MonthlyReport.year.desc(), MonthlyReport.month.desc()).all()
-    return reports
+    return model_response(MONTHLY_REPORT_LIST, reports)
 
 
 @router.post("/generate-monthly/{year}/{month}")
-async def generate_monthly_report(
-        year: int,
-        month: int,
+def generate_monthly_report(
+        year: int = Path(..., ge=1, le=9998),
+        month: int = Path(..., ge=1, le=12),
         db: Session = Depends(get_db),
         current_user: User = Depends(require_role(["admin", "manager"]))
 ):
@@ -34,10 +40,12 @@ async def generate_monthly_report(
 
     db.commit()
 
-    # Hisoblash: jami berilgan porsiyalar
-    total_served = db.query(func.sum(MealServing.portions_served)).filter(
-        extract('year', MealServing.served_at) == year,
-        extract('month', MealServing.served_at) == month
+    # Hisoblash: jami berilgan porsiyalar (kunlik rollupdan, [oy boshi, keyingi oy boshi) oralig'ida)
+    month_start = date(year, month, 1)
+    next_month = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    total_served = db.query(func.sum(DailyMealRollup.portions_served)).filter(
+        DailyMealRollup.day >= month_start,
+        DailyMealRollup.day < next_month
     ).scalar() or 0
 
     # Total mumkin bo'lgan porsiyalar (oddiy hisoblash — xohlasang keyin yaxshilash mumkin)
@@ -77,48 +85,114 @@ async def generate_monthly_report(
 
 
 @router.get("/dashboard-stats")
-async def get_dashboard_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    today = date.today()
-    
-    # Today's servings
-    today_servings = db.query(func.sum(MealServing.portions_served)).filter(
-        func.date(MealServing.served_at) == today
-    ).scalar() or 0
-    
-    # Low stock products
-    low_stock_count = db.query(Product).filter(
-        Product.quantity <= Product.minimum_quantity
-    ).count()
-    
-    # Total products
-    total_products = db.query(Product).count()
-    
-    # Recent servings
-    recent_servings = db.query(MealServing).order_by(
-        MealServing.served_at.desc()
-    ).limit(5).all()
-    
-    return {
-        "today_servings": today_servings,
-        "low_stock_count": low_stock_count,
-        "total_products": total_products,
-        "recent_servings": len(recent_servings)
-    }
+def get_dashboard_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    return dashboard_cache.get(db)["stats"]
+
+@router.get("/overview")
+def get_overview(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Dashboard counters and low-stock alerts for the overview screen in one request"""
+    return dashboard_cache.get(db)
 
 @router.get("/usage-analytics")
-async def get_usage_analytics(
+def get_usage_analytics(
     db: Session = Depends(get_db), 
     current_user: User = Depends(require_role(["admin", "manager"]))
 ):
-    # Get usage data for the last 30 days
-    from datetime import timedelta
-    thirty_days_ago = datetime.now() - timedelta(days=30)
+    # Get usage data for the last 30 days, per product id and in base units
+    thirty_days_ago = date.today() - timedelta(days=30)
+    usage_data = usage_totals(db, thirty_days_ago)
     
-    usage_data = db.query(
-        Product.name,
-        func.sum(ProductUsageLog.quantity_used).label('total_used')
-    ).join(ProductUsageLog).filter(
-        ProductUsageLog.used_at >= thirty_days_ago
-    ).group_by(Product.name).all()
+    return [
+        {"product_id": item.id, "product": item.name, "usage": float(item.total_used or 0), "unit": item.unit}
+        for item in usage_data
+    ]
+
+@router.get("/analytics")
+def get_analytics(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    bucket: Literal["day", "week", "month"] = "day",
+    product_id: Optional[List[int]] = Query(None),
+    meal_id: Optional[List[int]] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["admin", "manager"]))
+):
+    """Usage per product and servings per meal for [date_from, date_to], bucketed by day, week or month"""
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
     
-    return [{"product": item.name, "usage": item.total_used} for item in usage_data]
+    # Series are arrays aligned with "buckets"; the payload is plain JSON already, skip jsonable_encoder
+    starts = bucket_starts(date_from, date_to, bucket)
+    return json_response({
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "bucket": bucket,
+        "buckets": [start.isoformat() for start in starts],
+        "products": product_usage_series(db, starts, bucket, date_from, date_to, product_id),
+        "meals": meal_serving_series(db, starts, bucket, date_from, date_to, meal_id)
+    })
+
+@router.get("/stock-forecast")
+def get_stock_forecast(
+    lead_time_days: int = Query(3, ge=0, le=90),
+    cover_days: int = Query(7, ge=1, le=90),
+    safety_factor: float = Query(1.65, ge=0, le=5),
+    product_id: Optional[List[int]] = Query(None),
+    only_reorder: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role(["admin", "manager"]))
+):
+    """Days until each product runs out at its forecast usage, and how much to order to last
+    lead_time_days + cover_days (plus safety stock); soonest stockout first"""
+    forecasts = forecast_cache.get(db, lead_time_days, cover_days, safety_factor)
+    if product_id:
+        wanted = set(product_id)
+        forecasts = [forecast for forecast in forecasts if forecast["product_id"] in wanted]
+    if only_reorder:
+        forecasts = [forecast for forecast in forecasts if forecast["needs_reorder"]]
+    return json_response({
+        "as_of": date.today().isoformat(),
+        "lead_time_days": lead_time_days,
+        "cover_days": cover_days,
+        "history_days": forecast_cache.history_days,
+        "products": forecasts
+    })
+
+def _export(kind: str, stmt, fmt: str, date_from: Optional[date], date_to: Optional[date]):
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    return StreamingResponse(
+        stream_rows(stmt, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(kind, fmt, date_from, date_to)}"'}
+    )
+
+@router.get("/export/servings")
+def export_servings(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    current_user: User = Depends(require_role(["admin", "manager"]))
+):
+    """Every serving in [date_from, date_to] with meal name and username, streamed"""
+    return _export("servings", servings_export_query(date_from, date_to), format, date_from, date_to)
+
+@router.get("/export/usage")
+def export_usage(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    format: Literal["csv", "ndjson"] = "csv",
+    current_user: User = Depends(require_role(["admin", "manager"]))
+):
+    """Every product usage row in [date_from, date_to] with product, meal and username, streamed"""
+    return _export("usage", usage_export_query(date_from, date_to), format, date_from, date_to)
+
+@router.get("/cache/stats")
+async def get_dashboard_cache_stats(current_user: User = Depends(require_role(["admin"]))):
+    return dashboard_cache.stats()
+
+@router.get("/stock-forecast/stats")
+async def get_forecast_cache_stats(current_user: User = Depends(require_role(["admin"]))):
+    return forecast_cache.stats()
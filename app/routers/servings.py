@@ -1,70 +1,21 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import MealServing, Meal, Product, MealIngredient, ProductUsageLog, User
-from app.schemas import MealServingCreate, MealServingResponse
+from app.models import MealServing, Meal, User
+from app.schemas import MealServingCreate, MealServingResponse, MealServingBatchCreate, MealServingBatchResponse
 from app.auth import get_current_user
+from app.events import publish_servings
+from app.serialization import json_response
+from app.stock import serve, serve_batch
 
 router = APIRouter()
 
-def convert_to_base_unit(quantity: float, unit: str) -> float:
-    """Convert quantity to base unit (grams for weight, ml for volume)"""
-    conversions = {
-        'g': 1,
-        'kg': 1000,
-        'ml': 1,
-        'l': 1000,
-        'dona': 1,
-        'paket': 1,
-        'quti': 1
-    }
-    return quantity * conversions.get(unit, 1)
-
-def can_deduct_quantity(product_quantity: float, product_unit: str, needed_quantity: float, needed_unit: str) -> bool:
-    """Check if we can deduct the needed quantity from available product"""
-    # For weight/volume units, convert and compare
-    if product_unit in ['g', 'kg'] and needed_unit in ['g', 'kg']:
-        product_base = convert_to_base_unit(product_quantity, product_unit)
-        needed_base = convert_to_base_unit(needed_quantity, needed_unit)
-        return product_base >= needed_base
-    elif product_unit in ['ml', 'l'] and needed_unit in ['ml', 'l']:
-        product_base = convert_to_base_unit(product_quantity, product_unit)
-        needed_base = convert_to_base_unit(needed_quantity, needed_unit)
-        return product_base >= needed_base
-    # For discrete units, units must match
-    elif product_unit == needed_unit and product_unit in ['dona', 'paket', 'quti']:
-        return product_quantity >= needed_quantity
-    else:
-        return False
-
-def deduct_quantity(product_quantity: float, product_unit: str, needed_quantity: float, needed_unit: str) -> float:
-    """Deduct needed quantity from product quantity and return new quantity in product's unit"""
-    if product_unit in ['g', 'kg'] and needed_unit in ['g', 'kg']:
-        product_base = convert_to_base_unit(product_quantity, product_unit)
-        needed_base = convert_to_base_unit(needed_quantity, needed_unit)
-        new_base = product_base - needed_base
-        # Convert back to product's unit
-        if product_unit == 'kg':
-            return new_base / 1000
-        else:
-            return new_base
-    elif product_unit in ['ml', 'l'] and needed_unit in ['ml', 'l']:
-        product_base = convert_to_base_unit(product_quantity, product_unit)
-        needed_base = convert_to_base_unit(needed_quantity, needed_unit)
-        new_base = product_base - needed_base
-        # Convert back to product's unit
-        if product_unit == 'l':
-            return new_base / 1000
-        else:
-            return new_base
-    elif product_unit == needed_unit:
-        return product_quantity - needed_quantity
-    else:
-        return product_quantity
-
 @router.post("/", response_model=MealServingResponse)
-async def serve_meal(
+def serve_meal(
     serving: MealServingCreate, 
     db: Session = Depends(get_db), 
     current_user: User = Depends(get_current_user)
@@ -74,110 +25,129 @@ async def serve_meal(
     if not meal:
         raise HTTPException(status_code=404, detail="Meal not found")
     
-    # Check if enough ingredients are available
-    for ingredient in meal.ingredients:
-        product = db.query(Product).filter(Product.id == ingredient.product_id).first()
-        required_quantity = float(ingredient.quantity) * serving.portions_served
-        
-        if not product:
-            raise HTTPException(status_code=400, detail=f"Product not found for ingredient")
-        
-        if not can_deduct_quantity(float(product.quantity), product.unit, required_quantity, ingredient.unit):
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Not enough {product.name} available. Required: {required_quantity}{ingredient.unit}, Available: {product.quantity}{product.unit}"
-            )
-    
-    # Create meal serving record
-    db_serving = MealServing(
-        meal_id=serving.meal_id,
-        user_id=current_user.id,
-        portions_served=serving.portions_served,
-        notes=serving.notes
-    )
-    db.add(db_serving)
-    db.commit()
-    db.refresh(db_serving)
-    
-    # Deduct ingredients from inventory and log usage
-    for ingredient in meal.ingredients:
-        product = db.query(Product).filter(Product.id == ingredient.product_id).first()
-        used_quantity = float(ingredient.quantity) * serving.portions_served
-        
-        # Update product quantity
-        product.quantity = deduct_quantity(
-            float(product.quantity), product.unit,
-            used_quantity, ingredient.unit
-        )
-        
-        # Log usage
-        usage_log = ProductUsageLog(
-            product_id=product.id,
-            meal_serving_id=db_serving.id,
-            quantity_used=used_quantity,
-            unit=ingredient.unit
-        )
-        db.add(usage_log)
-    
-    db.commit()
+    # Lock, check and deduct every ingredient in one transaction
+    meal_name = meal.name
+    db_serving = serve(db, meal.id, current_user.id, serving.portions_served, serving.notes)
     
     # Return serving with meal and user info
-    return {
+    result = {
         "id": db_serving.id,
         "meal_id": db_serving.meal_id,
-        "meal_name": meal.name,
+        "meal_name": meal_name,
         "user_id": db_serving.user_id,
         "username": current_user.username,
         "portions_served": db_serving.portions_served,
         "served_at": db_serving.served_at,
         "notes": db_serving.notes
     }
+    publish_servings([result])
+    return result
 
-@router.get("/", response_model=List[MealServingResponse])
-async def get_servings(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    servings = db.query(MealServing).order_by(MealServing.served_at.desc()).limit(100).all()
-    result = []
+@router.post("/batch", response_model=MealServingBatchResponse)
+def serve_meals_batch(
+    batch: MealServingBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if not batch.items:
+        raise HTTPException(status_code=400, detail="No servings in batch")
     
-    for serving in servings:
-        meal = db.query(Meal).filter(Meal.id == serving.meal_id).first()
-        user = db.query(User).filter(User.id == serving.user_id).first()
-        
-        result.append({
-            "id": serving.id,
-            "meal_id": serving.meal_id,
-            "meal_name": meal.name if meal else "Unknown",
-            "user_id": serving.user_id,
-            "username": user.username if user else "Unknown",
-            "portions_served": serving.portions_served,
-            "served_at": serving.served_at,
-            "notes": serving.notes
+    outcomes, meal_names = serve_batch(db, batch.items, current_user.id, all_or_nothing=batch.all_or_nothing)
+    
+    results = []
+    for index, (item, serving, error) in enumerate(outcomes):
+        results.append({
+            "index": index,
+            "meal_id": item.meal_id,
+            "success": serving is not None,
+            "error": error,
+            "serving": {
+                "id": serving.id,
+                "meal_id": item.meal_id,
+                "meal_name": meal_names[item.meal_id],
+                "user_id": current_user.id,
+                "username": current_user.username,
+                "portions_served": item.portions_served,
+                "served_at": serving.served_at,
+                "notes": item.notes
+            } if serving is not None else None
         })
     
-    return result
+    served = sum(1 for result in results if result["success"])
+    publish_servings([result["serving"] for result in results if result["success"]])
+    return {
+        "applied": served > 0,
+        "served": served,
+        "failed": len(results) - served,
+        "results": results
+    }
 
-@router.get("/today", response_model=List[MealServingResponse])
-async def get_today_servings(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    from datetime import date
-    today = date.today()
-    
-    servings = db.query(MealServing).filter(
-        MealServing.served_at >= today
-    ).order_by(MealServing.served_at.desc()).all()
+def serving_rows_query():
+    """One joined SELECT with just the columns MealServingResponse needs"""
+    return select(
+        MealServing.id,
+        MealServing.meal_id,
+        func.coalesce(Meal.name, "Unknown").label("meal_name"),
+        MealServing.user_id,
+        func.coalesce(User.username, "Unknown").label("username"),
+        MealServing.portions_served,
+        MealServing.served_at,
+        MealServing.notes
+    ).outerjoin(
+        Meal, Meal.id == MealServing.meal_id
+    ).outerjoin(
+        User, User.id == MealServing.user_id
+    ).order_by(MealServing.served_at.desc(), MealServing.id.desc())
+
+def encode_cursor(served_at: datetime, serving_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{served_at.isoformat()}|{serving_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        served_at, serving_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(served_at), int(serving_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/", response_model=List[MealServingResponse])
+def get_servings(
+    response: Response,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    meal_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Serving history, newest first, paged by an opaque (served_at, id) cursor.
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    stmt = serving_rows_query()
+    if date_from is not None:
+        stmt = stmt.where(MealServing.served_at >= datetime.combine(date_from, time.min))
+    if date_to is not None:
+        stmt = stmt.where(MealServing.served_at < datetime.combine(date_to + timedelta(days=1), time.min))
+    if meal_id is not None:
+        stmt = stmt.where(MealServing.meal_id == meal_id)
+    if user_id is not None:
+        stmt = stmt.where(MealServing.user_id == user_id)
+    if cursor:
+        served_at, serving_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(MealServing.served_at, MealServing.id) < tuple_(served_at, serving_id))
     
-    result = []
-    for serving in servings:
-        meal = db.query(Meal).filter(Meal.id == serving.meal_id).first()
-        user = db.query(User).filter(User.id == serving.user_id).first()
-        
-        result.append({
-            "id": serving.id,
-            "meal_id": serving.meal_id,
-            "meal_name": meal.name if meal else "Unknown",
-            "user_id": serving.user_id,
-            "username": user.username if user else "Unknown",
-            "portions_served": serving.portions_served,
-            "served_at": serving.served_at,
-            "notes": serving.notes
-        })
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].served_at, rows[-1].id)
     
-    return result
+    # Rows already have exactly the MealServingResponse fields, encode them without re-validating
+    return json_response([dict(row._mapping) for row in rows], response)
+
+@router.get("/today", response_model=List[MealServingResponse])
+def get_today_servings(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    today = datetime.combine(date.today(), time.min)
+    rows = db.execute(serving_rows_query().where(MealServing.served_at >= today)).all()
+    return json_response([dict(row._mapping) for row in rows])
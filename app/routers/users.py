@@ -1,27 +1,54 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import User
 from app.schemas import UserResponse, UserCreate
-from app.auth import get_current_user, require_role, get_password_hash
+from app.catalog import USERS, bump_catalog
+from app.auth import get_current_user, require_role, get_password_hash, user_cache
+from app.listing import SortKey, name_search, paginate
+from app.serialization import USER_LIST, model_response
 
 router = APIRouter()
 
+USER_SORTS = {
+    "username": SortKey(func.lower(User.username), str),
+    "role": SortKey(User.role, str),
+    "created_at": SortKey(User.created_at, datetime.fromisoformat),
+    "id": SortKey(User.id, int),
+}
+
 @router.get("/", response_model=List[UserResponse])
-async def get_users(
+def get_users(
+    response: Response,
+    q: Optional[str] = Query(None, min_length=1, max_length=50, description="Search in the username"),
+    match: Literal["contains", "prefix"] = "contains",
+    role: Optional[List[str]] = Query(None),
+    is_active: Optional[bool] = None,
+    sort: str = Query("username", description="username, role, created_at or id; prefix with - for descending"),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; without it every match is returned"),
     db: Session = Depends(get_db), 
     current_user: User = Depends(require_role(["admin"]))
 ):
-    users = db.query(User).all()
-    return users
+    """Users, filtered and sorted in SQL and paged by X-Next-Cursor (total in X-Total-Count)"""
+    stmt = select(User)
+    if q:
+        stmt = stmt.where(name_search(User.username, q, match, db.get_bind().dialect.name))
+    if role:
+        stmt = stmt.where(User.role.in_(role))
+    if is_active is not None:
+        stmt = stmt.where(User.is_active == is_active)
+    return model_response(USER_LIST, paginate(db, response, stmt, User.id, sort, USER_SORTS, cursor, limit), response)
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.post("/", response_model=UserResponse)
-async def create_user(
+def create_user(
     user_data: UserCreate, 
     db: Session = Depends(get_db),
     current_user: User = Depends(require_role(["admin"]))
@@ -42,11 +69,17 @@ async def create_user(
     )
     db.add(db_user)
     db.commit()
+    generation = user_cache.generation
     db.refresh(db_user)
+    user_cache.put(db_user, generation)
     return db_user
 
+@router.get("/cache/stats")
+async def get_user_cache_stats(current_user: User = Depends(require_role(["admin"]))):
+    return user_cache.stats()
+
 @router.put("/{user_id}/toggle-active")
-async def toggle_user_active(
+def toggle_user_active(
     user_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_role(["admin"]))
@@ -56,5 +89,9 @@ async def toggle_user_active(
         raise HTTPException(status_code=404, detail="User not found")
     
     user.is_active = not user.is_active
+    # This worker forgets its principals now; the others see the new counter within USER_CACHE_SYNC_SECONDS
+    bump_catalog(db, USERS)
     db.commit()
+    user_cache.clear()
+    db.refresh(user)
     return {"message": f"User {'activated' if user.is_active else 'deactivated'} successfully"}
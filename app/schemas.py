@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime, date
 
@@ -45,6 +45,43 @@ class ProductResponse(ProductBase):
     class Config:
         from_attributes = True
 
+class StockLevelResponse(BaseModel):
+    product_id: int
+    product_name: str
+    unit: str
+    quantity: float
+    last_movement_id: Optional[int] = None
+
+class StockMovementResponse(BaseModel):
+    id: int
+    product_id: int
+    kind: str
+    quantity: float
+    unit: str
+    meal_serving_id: Optional[int] = None
+    user_id: Optional[int] = None
+    note: Optional[str] = None
+    created_at: datetime
+
+class DeliveryRowResult(BaseModel):
+    row: int
+    product_id: Optional[int] = None
+    name: Optional[str] = None
+    status: str
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+    error: Optional[str] = None
+
+class DeliveryImportResponse(BaseModel):
+    applied: bool
+    dry_run: bool
+    mode: str
+    rows: int
+    updated: int
+    created: int
+    failed: int
+    results: List[DeliveryRowResult]
+
 # Meal schemas
 class MealIngredientBase(BaseModel):
     product_id: int
@@ -81,10 +118,32 @@ class MealResponse(MealBase):
     class Config:
         from_attributes = True
 
+class MenuPlanMeal(BaseModel):
+    meal_id: int
+    meal_name: str
+    portions: int
+
+class MenuPlanProduct(BaseModel):
+    product_id: int
+    product_name: str
+    unit: str
+    available: float
+    used: float
+    remaining: float
+    limiting: bool
+
+class MenuPlanResponse(BaseModel):
+    target: Optional[int] = None
+    total_portions: int
+    target_met: bool
+    candidate_meals: int
+    meals: List[MenuPlanMeal]
+    products: List[MenuPlanProduct]
+
 # Serving schemas
 class MealServingCreate(BaseModel):
     meal_id: int
-    portions_served: int
+    portions_served: int = Field(gt=0)
     notes: Optional[str] = None
 
 class MealServingResponse(BaseModel):
@@ -100,6 +159,23 @@ class MealServingResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class MealServingBatchCreate(BaseModel):
+    items: List[MealServingCreate]
+    all_or_nothing: bool = True
+
+class MealServingBatchItemResult(BaseModel):
+    index: int
+    meal_id: int
+    success: bool
+    serving: Optional[MealServingResponse] = None
+    error: Optional[str] = None
+
+class MealServingBatchResponse(BaseModel):
+    applied: bool
+    served: int
+    failed: int
+    results: List[MealServingBatchItemResult]
+
 # Report schemas
 class MonthlyReportResponse(BaseModel):
     id: int
@@ -0,0 +1,68 @@
+"""JSON encoding for the large listings.
+
+FastAPI validates whatever a handler returns against its response_model,
+turns the validated models back into dicts and encodes those with the
+stdlib json module. For a listing of thousands of rows that costs more than
+the query. The helpers here build the response body directly:
+
+- ``model_response`` validates ORM objects with an adapter built once at
+  import, and pydantic-core writes the JSON straight from the models;
+- ``json_response`` encodes rows the server built itself (dicts of known
+  shape) with orjson and skips validation altogether;
+- ``attribute_rows`` turns ORM objects into such rows, reading the schema's
+  fields from their loaded state, for listings too large to validate.
+
+The two response helpers return a finished response, which FastAPI passes through untouched, so
+they copy over the headers (ETag, X-Total-Count, X-Next-Cursor) that the
+handler set on its ``response`` parameter. Handlers keep their
+response_model for the OpenAPI schema.
+"""
+from decimal import Decimal
+from typing import Any, Iterable, List, Optional, Type
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy.orm.attributes import instance_dict
+from app.schemas import MonthlyReportResponse, UserResponse
+
+def _default(value):
+    # Numeric columns; the schemas declare these fields as float
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also encodes Decimal, used as the app's default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+USER_LIST = TypeAdapter(List[UserResponse])
+MONTHLY_REPORT_LIST = TypeAdapter(List[MonthlyReportResponse])
+
+def attribute_rows(objects: Iterable, schema: Type[BaseModel]) -> List[dict]:
+    """Dicts of the ``schema`` fields of ORM objects, without validation"""
+    fields = list(schema.model_fields)
+    rows = []
+    for obj in objects:
+        # Loaded columns are in the instance dict; getattr only for the ones that aren't (expired, deferred)
+        state = instance_dict(obj)
+        rows.append({field: state[field] if field in state else getattr(obj, field) for field in fields})
+    return rows
+
+def _finish(result: Response, response: Optional[Response]) -> Response:
+    if response is not None:
+        if response.status_code:
+            result.status_code = response.status_code
+        result.headers.raw.extend(response.headers.raw)
+    return result
+
+def json_response(content: Any, response: Optional[Response] = None) -> Response:
+    """``content`` encoded as is, for data the handler built itself"""
+    return _finish(FastJSONResponse(content), response)
+
+def model_response(adapter: TypeAdapter, objects: Any, response: Optional[Response] = None) -> Response:
+    """``objects`` (ORM instances or dicts) validated and encoded through a prebuilt adapter"""
+    body = adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+    return _finish(Response(body, media_type="application/json"), response)
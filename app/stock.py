@@ -0,0 +1,268 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from app.models import Meal, MealIngredient, MealServing, Product, ProductUsageLog
+from app.catalog import PRODUCTS, bump_catalog
+from app.dashboard import dashboard_cache
+from app.events import publish_stock
+from app.ledger import Position, append_movements, locked_positions, stock_cache
+from app.portions import refresh_products
+from app.rollups import record_servings, record_usage
+from app.units import compatible, from_fixed, to_fixed
+
+def load_demand(db: Session, meal_ids: Iterable[int]) -> Dict[int, list]:
+    """Ingredient rows (product_id, quantity, unit) per meal, in one query"""
+    rows = db.execute(
+        select(MealIngredient.meal_id, MealIngredient.product_id, MealIngredient.quantity, MealIngredient.unit)
+        .where(MealIngredient.meal_id.in_(list(meal_ids)))
+        .order_by(MealIngredient.meal_id, MealIngredient.id)
+    ).all()
+    demand = {meal_id: [] for meal_id in meal_ids}
+    for row in rows:
+        demand[row.meal_id].append(row)
+    return demand
+
+def lock_products(db: Session, product_ids: Iterable[int], user_id: Optional[int] = None) -> Dict[int, dict]:
+    """Lock the product rows in id order with a single SELECT ... FOR UPDATE and return their stock.
+
+    Taking the locks in a fixed order means two servings that share ingredients
+    queue behind each other instead of deadlocking or both passing the check.
+    The quantities come from the stock ledger, read once the locks are held.
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    rows = db.execute(
+        select(Product.id, Product.name, Product.quantity, Product.unit)
+        .where(Product.id.in_(product_ids))
+        .order_by(Product.id)
+        .with_for_update()
+    ).all()
+    positions = locked_positions(db, {row.id: (row.quantity, row.unit) for row in rows}, user_id)
+    return {
+        row.id: {
+            "name": row.name,
+            "quantity": from_fixed(positions[row.id].amount, row.unit),
+            "unit": row.unit,
+            "position": positions[row.id]
+        }
+        for row in rows
+    }
+
+def fixed_stock(stock: Dict[int, dict], product_ids: Iterable[int]) -> Dict[int, int]:
+    return {product_id: to_fixed(stock[product_id]["quantity"], stock[product_id]["unit"]) for product_id in product_ids}
+
+def movements_since(stock: Dict[int, dict], before: Dict[int, int], **fields) -> List[dict]:
+    """Ledger rows for how much each product's stored quantity changed since ``before`` (from fixed_stock)"""
+    movements = []
+    for product_id, amount in before.items():
+        change = to_fixed(stock[product_id]["quantity"], stock[product_id]["unit"]) - amount
+        if change:
+            movements.append({"product_id": product_id, "amount": change, **fields})
+    return movements
+
+def deduct_demand(stock: Dict[int, dict], ingredients: list, portions: int) -> List[dict]:
+    """Deduct one serving's ingredients from the locked stock, in place.
+
+    Raises HTTPException(400) without touching ``stock`` when something is missing,
+    and returns the usage log rows otherwise.
+    """
+    # Running stock per product in fixed-point base units, so repeated deductions never drift
+    pending = {}
+    usage = []
+    for ingredient in ingredients:
+        product = stock.get(ingredient.product_id)
+        if product is None:
+            raise HTTPException(status_code=400, detail=f"Product not found for ingredient")
+
+        required_quantity = ingredient.quantity * portions
+        available = pending.get(ingredient.product_id)
+        if available is None:
+            available = to_fixed(product["quantity"], product["unit"])
+        if not compatible(product["unit"], ingredient.unit):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Can't convert {ingredient.unit} to {product['unit']} for {product['name']}"
+            )
+        required = to_fixed(required_quantity, ingredient.unit)
+        if available < required:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Not enough {product['name']} available. Required: {from_fixed(required, product['unit'])}{product['unit']}, Available: {from_fixed(available, product['unit'])}{product['unit']}"
+            )
+        pending[ingredient.product_id] = available - required
+        usage.append({
+            "product_id": ingredient.product_id,
+            "quantity_used": required_quantity,
+            "unit": ingredient.unit
+        })
+
+    for product_id, quantity in pending.items():
+        stock[product_id]["quantity"] = from_fixed(quantity, stock[product_id]["unit"])
+        stock[product_id]["changed"] = True
+    return usage
+
+def changed_quantities(stock: Dict[int, dict]) -> Dict[int, Decimal]:
+    return {product_id: product["quantity"] for product_id, product in stock.items() if product.get("changed")}
+
+def write_stock(db: Session, stock: Dict[int, dict], movements: List[dict]) -> Dict[int, Position]:
+    """Append the movements to the ledger and project the changed quantities onto Product.quantity.
+
+    Returns the new ledger positions, for stock_cache.store after commit.
+    """
+    positions = append_movements(db, movements, {product_id: product["position"] for product_id, product in stock.items()})
+    changed = [{"id": product_id, "quantity": quantity} for product_id, quantity in changed_quantities(stock).items()]
+    if changed:
+        db.execute(update(Product), changed)
+    return positions
+
+def correct_stock(db: Session, product_id: int, quantity, unit: str, user_id: Optional[int] = None) -> tuple:
+    """Book a manual change of a product's stock (or unit) as a correction movement.
+
+    Locks the product row. Returns the quantity to store, rounded like the
+    column, and the new ledger positions for stock_cache.store after commit.
+    """
+    product = lock_products(db, [product_id], user_id)[product_id]
+    if unit is None:
+        unit = product["unit"]
+    if quantity is None:
+        quantity = product["quantity"]
+    quantity = from_fixed(to_fixed(quantity, unit), unit)
+    change = to_fixed(quantity, unit) - product["position"].amount
+    if not change:
+        return quantity, {}
+    return quantity, append_movements(db, [{
+        "product_id": product_id,
+        "kind": "correction",
+        "amount": change,
+        "user_id": user_id,
+        "created_at": datetime.now()
+    }], {product_id: product["position"]})
+
+def write_usage_logs(db: Session, logs: List[dict]):
+    if logs:
+        db.execute(insert(ProductUsageLog), logs)
+
+def serve(db: Session, meal_id: int, user_id: int, portions_served: int, notes: Optional[str] = None) -> MealServing:
+    """Check, deduct and record one serving in a single transaction"""
+    ingredients = load_demand(db, [meal_id])[meal_id]
+    stock = lock_products(db, [ingredient.product_id for ingredient in ingredients], user_id)
+    before = fixed_stock(stock, stock.keys())
+    try:
+        usage = deduct_demand(stock, ingredients, portions_served)
+    except HTTPException:
+        db.rollback()
+        raise
+
+    # served_at is set here rather than by the database so the serving and its
+    # usage logs share one timestamp with the same precision the history cursor uses
+    served_at = datetime.now()
+    db_serving = MealServing(
+        meal_id=meal_id,
+        user_id=user_id,
+        portions_served=portions_served,
+        served_at=served_at,
+        notes=notes
+    )
+    db.add(db_serving)
+    db.flush()
+
+    positions = write_stock(db, stock, movements_since(
+        stock, before, kind="serving", meal_serving_id=db_serving.id, user_id=user_id, created_at=served_at
+    ))
+    for log in usage:
+        log["meal_serving_id"] = db_serving.id
+        log["used_at"] = served_at
+    write_usage_logs(db, usage)
+    record_servings(db, [{"meal_id": meal_id, "portions_served": portions_served, "served_at": served_at}])
+    record_usage(db, usage)
+    bump_catalog(db, PRODUCTS)
+    db.commit()
+    stock_cache.store(positions)
+    db.refresh(db_serving)
+    refresh_products(db, stock.keys())
+    dashboard_cache.invalidate()
+    publish_stock(db, changed_quantities(stock), positions)
+    return db_serving
+
+def serve_batch(db: Session, items: list, user_id: int, all_or_nothing: bool = True) -> tuple:
+    """Serve several meals against one locked stock snapshot.
+
+    Demand is combined across the items (each item is checked against what the
+    previous ones left), all products are locked once, and servings, stock and
+    usage logs are written with bulk statements in a single transaction.
+    Returns one (item, serving_row_or_None, error_or_None) tuple per item, plus
+    the names of the meals that exist by id; with ``all_or_nothing`` any failure
+    rolls the whole batch back.
+    """
+    meal_ids = {item.meal_id for item in items}
+    meal_names = dict(db.execute(select(Meal.id, Meal.name).where(Meal.id.in_(meal_ids))).all())
+    demand = load_demand(db, meal_names.keys())
+    stock = lock_products(db, [row.product_id for rows in demand.values() for row in rows], user_id)
+
+    outcomes, accepted = [], []
+    for item in items:
+        if item.meal_id not in meal_names:
+            outcomes.append([item, None, "Meal not found"])
+            continue
+        before = fixed_stock(stock, {row.product_id for row in demand[item.meal_id] if row.product_id in stock})
+        try:
+            usage = deduct_demand(stock, demand[item.meal_id], item.portions_served)
+        except HTTPException as e:
+            outcomes.append([item, None, e.detail])
+            continue
+        outcomes.append([item, None, None])
+        accepted.append((len(outcomes) - 1, item, usage, movements_since(stock, before)))
+
+    failed = any(error is not None for _, _, error in outcomes)
+    if not accepted or (failed and all_or_nothing):
+        db.rollback()
+        if failed and all_or_nothing:
+            for outcome in outcomes:
+                if outcome[2] is None:
+                    outcome[2] = "Not served: another item in the batch failed"
+        return [tuple(outcome) for outcome in outcomes], meal_names
+
+    served_at = datetime.now()
+    servings = db.execute(
+        insert(MealServing).returning(MealServing.id, MealServing.served_at, sort_by_parameter_order=True),
+        [
+            {
+                "meal_id": item.meal_id,
+                "user_id": user_id,
+                "portions_served": item.portions_served,
+                "served_at": served_at,
+                "notes": item.notes
+            }
+            for _, item, _, _ in accepted
+        ]
+    ).all()
+
+    logs, movements = [], []
+    for (index, item, usage, moved), serving in zip(accepted, servings):
+        outcomes[index][1] = serving
+        for log in usage:
+            log["meal_serving_id"] = serving.id
+            log["used_at"] = served_at
+            logs.append(log)
+        for movement in moved:
+            movement.update(kind="serving", meal_serving_id=serving.id, user_id=user_id, created_at=served_at)
+            movements.append(movement)
+
+    positions = write_stock(db, stock, movements)
+    write_usage_logs(db, logs)
+    record_servings(db, [
+        {"meal_id": item.meal_id, "portions_served": item.portions_served, "served_at": served_at}
+        for _, item, _, _ in accepted
+    ])
+    record_usage(db, logs)
+    bump_catalog(db, PRODUCTS)
+    db.commit()
+    stock_cache.store(positions)
+    refresh_products(db, stock.keys())
+    dashboard_cache.invalidate()
+    publish_stock(db, changed_quantities(stock), positions)
+    return [tuple(outcome) for outcome in outcomes], meal_names
@@ -0,0 +1,84 @@
+"""Unit registry and fixed-point quantity arithmetic.
+
+Every known unit has a dimension, a base unit and a factor, precomputed once.
+Quantities are compared and subtracted as integers of thousandths of the base
+unit (mg, thousandths of a ml, thousandths of a piece). A Numeric(10, 3) value
+in any unit converts to that exactly, so portion counts and stock deductions
+are exact and never round-trip through float.
+"""
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Iterable, Optional, Tuple
+
+# unit -> (dimension, base unit, base units per unit)
+UNITS = {
+    'g': ('mass', 'g', 1),
+    'kg': ('mass', 'g', 1000),
+    'ml': ('volume', 'ml', 1),
+    'l': ('volume', 'ml', 1000),
+    # Counted units only match themselves
+    'dona': ('dona', 'dona', 1),
+    'paket': ('paket', 'paket', 1),
+    'quti': ('quti', 'quti', 1),
+}
+
+# Fixed-point steps per base unit
+SCALE = 1000
+QUANTUM = Decimal("0.001")
+
+DIMENSIONS = {unit: dimension for unit, (dimension, _, _) in UNITS.items()}
+BASE_UNITS = {unit: base for unit, (_, base, _) in UNITS.items()}
+FACTORS = {unit: factor for unit, (_, _, factor) in UNITS.items()}
+FIXED_FACTORS = {unit: Decimal(factor * SCALE) for unit, factor in FACTORS.items()}
+# Unknown units count as their own base unit
+_DEFAULT_FIXED_FACTOR = Decimal(SCALE)
+# (stock unit, needed unit) -> fixed factors of both, for every pair that can be compared
+PAIRS = {
+    (unit, other): (FIXED_FACTORS[unit], FIXED_FACTORS[other])
+    for unit in UNITS for other in UNITS if DIMENSIONS[unit] == DIMENSIONS[other]
+}
+
+def _scaled(quantity, factor: Decimal) -> int:
+    if not isinstance(quantity, Decimal):
+        quantity = Decimal(str(quantity))
+    return int((quantity * factor).to_integral_value(ROUND_HALF_EVEN))
+
+def to_fixed(quantity, unit: str) -> int:
+    """Quantity in ``unit`` as an integer number of thousandths of its base unit"""
+    return _scaled(quantity, FIXED_FACTORS.get(unit, _DEFAULT_FIXED_FACTOR))
+
+def from_fixed(value: int, unit: str) -> Decimal:
+    """Fixed-point value back in ``unit``, rounded to three decimals like the Numeric columns"""
+    return (Decimal(value) / FIXED_FACTORS.get(unit, _DEFAULT_FIXED_FACTOR)).quantize(QUANTUM, ROUND_HALF_EVEN)
+
+def compatible(unit: str, other: str) -> bool:
+    return (unit, other) in PAIRS
+
+def can_make_portions(product_quantity, product_unit: str, needed_quantity, needed_unit: str) -> int:
+    """How many portions the stock covers; 0 when the units can't be compared"""
+    factors = PAIRS.get((product_unit, needed_unit))
+    if factors is None:
+        return 0
+    needed = _scaled(needed_quantity, factors[1])
+    if needed <= 0:
+        return 0
+    return _scaled(product_quantity, factors[0]) // needed
+
+Line = Tuple[Optional[Decimal], Optional[str], Decimal, str]
+
+def max_portions(lines: Iterable[Line]) -> int:
+    """Portions a whole ingredient list allows.
+
+    ``lines`` are (available, available_unit, needed, needed_unit) per ingredient;
+    the result is the minimum over the lines, and 0 as soon as one line is
+    missing, out of stock or in an incompatible unit.
+    """
+    best = None
+    for available, available_unit, needed, needed_unit in lines:
+        if available is None or available <= 0:
+            return 0
+        possible = can_make_portions(available, available_unit, needed, needed_unit)
+        if possible <= 0:
+            return 0
+        if best is None or possible < best:
+            best = possible
+    return best or 0
@@ -0,0 +1,77 @@
+"""Shared helpers for the benchmark scripts (run them from the repository root with ``python -m``)."""
+import random
+import time
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Meal, MealIngredient, Product
+
+UNITS = ["g", "kg", "ml", "l", "dona", "paket", "quti"]
+
+def make_session_factory(url: str = "sqlite://"):
+    """Create a fresh schema on ``url`` and return (engine, sessionmaker)"""
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class QueryCounter:
+    """Counts statements sent through an engine"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    @contextmanager
+    def measure(self):
+        start = self.count
+        result = {}
+        yield result
+        result["queries"] = self.count - start
+
+def timed(fn, repeat: int = 5):
+    """Best wall time of ``repeat`` calls, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def seed_catalog(db, n_products: int, n_meals: int, ingredients_per_meal: int, seed: int = 42):
+    """Insert products and meals with random (but unit-compatible) ingredients"""
+    rng = random.Random(seed)
+    products = [
+        Product(
+            name=f"product-{i}",
+            quantity=rng.randint(0, 50_000),
+            unit=rng.choice(UNITS),
+            minimum_quantity=100
+        )
+        for i in range(n_products)
+    ]
+    db.add_all(products)
+    db.flush()
+
+    compatible = {"g": ["g", "kg"], "kg": ["g", "kg"], "ml": ["ml", "l"], "l": ["ml", "l"]}
+    for m in range(n_meals):
+        meal = Meal(name=f"meal-{m}", description="benchmark meal")
+        db.add(meal)
+        db.flush()
+        for product in rng.sample(products, min(ingredients_per_meal, len(products))):
+            unit = rng.choice(compatible.get(product.unit, [product.unit]))
+            quantity = rng.uniform(0.05, 1) if unit in ("kg", "l") else rng.randint(1, 300)
+            db.add(MealIngredient(meal_id=meal.id, product_id=product.id, quantity=quantity, unit=unit))
+    db.commit()
+    return products
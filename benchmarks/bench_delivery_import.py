@@ -0,0 +1,91 @@
+"""Restocking a whole delivery: one PUT per product vs one manifest import.
+
+The per-product path does what PUT /api/products/{id} does for every row
+(load, set, bump the catalog version, commit, refresh). The import path runs
+app.deliveries.apply_delivery on the same rows as a CSV manifest. Both end
+with identical stock, which the script checks.
+
+Usage: python -m benchmarks.bench_delivery_import [--url postgresql://...] [--rows 10000]
+"""
+import argparse
+import random
+import time
+from decimal import Decimal
+from sqlalchemy import insert, select
+from app.catalog import PRODUCTS, bump_catalog, ensure_catalog_versions
+from app.deliveries import apply_delivery, parse_manifest
+from app.models import Product
+from app.units import from_fixed, to_fixed
+from benchmarks._common import QueryCounter, make_session_factory
+
+def seed(Session, n_products: int, seed: int):
+    rng = random.Random(seed)
+    with Session() as db:
+        ensure_catalog_versions(db)
+        db.execute(insert(Product), [
+            {"name": f"product-{i}", "quantity": Decimal(rng.randint(0, 50_000)), "unit": rng.choice(["g", "kg", "ml", "l", "dona"])}
+            for i in range(n_products)
+        ])
+        db.commit()
+        return db.execute(select(Product.id, Product.name, Product.unit).order_by(Product.id)).all()
+
+def manifest(products, seed: int):
+    """(product, quantity, unit) per row, half of them in the other unit of the dimension"""
+    rng = random.Random(seed)
+    other = {"g": "kg", "kg": "g", "ml": "l", "l": "ml", "dona": "dona"}
+    rows = []
+    for product in products:
+        unit = rng.choice([product.unit, other[product.unit]])
+        quantity = Decimal(rng.randint(1, 5_000)) / (1000 if unit in ("kg", "l") else 1)
+        rows.append((product, quantity, unit))
+    return rows
+
+def per_product(Session, rows):
+    """The old way: one transaction per row"""
+    for product, quantity, unit in rows:
+        with Session() as db:
+            db_product = db.get(Product, product.id)
+            # PUT sends the new total; the client works it out in the product's unit
+            db_product.quantity = from_fixed(to_fixed(db_product.quantity, db_product.unit) + to_fixed(quantity, unit), db_product.unit)
+            bump_catalog(db, PRODUCTS)
+            db.commit()
+            db.refresh(db_product)
+
+def stock(Session):
+    with Session() as db:
+        return dict(db.execute(select(Product.id, Product.quantity)).all())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:////tmp/bench_delivery_import.db")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    results = {}
+    for label in ("per-product PUT", "manifest import"):
+        engine, Session = make_session_factory(args.url)
+        products = seed(Session, args.rows, args.seed)
+        rows = manifest(products, args.seed)
+        counter = QueryCounter(engine)
+        with counter.measure() as measured:
+            started = time.perf_counter()
+            if label == "per-product PUT":
+                per_product(Session, rows)
+            else:
+                body = "\n".join(["id,quantity,unit"] + [f"{product.id},{quantity},{unit}" for product, quantity, unit in rows])
+                with Session() as db:
+                    report = apply_delivery(db, parse_manifest(body.encode(), "text/csv"))
+                assert report["applied"] and report["failed"] == 0, report
+            elapsed = time.perf_counter() - started
+        results[label] = stock(Session)
+        print(f"{label:<16} {args.rows} rows  {elapsed:8.2f} s  {measured['queries']:6d} statements")
+        engine.dispose()
+
+    same = results["per-product PUT"] == results["manifest import"]
+    print("final stock identical:", same)
+    if not same:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""End-to-end load benchmark: every router, in process, on a seeded dataset.
+
+Seeds a fresh database with benchmarks.seed, then drives each endpoint of the
+auth, users, products, meals, servings and reports routers through the ASGI
+app with a fixed number of concurrent clients. For every endpoint it reports
+throughput, p50/p95/p99 latency, SQL statements per request and error count.
+
+--output writes the results as JSON (with the git commit) and --compare
+prints the change against an earlier results file, so two commits can be
+compared on the same dataset:
+
+    python -m benchmarks.bench_endpoints --scale medium --output before.json
+    git checkout <other commit>
+    python -m benchmarks.bench_endpoints --scale medium --output after.json --compare before.json
+
+Usage: python -m benchmarks.bench_endpoints [--url sqlite:///<tempdir>/bench_endpoints.db] [--scale small]
+                                            [--requests 200] [--concurrency 8] [--only products,servings]
+Requires httpx (same as FastAPI's TestClient).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+DEFAULT_URL = f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_endpoints.db')}"
+
+# app.database reads DATABASE_URL on import, so set it before anything imports the app
+_url_parser = argparse.ArgumentParser(add_help=False)
+_url_parser.add_argument("--url", default=DEFAULT_URL)
+os.environ["DATABASE_URL"] = _url_parser.parse_known_args()[0].url
+
+from benchmarks.seed import add_scale_arguments, resolve_scale, seed_dataset
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DEFAULT_URL)
+    add_scale_arguments(parser)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--hash-requests", type=int, default=20, help="requests for endpoints that run bcrypt")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", help="comma-separated routers to run (auth,users,products,meals,servings,reports)")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    return parser.parse_args()
+
+args = parse_args()
+
+from benchmarks._common import QueryCounter, make_session_factory, percentile
+
+_, SeedSession = make_session_factory(args.url)
+SCALE = resolve_scale(args)
+SEEDED_AT = time.perf_counter()
+DATASET = seed_dataset(SeedSession, seed=args.seed, **SCALE)
+SEED_SECONDS = time.perf_counter() - SEEDED_AT
+
+import httpx
+from anyio import to_thread
+from app.auth import create_access_token
+from app.database import DB_THREADPOOL_SIZE, engine
+from app.main import app
+
+def scenarios(dataset):
+    """(router, name, method, path(i), json(i) or None, uses bcrypt, on_response or None)"""
+    products = itertools.cycle(dataset["product_ids"])
+    meals = itertools.cycle(dataset["meal_ids"])
+    created_products = []
+    today = date.today()
+    unique = itertools.count()
+
+    def product_body(i):
+        return {"name": f"bench product {next(unique)}", "quantity": 5000, "unit": "g", "minimum_quantity": 100}
+
+    def meal_body(i):
+        return {"name": f"bench meal {next(unique)}", "description": "load test",
+                "ingredients": [{"product_id": next(products), "quantity": 1, "unit": "g"} for _ in range(4)]}
+
+    def user_body(i):
+        n = next(unique)
+        return {"username": f"load-{n}", "email": f"load-{n}@example.com", "password": "secret", "role": "cook"}
+
+    def remember_product(response):
+        created_products.append(response.json()["id"])
+
+    def delete_path(i):
+        # Only delete what the create scenario added, the seeded catalogue stays intact
+        return f"/api/products/{created_products.pop()}" if created_products else "/api/products/0"
+
+    return [
+        ("auth", "login", "POST", lambda i: "/api/auth/login",
+         lambda i: {"username": "bench-cook", "password": dataset["password"]}, True, None),
+        ("auth", "register", "POST", lambda i: "/api/auth/register", user_body, True, None),
+        ("users", "list", "GET", lambda i: "/api/users/", None, False, None),
+        ("users", "me", "GET", lambda i: "/api/users/me", None, False, None),
+        ("users", "create", "POST", lambda i: "/api/users/", user_body, True, None),
+        ("users", "toggle-active", "PUT", lambda i: f"/api/users/{dataset['users']['manager']}/toggle-active", None, False, None),
+        ("products", "list", "GET", lambda i: "/api/products/", None, False, None),
+        ("products", "search-page", "GET", lambda i: f"/api/products/?q={i % 10}&limit=50&sort=-quantity", None, False, None),
+        ("products", "get", "GET", lambda i: f"/api/products/{next(products)}", None, False, None),
+        ("products", "low-stock", "GET", lambda i: "/api/products/low-stock/alerts", None, False, None),
+        ("products", "create", "POST", lambda i: "/api/products/", product_body, False, remember_product),
+        ("products", "update", "PUT", lambda i: f"/api/products/{next(products)}",
+         lambda i: {"minimum_quantity": 100 + i % 7}, False, None),
+        ("products", "delete", "DELETE", delete_path, None, False, None),
+        ("meals", "list", "GET", lambda i: "/api/meals/", None, False, None),
+        ("meals", "get", "GET", lambda i: f"/api/meals/{next(meals)}", None, False, None),
+        ("meals", "create", "POST", lambda i: "/api/meals/", meal_body, False, None),
+        ("meals", "update", "PUT", lambda i: f"/api/meals/{next(meals)}",
+         lambda i: {"description": f"updated {i}"}, False, None),
+        ("servings", "serve", "POST", lambda i: "/api/servings/",
+         lambda i: {"meal_id": next(meals), "portions_served": 1 + i % 5}, False, None),
+        ("servings", "batch", "POST", lambda i: "/api/servings/batch",
+         lambda i: {"items": [{"meal_id": next(meals), "portions_served": 2} for _ in range(5)]}, False, None),
+        ("servings", "history", "GET", lambda i: "/api/servings/?limit=100", None, False, None),
+        ("servings", "history-by-meal", "GET", lambda i: f"/api/servings/?meal_id={next(meals)}&limit=100", None, False, None),
+        ("servings", "today", "GET", lambda i: "/api/servings/today", None, False, None),
+        ("reports", "monthly", "GET", lambda i: "/api/reports/monthly", None, False, None),
+        ("reports", "generate-monthly", "POST",
+         lambda i: f"/api/reports/generate-monthly/{today.year}/{today.month}", None, False, None),
+        ("reports", "dashboard-stats", "GET", lambda i: "/api/reports/dashboard-stats", None, False, None),
+        ("reports", "usage-analytics", "GET", lambda i: "/api/reports/usage-analytics", None, False, None),
+    ]
+
+async def run_endpoint(client, headers, counter, method, path, body, after, total):
+    latencies, statuses = [], {}
+    queue = iter(range(total))
+
+    async def worker():
+        for i in queue:
+            request_path, payload = path(i), body(i) if body else None
+            start = time.perf_counter()
+            response = await client.request(method, request_path, json=payload, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if after is not None and response.status_code < 400:
+                after(response)
+
+    with counter.measure() as queries:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(min(args.concurrency, total))))
+        elapsed = time.perf_counter() - started
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        "requests": total,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3),
+        "queries_per_request": round(queries["queries"] / total, 2),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'endpoint':<34} {'rps':>16} {'p50 ms':>20} {'p95 ms':>20} {'queries':>12}")
+    for name, current in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before is None:
+            continue
+
+        def delta(key):
+            old, new = before[key], current[key]
+            change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+            return f"{new:g} ({change})"
+
+        print(f"{name:<34} {delta('throughput_rps'):>16} {delta('p50_ms'):>20} {delta('p95_ms'):>20} "
+              f"{delta('queries_per_request'):>12}")
+
+async def main():
+    to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench-admin'})}"}
+    counter = QueryCounter(engine)
+    only = set(args.only.split(",")) if args.only else None
+    plan = scenarios(DATASET)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "dialect": engine.dialect.name,
+        "scale": SCALE,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "dataset": {key: DATASET[key] for key in ("servings", "usage_logs")} | {
+            "products": len(DATASET["product_ids"]), "meals": len(DATASET["meal_ids"])},
+        "seed_seconds": round(SEED_SECONDS, 2),
+        "endpoints": {},
+    }
+    print(f"dataset: {results['dataset']} ({engine.dialect.name}, seeded in {SEED_SECONDS:.1f}s), "
+          f"concurrency {args.concurrency}")
+    print(f"{'endpoint':<34} {'reqs':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'errors':>6}")
+    # Unhandled exceptions become 500s and are counted as errors instead of stopping the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for router, name, method, path, body, hashes, after in plan:
+            if only and router not in only:
+                continue
+            total = args.hash_requests if hashes else args.requests
+            stats = await run_endpoint(client, headers, counter, method, path, body, after, total)
+            label = f"{method} {router}/{name}"
+            results["endpoints"][label] = stats
+            print(f"{label:<34} {total:>5} {stats['throughput_rps']:>9.1f} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+                  f"{stats['p99_ms']:>9.1f} {stats['queries_per_request']:>8.1f} {stats['errors']:>6}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+if __name__ == "__main__":
+    asyncio.run(main())
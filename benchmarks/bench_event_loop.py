@@ -0,0 +1,102 @@
+"""Latency of GET /api/products/ while slow report queries are running.
+
+Two throwaway routes run the same slow query: one as an ``async def`` handler
+calling the sync Session (how every router used to be written), one as a plain
+``def`` handler (how they are written now, executed in the thread pool). While
+a stream of slow requests is in flight the script measures /api/products/.
+If the event loop is blocked, the fast endpoint's latency jumps to the slow
+query's duration.
+
+Usage: python -m benchmarks.bench_event_loop [--url sqlite:///<tempdir>/bench_loop.db]
+Requires httpx (same as FastAPI's TestClient).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_loop.db')}")
+    parser.add_argument("--seconds", type=float, default=5.0, help="measuring window per scenario")
+    parser.add_argument("--slow-concurrency", type=int, default=4)
+    return parser.parse_args()
+
+args = parse_args()
+os.environ["DATABASE_URL"] = args.url
+
+import httpx
+from fastapi import Depends
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.auth import create_access_token
+from app.database import SessionLocal, engine, get_db
+from app.main import app
+from app.models import Product, User
+from benchmarks._common import percentile
+
+def slow_query(db: Session):
+    if engine.dialect.name == "postgresql":
+        return db.execute(text("SELECT pg_sleep(0.3)")).scalar()
+    return db.execute(text(
+        "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 300000) SELECT count(*) FROM c"
+    )).scalar()
+
+@app.get("/bench/slow-async")
+async def slow_async(db: Session = Depends(get_db)):
+    return {"rows": slow_query(db)}
+
+@app.get("/bench/slow-sync")
+def slow_sync(db: Session = Depends(get_db)):
+    return {"rows": slow_query(db)}
+
+def seed():
+    with SessionLocal() as db:
+        if not db.query(User).filter(User.username == "bench").first():
+            db.add(User(username="bench", email="bench@example.com", password_hash="-", role="admin"))
+            db.add_all([Product(name=f"product-{i}", quantity=1000, unit="g") for i in range(200)])
+            db.commit()
+    return create_access_token({"sub": "bench"})
+
+async def measure(client, headers, slow_path):
+    stop = asyncio.Event()
+    slow_latencies = []
+
+    async def slow_worker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await client.get(slow_path, headers=headers)
+            slow_latencies.append((time.perf_counter() - start) * 1000)
+
+    workers = [asyncio.create_task(slow_worker()) for _ in range(args.slow_concurrency)] if slow_path else []
+    await asyncio.sleep(0.05)
+
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get("/api/products/", headers=headers)
+        assert response.status_code == 200, response.text
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+
+    stop.set()
+    await asyncio.gather(*workers)
+    return latencies, slow_latencies
+
+async def main():
+    token = seed()
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        print(f"{'background load':<32} {'requests':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} | slow query p50")
+        for label, path in [("none", None), ("slow queries, async def (old)", "/bench/slow-async"),
+                            ("slow queries, def (threadpool)", "/bench/slow-sync")]:
+            latencies, slow = await measure(client, headers, path)
+            slow_p50 = f"{percentile(slow, 50):.0f} ms" if slow else "-"
+            print(f"{label:<32} {len(latencies):>8} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+                  f"{percentile(latencies, 99):>8.1f} {max(latencies):>8.1f} | {slow_p50}")
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
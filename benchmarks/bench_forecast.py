@@ -0,0 +1,160 @@
+"""Whole-catalog stock forecast (app.forecast): accuracy and cost per request.
+
+Seeds products whose daily usage follows a known rate and a weekday pattern
+(Monday to Friday only, with noise) in the daily usage rollup, then
+
+- checks that the forecast daily rate and weekday usage are close to the
+  true ones and that days-until-stockout matches stock / usage,
+- times the first forecast (fitting every model from the history), a repeat
+  request (cached), a request after a serving changed a few products' stock
+  (only those are forecast again), a request with other parameters (every
+  product forecast from the fitted models) and the first request of a new
+  day (models stepped forward by one day), against fitting each product from
+  its own history query.
+
+Usage: python -m benchmarks.bench_forecast [--url sqlite:////tmp/bench_forecast.db] [--products 2000]
+"""
+import argparse
+import random
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+from sqlalchemy import insert, select, update
+from app.catalog import PRODUCTS, bump_catalog, ensure_catalog_versions
+from app.forecast import FORECAST_HISTORY_DAYS, UsageModel, forecast_cache
+from app.models import DailyProductUsageRollup, Product
+from benchmarks._common import QueryCounter, make_session_factory, timed
+
+# Share of the weekly usage per weekday, Monday first: closed at weekends
+PATTERN = [1.1, 1.0, 1.0, 0.9, 1.0, 0.0, 0.0]
+
+def seed(Session, n_products: int, today: date, rng: random.Random) -> dict:
+    """Products with usage up to and including today; returns {product_id: true daily rate in g}"""
+    days = [today - timedelta(days=offset) for offset in range(FORECAST_HISTORY_DAYS, -1, -1)]
+    with Session() as db:
+        ensure_catalog_versions(db)
+        rates = [rng.uniform(100, 5_000) for _ in range(n_products)]
+        db.execute(insert(Product), [
+            {"name": f"product-{i}", "quantity": Decimal(round(rate * rng.uniform(1, 30))), "unit": "g", "minimum_quantity": 100}
+            for i, rate in enumerate(rates)
+        ])
+        ids = db.execute(select(Product.id).order_by(Product.id)).scalars().all()
+        rows = []
+        for product_id, rate in zip(ids, rates):
+            for day in days:
+                share = PATTERN[day.weekday()]
+                if share:
+                    # Half of the products are logged in kg
+                    quantity = rate * 7 / sum(PATTERN) * share * rng.uniform(0.8, 1.2)
+                    unit = "kg" if product_id % 2 else "g"
+                    rows.append({
+                        "day": day, "product_id": product_id, "unit": unit,
+                        "quantity_used": Decimal(str(round(quantity / (1000 if unit == "kg" else 1), 3))), "uses_count": 1
+                    })
+        db.execute(insert(DailyProductUsageRollup), rows)
+        db.commit()
+        return dict(zip(ids, rates))
+
+def check(forecasts: list, rates: dict) -> list:
+    failures = []
+    weekly = sum(PATTERN)
+    for forecast in forecasts:
+        rate = rates[forecast["product_id"]]
+        if abs(forecast["daily_usage"] - rate) > 0.12 * rate:
+            failures.append(("daily usage", forecast["product_id"], forecast["daily_usage"], rate))
+        expected = [rate * 7 / weekly * share for share in PATTERN]
+        if any(abs(got - want) > 0.3 * rate for got, want in zip(forecast["usage_by_weekday"], expected)):
+            failures.append(("weekday usage", forecast["product_id"], forecast["usage_by_weekday"], expected))
+        days = forecast["days_until_stockout"]
+        # Stock / average daily usage, give or take the weekday pattern
+        if days is None or abs(days - forecast["quantity"] / rate) > 3 + 0.15 * forecast["quantity"] / rate:
+            failures.append(("days until stockout", forecast["product_id"], days, forecast["quantity"] / rate))
+    return failures
+
+def per_product(db, today: date):
+    """The naive way: one history query and one fit per product"""
+    date_from = today - timedelta(days=FORECAST_HISTORY_DAYS)
+    results = []
+    for product in db.execute(select(Product.id, Product.quantity)).all():
+        rows = db.execute(
+            select(DailyProductUsageRollup.day, DailyProductUsageRollup.quantity_used, DailyProductUsageRollup.unit)
+            .where(DailyProductUsageRollup.product_id == product.id, DailyProductUsageRollup.day >= date_from,
+                   DailyProductUsageRollup.day < today)
+            .order_by(DailyProductUsageRollup.day)
+        ).all()
+        used = {}
+        for day, quantity, unit in rows:
+            used[day] = used.get(day, 0.0) + float(quantity) * (1000 if unit == "kg" else 1)
+        if used:
+            first = min(used)
+            model = UsageModel(first.weekday(), [used.get(first + timedelta(days=i), 0.0) for i in range((today - first).days)])
+            results.append((product.id, model.days_left(today, 0.0, float(product.quantity))))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:////tmp/bench_forecast.db")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # A Monday, so "today" has usage and the weekday pattern is exercised from its start
+    today = date.today() - timedelta(days=date.today().weekday())
+    engine, Session = make_session_factory(args.url)
+    rates = seed(Session, args.products, today, random.Random(args.seed))
+    counter = QueryCounter(engine)
+    forecast_cache.clear()
+
+    with Session() as db:
+        with counter.measure() as cold_queries:
+            cold = timed(lambda: forecast_cache.get(db, today=today), repeat=1)
+        failures = check(forecast_cache.get(db, today=today), rates)
+
+        with counter.measure() as warm_queries:
+            warm = timed(lambda: forecast_cache.get(db, today=today), repeat=50)
+
+        product_ids = list(rates)
+        rng = random.Random(args.seed)
+
+        def after_serving():
+            # What a serving does to the tables the forecast reads: a few products' stock and today's usage
+            for product_id in rng.sample(product_ids, 5):
+                db.execute(update(Product).where(Product.id == product_id).values(quantity=Product.quantity - 1))
+                db.execute(
+                    update(DailyProductUsageRollup)
+                    .where(DailyProductUsageRollup.product_id == product_id, DailyProductUsageRollup.day == today)
+                    .values(quantity_used=DailyProductUsageRollup.quantity_used + 1)
+                )
+            bump_catalog(db, PRODUCTS)
+            db.commit()
+        changed = []
+        with counter.measure() as changed_queries:
+            for _ in range(10):
+                after_serving()
+                changed.append(timed(lambda: forecast_cache.get(db, today=today), repeat=1))
+        changed = min(changed)
+
+        with counter.measure() as other_queries:
+            other = timed(lambda: forecast_cache.get(db, lead_time_days=5, today=today), repeat=1)
+
+        tomorrow = today + timedelta(days=1)
+        with counter.measure() as next_day_queries:
+            next_day = timed(lambda: forecast_cache.get(db, today=tomorrow), repeat=1)
+
+        with counter.measure() as naive_queries:
+            naive = timed(lambda: per_product(db, today), repeat=1)
+
+    print(f"{args.products} products, {FORECAST_HISTORY_DAYS} days of history: {len(failures)} inaccurate forecasts")
+    for failure in failures[:10]:
+        print("  ", failure)
+    print(f"first request (fit every model)     {cold:9.2f} ms  {cold_queries['queries']:5d} statements")
+    print(f"repeat request (cached)             {warm:9.3f} ms  {warm_queries['queries'] / 50:5.0f} statements")
+    print(f"after a serving (5 products again)  {changed:9.2f} ms  {changed_queries['queries'] / 10 - 11:5.0f} statements")
+    print(f"other parameters (all products)     {other:9.2f} ms  {other_queries['queries']:5d} statements")
+    print(f"first request of a new day (step)   {next_day:9.2f} ms  {next_day_queries['queries']:5d} statements")
+    print(f"one query and fit per product       {naive:9.2f} ms  {naive_queries['queries']:5d} statements")
+    engine.dispose()
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Latency of other endpoints while many users log in at once.
+
+Runs a burst of concurrent POST /api/auth/login requests (real bcrypt hashes)
+and measures GET /api/products/ during the burst, first with bcrypt running
+inline in the request threads (the old behaviour) and then through the bounded
+PasswordHasher executor.
+
+Usage: python -m benchmarks.bench_login_storm [--logins 80] [--url sqlite:///<tempdir>/bench_login.db]
+Requires httpx (same as FastAPI's TestClient).
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_login.db')}")
+    parser.add_argument("--logins", type=int, default=40, help="concurrent logins in the storm")
+    parser.add_argument("--workers", type=int, default=4, help="PasswordHasher workers for the bounded run")
+    parser.add_argument("--queue", type=int, default=8, help="PasswordHasher queue for the bounded run")
+    return parser.parse_args()
+
+args = parse_args()
+os.environ["DATABASE_URL"] = args.url
+
+import httpx
+from anyio import to_thread
+from app import auth
+from app.auth import PasswordHasher, create_access_token, pwd_context
+from app.database import DB_THREADPOOL_SIZE, SessionLocal
+from app.main import app
+from app.models import Product, User
+from benchmarks._common import percentile
+
+def seed():
+    with SessionLocal() as db:
+        if not db.query(User).filter(User.username == "storm").first():
+            db.add(User(username="storm", email="storm@example.com", password_hash=pwd_context.hash("secret"), role="admin"))
+            db.add_all([Product(name=f"product-{i}", quantity=1000, unit="g") for i in range(100)])
+            db.commit()
+    return {"Authorization": f"Bearer {create_access_token({'sub': 'storm'})}"}
+
+async def storm(client, headers):
+    statuses = {}
+    latencies = []
+
+    async def login():
+        response = await client.post("/api/auth/login", json={"username": "storm", "password": "secret"})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    async def probe(stop):
+        while not stop.is_set():
+            start = time.perf_counter()
+            await client.get("/api/products/", headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            await asyncio.sleep(0.01)
+
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    return latencies, statuses, elapsed
+
+async def main():
+    to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
+    headers = seed()
+    scenarios = [
+        ("bcrypt inline (old)", PasswordHasher(workers=0, max_queued=0)),
+        (f"executor {args.workers}+{args.queue} queued", PasswordHasher(workers=args.workers, max_queued=args.queue)),
+    ]
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        print(f"{args.logins} concurrent logins, thread pool {DB_THREADPOOL_SIZE}")
+        print(f"{'mode':<28} {'storm s':>8} {'probes':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} | login statuses")
+        for label, hasher in scenarios:
+            auth.password_hasher = hasher
+            latencies, statuses, elapsed = await storm(client, headers)
+            print(f"{label:<28} {elapsed:>8.2f} {len(latencies):>7} {percentile(latencies, 50):>8.1f} "
+                  f"{percentile(latencies, 99):>8.1f} {max(latencies):>8.1f} | {statuses}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
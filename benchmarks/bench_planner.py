@@ -0,0 +1,116 @@
+"""Menu planner (app.planner): plan quality and time at catalog scale.
+
+First compares the planner with the exact optimum (found by exhaustive
+search) on small random catalogs. Then seeds a catalog with hundreds of meals
+and products and times GET /api/meals/plan's work (app.planner.plan_menu)
+with a cold and a warm portion cache, for the largest plan and for a
+head-count with variety limits. Every plan is checked against the stock;
+exits with code 1 if one takes more than there is.
+
+Usage: python -m benchmarks.bench_planner [--url sqlite:////tmp/bench_planner.db] [--meals 500] [--products 300]
+"""
+import argparse
+import random
+import statistics
+import sys
+from sqlalchemy import select
+from app.models import Meal, MealIngredient, Product
+from app.planner import plan_menu, solve
+from app.portions import portion_cache
+from app.units import to_fixed
+from benchmarks._common import QueryCounter, make_session_factory, seed_catalog, timed
+
+def exact(requirements: dict, stock: dict) -> int:
+    """Most portions any plan allows, by exhaustive search with a simple bound"""
+    meals = list(requirements)
+    best = 0
+
+    def search(index: int, remaining: dict, total: int):
+        nonlocal best
+        if index == len(meals):
+            best = max(best, total)
+            return
+        needs = requirements[meals[index]]
+        most = min(remaining[product_id] // amount for product_id, amount in needs.items())
+        # Even taking every later meal on its own stock can't beat the best plan
+        rest = sum(min(stock[product_id] // amount for product_id, amount in requirements[meal_id].items())
+                   for meal_id in meals[index + 1:])
+        if total + most + rest <= best:
+            return
+        for count in range(most, -1, -1):
+            left = dict(remaining)
+            for product_id, amount in needs.items():
+                left[product_id] -= amount * count
+            search(index + 1, left, total + count)
+
+    search(0, dict(stock), 0)
+    return best
+
+def quality(cases: int, rng: random.Random):
+    ratios = []
+    for _ in range(cases):
+        products = rng.randint(2, 5)
+        stock = {product_id: rng.randint(5, 60) for product_id in range(products)}
+        requirements = {
+            meal_id: {product_id: rng.randint(1, 10) for product_id in rng.sample(range(products), rng.randint(1, products))}
+            for meal_id in range(rng.randint(2, 5))
+        }
+        best = exact(requirements, stock)
+        if best:
+            ratios.append(sum(solve(requirements, stock).values()) / best)
+    print(f"{len(ratios)} small catalogs: optimal plan in {sum(1 for ratio in ratios if ratio == 1)}, "
+          f"mean {statistics.mean(ratios):.2%} of the optimum, worst {min(ratios):.2%}")
+
+def overused(db, plan: dict) -> list:
+    """Products the plan takes more of than there is, worked out from the tables again"""
+    stock = {row.id: to_fixed(row.quantity, row.unit) for row in db.execute(select(Product.id, Product.quantity, Product.unit))}
+    portions = {meal["meal_id"]: meal["portions"] for meal in plan["meals"]}
+    used = {}
+    for row in db.execute(select(MealIngredient).where(MealIngredient.meal_id.in_(list(portions)))).scalars():
+        used[row.product_id] = used.get(row.product_id, 0) + to_fixed(row.quantity, row.unit) * portions[row.meal_id]
+    return [(product_id, amount, stock[product_id]) for product_id, amount in used.items() if amount > stock[product_id]]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:////tmp/bench_planner.db")
+    parser.add_argument("--meals", type=int, default=500)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--ingredients", type=int, default=8)
+    parser.add_argument("--cases", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    quality(args.cases, random.Random(args.seed))
+
+    engine, Session = make_session_factory(args.url)
+    counter = QueryCounter(engine)
+    failures = []
+    with Session() as db:
+        seed_catalog(db, n_products=args.products, n_meals=args.meals, ingredients_per_meal=args.ingredients, seed=args.seed)
+        single = max(plan_menu(db, meal_ids=[meal_id])["total_portions"] for meal_id in db.execute(select(Meal.id)).scalars())
+        scenarios = [
+            ("as many as possible", {}),
+            ("250 children, <= 20% per meal, <= 8 meals", {"target": 250, "max_share": 0.2, "max_meals": 8}),
+        ]
+        for label, options in scenarios:
+            def cold():
+                portion_cache.clear()
+                plan_menu(db, **options)
+            with counter.measure() as cold_queries:
+                cold_ms = timed(cold, repeat=3)
+            plan_menu(db, **options)
+            with counter.measure() as warm_queries:
+                warm_ms = timed(lambda: plan_menu(db, **options), repeat=5)
+            plan = plan_menu(db, **options)
+            failures += overused(db, plan)
+            print(f"{label}: {plan['total_portions']} portions from {len(plan['meals'])} of {plan['candidate_meals']} meals "
+                  f"(target met: {plan['target_met']}); cold {cold_ms:.1f} ms, {cold_queries['queries'] // 3} statements; "
+                  f"warm {warm_ms:.1f} ms, {warm_queries['queries'] // 5} statements")
+        print(f"best single meal: {single} portions")
+    engine.dispose()
+    if failures:
+        print("plans take more than the stock:", failures[:10])
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
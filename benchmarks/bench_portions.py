@@ -0,0 +1,73 @@
+"""Compare the per-ingredient portion lookups with the batched matrix engine.
+
+Usage: python -m benchmarks.bench_portions [--url sqlite:///bench.db]
+"""
+import argparse
+from app.models import Meal, Product
+from app.portions import compute_possible_portions, ingredient_dicts, load_ingredient_matrix
+from app.units import can_make_portions
+from benchmarks._common import QueryCounter, make_session_factory, seed_catalog, timed
+
+def legacy_get_meals(db):
+    """The old get_meals loop: one Product query per ingredient, twice"""
+    result = []
+    for meal in db.query(Meal).filter(Meal.is_active == True).all():
+        min_portions = float('inf')
+        for ingredient in meal.ingredients:
+            product = db.query(Product).filter(Product.id == ingredient.product_id).first()
+            if product and product.quantity > 0:
+                min_portions = min(min_portions, can_make_portions(
+                    product.quantity, product.unit, ingredient.quantity, ingredient.unit
+                ))
+            else:
+                min_portions = 0
+                break
+        portions = int(min_portions) if min_portions != float('inf') else 0
+        names = []
+        for ingredient in meal.ingredients:
+            product = db.query(Product).filter(Product.id == ingredient.product_id).first()
+            names.append(product.name if product else "Unknown")
+        result.append((meal.id, portions))
+    return result
+
+def batched_get_meals(db):
+    meals = db.query(Meal).filter(Meal.is_active == True).all()
+    matrix = load_ingredient_matrix(db, active_only=True)
+    portions = compute_possible_portions(matrix, [meal.id for meal in meals])
+    for meal in meals:
+        ingredient_dicts(matrix.get(meal.id, []))
+    return [(meal.id, portions[meal.id]) for meal in meals]
+
+def run(url: str, sizes):
+    print(f"{'meals':>6} {'ingr':>5} | {'legacy ms':>10} {'queries':>8} | {'batched ms':>10} {'queries':>8} | speedup")
+    for n_meals, n_ingredients in sizes:
+        engine, Session = make_session_factory(url)
+        counter = QueryCounter(engine)
+        with Session() as db:
+            seed_catalog(db, n_products=max(200, n_ingredients * 4), n_meals=n_meals, ingredients_per_meal=n_ingredients)
+
+        with Session() as db:
+            with counter.measure() as legacy_q:
+                legacy = legacy_get_meals(db)
+            db.expire_all()
+            with counter.measure() as batched_q:
+                batched = batched_get_meals(db)
+            assert sorted(legacy) == sorted(batched), "batched engine disagrees with the legacy loop"
+
+        def fresh(fn):
+            def call():
+                with Session() as db:
+                    fn(db)
+            return call
+
+        legacy_ms = timed(fresh(legacy_get_meals), repeat=3)
+        batched_ms = timed(fresh(batched_get_meals), repeat=3)
+        print(f"{n_meals:>6} {n_ingredients:>5} | {legacy_ms:>10.1f} {legacy_q['queries']:>8} | "
+              f"{batched_ms:>10.1f} {batched_q['queries']:>8} | {legacy_ms / batched_ms:>6.1f}x")
+        engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="sqlite://", help="database URL (a fresh schema is created)")
+    args = parser.parse_args()
+    run(args.url, [(50, 6), (150, 6), (150, 10), (500, 10), (1000, 10)])
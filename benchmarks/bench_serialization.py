@@ -0,0 +1,117 @@
+"""Response encoding for large listings: FastAPI's response_model path vs app.serialization.
+
+For 1k and 10k rows of products (ORM objects), meals and servings (dicts
+built by the handlers), times turning the handler's return value into the
+response body:
+
+- current: what FastAPI does with a response_model, validating in the thread
+  pool, serializing the models back to Python, then JSONResponse (stdlib json);
+- adapter: app.serialization.model_response, a prebuilt TypeAdapter that
+  validates and writes JSON in pydantic-core;
+- orjson: app.serialization.json_response, no validation, orjson encoding
+  (products go through attribute_rows first).
+
+Every new body is checked to decode to the same JSON as the current one.
+
+Usage: python -m benchmarks.bench_serialization [--rows 1000,10000]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from app.models import Product
+from app.schemas import MealResponse, MealServingResponse, ProductResponse
+from app.serialization import attribute_rows, json_response, model_response
+from benchmarks._common import make_session_factory, timed
+
+PRODUCT_ADAPTER = TypeAdapter(List[ProductResponse])
+
+def load_products(n: int, rng: random.Random) -> list:
+    engine, Session = make_session_factory("sqlite://")
+    with Session() as db:
+        db.execute(insert(Product), [
+            {"name": f"product-{i}", "quantity": Decimal(rng.randint(0, 50_000)) / 1000, "unit": rng.choice(["g", "kg", "l", "dona"]),
+             "minimum_quantity": Decimal(100), "delivery_date": None if i % 3 else datetime(2026, 1, 1).date() + timedelta(days=i % 300)}
+            for i in range(n)
+        ])
+        db.commit()
+        # Loaded and detached, as the handler's objects are once it returns
+        products = db.execute(select(Product)).scalars().all()
+    engine.dispose()
+    return products
+
+def meal_rows(n: int, rng: random.Random) -> list:
+    now = datetime.now()
+    return [
+        {
+            "id": i, "name": f"meal-{i}", "description": "benchmark meal", "is_active": True, "created_at": now,
+            "ingredients": [
+                {"id": i * 5 + k, "product_id": rng.randint(1, 500), "quantity": float(rng.randint(1, 300)), "unit": "g",
+                 "product_name": f"product-{k}"}
+                for k in range(5)
+            ],
+            "possible_portions": rng.randint(0, 400)
+        }
+        for i in range(n)
+    ]
+
+def serving_rows(n: int, rng: random.Random) -> list:
+    now = datetime.now()
+    return [
+        {"id": i, "meal_id": rng.randint(1, 100), "meal_name": f"meal-{i % 100}", "user_id": 1, "username": "cook",
+         "portions_served": rng.randint(1, 40), "served_at": now - timedelta(minutes=i), "notes": None}
+        for i in range(n)
+    ]
+
+def current_path(loop, model, content):
+    """The handler returned ``content`` from a sync def route with response_model=List[model]"""
+    field = create_response_field(name="Response", type_=List[model])
+
+    async def run():
+        serialized = await serialize_response(field=field, response_content=content, is_coroutine=False)
+        return JSONResponse(serialized).body
+    return lambda: loop.run_until_complete(run())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1000,10000")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    mismatches = 0
+    print(f"{'listing':<10} {'rows':>6} {'current ms':>11} {'new ms':>8} {'speed-up':>9}  path")
+    for n in [int(value) for value in args.rows.split(",")]:
+        rng = random.Random(args.seed)
+        products = load_products(n, rng)
+        cases = [
+            ("products", ProductResponse, products, "adapter", lambda rows: model_response(PRODUCT_ADAPTER, rows).body),
+            ("products", ProductResponse, products, "orjson", lambda rows: json_response(attribute_rows(rows, ProductResponse)).body),
+            ("meals", MealResponse, meal_rows(n, rng), "orjson", lambda rows: json_response(rows).body),
+            ("servings", MealServingResponse, serving_rows(n, rng), "orjson", lambda rows: json_response(rows).body),
+            ("servings", MealServingResponse, serving_rows(n, rng), "adapter",
+             lambda rows, adapter=TypeAdapter(List[MealServingResponse]): model_response(adapter, rows).body),
+        ]
+        for label, model, rows, path, new in cases:
+            current = current_path(loop, model, rows)
+            if json.loads(current()) != json.loads(new(rows)):
+                mismatches += 1
+                print(f"{label}: the new body differs from the current one")
+            repeat = 20 if n <= 1000 else 5
+            current_ms = timed(current, repeat=repeat)
+            new_ms = timed(lambda: new(rows), repeat=repeat)
+            print(f"{label:<10} {n:>6} {current_ms:>11.2f} {new_ms:>8.2f} {current_ms / new_ms:>8.1f}x  {path}")
+    loop.close()
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
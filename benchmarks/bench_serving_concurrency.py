@@ -0,0 +1,137 @@
+"""Concurrency stress for the locked serving path (app.stock.serve).
+
+Several threads serve meals that share scarce ingredients until the stock runs
+out. The run reports throughput and checks that no product went negative,
+that every deducted gram is accounted for in product_usage_log and that the
+stock ledger agrees with Product.quantity.
+
+Usage: python -m benchmarks.bench_serving_concurrency [--url postgresql://...] [--threads 16]
+
+SQLite ignores FOR UPDATE, so for SQLite URLs the engine opens every
+transaction with BEGIN IMMEDIATE, which gives the same one-writer-at-a-time
+guarantee the row locks give on Postgres.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from fastapi import HTTPException
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import OperationalError
+from app.ledger import projection_drift
+from app.models import Meal, MealIngredient, Product, ProductUsageLog, User
+from app.stock import serve
+from app.units import to_fixed
+from benchmarks._common import make_session_factory, percentile
+
+def use_immediate_transactions(engine):
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+def seed(Session, n_meals: int):
+    with Session() as db:
+        user = User(username="bench", email="bench@example.com", password_hash="-", role="cook")
+        shared = [
+            Product(name="salt", quantity=Decimal("6.000"), unit="kg"),
+            Product(name="oil", quantity=Decimal("15.000"), unit="l"),
+            Product(name="flour", quantity=Decimal("60.000"), unit="kg"),
+            Product(name="eggs", quantity=Decimal("1500"), unit="dona"),
+        ]
+        db.add(user)
+        db.add_all(shared)
+        db.flush()
+        rng = random.Random(7)
+        for m in range(n_meals):
+            meal = Meal(name=f"meal-{m}")
+            db.add(meal)
+            db.flush()
+            db.add_all([
+                MealIngredient(meal_id=meal.id, product_id=shared[0].id, quantity=rng.randint(2, 10), unit="g"),
+                MealIngredient(meal_id=meal.id, product_id=shared[1].id, quantity=rng.randint(5, 30), unit="ml"),
+                MealIngredient(meal_id=meal.id, product_id=shared[2].id, quantity=rng.choice(["0.05", "0.1"]), unit="kg"),
+                MealIngredient(meal_id=meal.id, product_id=shared[3].id, quantity=rng.randint(1, 2), unit="dona"),
+            ])
+        db.commit()
+        initial = {p.id: (p.quantity, p.unit) for p in db.query(Product)}
+        return user.id, [m.id for m in db.query(Meal)], initial
+
+def run(url: str, threads: int, n_meals: int, duration: float):
+    engine, Session = make_session_factory(url)
+    if engine.dialect.name == "sqlite":
+        use_immediate_transactions(engine)
+    user_id, meal_ids, initial = seed(Session, n_meals)
+
+    latencies, counters, lock = [], {"served": 0, "rejected": 0, "retried": 0}, threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            with Session() as db:
+                try:
+                    serve(db, rng.choice(meal_ids), user_id, rng.randint(1, 5))
+                    outcome = "served"
+                except HTTPException:
+                    outcome = "rejected"
+                except OperationalError:
+                    db.rollback()
+                    outcome = "retried"
+            with lock:
+                counters[outcome] += 1
+                if outcome == "served":
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with Session() as db:
+        final = {p.id: p.quantity for p in db.query(Product)}
+        used = db.execute(
+            select(ProductUsageLog.product_id, ProductUsageLog.unit, func.sum(ProductUsageLog.quantity_used))
+            .group_by(ProductUsageLog.product_id, ProductUsageLog.unit)
+        ).all()
+        ledger_drift = projection_drift(db)
+
+    negative = {pid: qty for pid, qty in final.items() if qty < 0}
+    # In thousandths of the base unit, like the ledger
+    consumed = {}
+    for product_id, unit, total in used:
+        consumed[product_id] = consumed.get(product_id, 0) + to_fixed(total, unit)
+    drift = {
+        pid: to_fixed(initial[pid][0], unit) - to_fixed(final[pid], unit) - consumed.get(pid, 0)
+        for pid, (_, unit) in initial.items()
+    }
+
+    print(f"dialect={engine.dialect.name} threads={threads} meals={n_meals} duration={elapsed:.1f}s")
+    print(f"served={counters['served']} rejected(out of stock)={counters['rejected']} lock errors={counters['retried']}")
+    attempts = counters["served"] + counters["rejected"]
+    print(f"throughput={counters['served'] / elapsed:.1f} servings/s ({attempts / elapsed:.1f} requests/s)  "
+          f"p50={percentile(latencies, 50):.1f}ms p95={percentile(latencies, 95):.1f}ms p99={percentile(latencies, 99):.1f}ms")
+    print(f"final stock: {final}")
+    assert not negative, f"stock went negative: {negative}"
+    assert all(abs(d) < 10 for d in drift.values()), f"stock and usage log disagree: {drift}"
+    assert not ledger_drift, f"Product.quantity and the stock ledger disagree: {ledger_drift}"
+    print("OK: no negative stock, usage log matches deductions, stock ledger matches Product.quantity")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_serving.db')}")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--meals", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    run(args.url, args.threads, args.meals, args.duration)
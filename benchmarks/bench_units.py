@@ -0,0 +1,59 @@
+"""Micro-benchmark for the fixed-point unit engine (app.units).
+
+Times can_make_portions against the float/Decimal implementation it replaced,
+and max_portions over 8-ingredient meals, on the random quantities
+tests/test_units.py checks for exactness.
+
+Usage: python -m benchmarks.bench_units [--cases 200000] [--seed 7]
+"""
+import argparse
+import random
+import time
+from app.units import FACTORS, can_make_portions, max_portions
+from tests.test_units import random_quantity
+
+def legacy_convert(quantity, unit):
+    return quantity * FACTORS.get(unit, 1)
+
+def legacy_can_make_portions(product_quantity, product_unit, needed_quantity, needed_unit):
+    """app.portions.can_make_portions before the unit registry"""
+    product_base = legacy_convert(product_quantity, product_unit)
+    needed_base = legacy_convert(needed_quantity, needed_unit)
+    if product_unit in ['g', 'kg'] and needed_unit in ['g', 'kg']:
+        return int(product_base // needed_base) if needed_base > 0 else 0
+    elif product_unit in ['ml', 'l'] and needed_unit in ['ml', 'l']:
+        return int(product_base // needed_base) if needed_base > 0 else 0
+    elif product_unit == needed_unit and product_unit in ['dona', 'paket', 'quti']:
+        return int(product_quantity // needed_quantity) if needed_quantity > 0 else 0
+    return 0
+
+def benchmark(args):
+    rng = random.Random(args.seed)
+    pairs = [("kg", "g"), ("g", "g"), ("l", "ml"), ("dona", "dona")]
+    cases = []
+    for _ in range(args.cases):
+        product_unit, needed_unit = rng.choice(pairs)
+        cases.append((random_quantity(rng), product_unit, random_quantity(rng, small=True), needed_unit))
+
+    for label, function in (("previous", legacy_can_make_portions), ("fixed-point", can_make_portions)):
+        started = time.perf_counter()
+        for case in cases:
+            function(*case)
+        elapsed = time.perf_counter() - started
+        print(f"can_make_portions {label:<12} {elapsed / len(cases) * 1e9:8.0f} ns/call")
+
+    meals = [cases[i:i + 8] for i in range(0, len(cases), 8)]
+    started = time.perf_counter()
+    for lines in meals:
+        max_portions(lines)
+    elapsed = time.perf_counter() - started
+    print(f"max_portions (8 ingredients)  {elapsed / len(meals) * 1e6:8.2f} us/meal")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=7)
+    benchmark(parser.parse_args())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Read benchmark for the stock ledger (app.ledger), after a consistency check.
+
+Runs the random write mix of tests/test_ledger.py for --steps transactions,
+with a small snapshot interval, and exits with code 1 if the projection, the
+point-in-time stock or the position reads disagree with the ledger. Then gives
+a meal's products a long history and times reading their stock with a warm
+cache, from the latest snapshot, and by summing the whole ledger.
+
+Usage: python -m benchmarks.check_ledger [--url sqlite:////tmp/check_ledger.db] [--steps 600]
+"""
+import argparse
+import random
+import sys
+from datetime import datetime
+from sqlalchemy import func, insert, select
+from app import ledger
+from app.ledger import read_positions, snapshot_all, stock_cache
+from app.models import Meal, StockMovement, StockSnapshot
+from app.stock import load_demand
+from benchmarks._common import make_session_factory, timed
+from tests.test_ledger import mismatches, run, seed_ledger
+
+def check(Session, history) -> int:
+    failures = mismatches(Session, history)
+    with Session() as db:
+        movements = db.execute(select(func.count(StockMovement.id))).scalar()
+        snapshots = db.execute(select(func.count(StockSnapshot.id))).scalar()
+    print(f"{len(history)} transactions, {movements} movements, {snapshots} snapshots: {len(failures)} mismatches")
+    for failure in failures[:20]:
+        print("  ", failure)
+    return 1 if failures else 0
+
+def benchmark(Session, history_length: int):
+    """Times reading a meal's stock once its products have a long history"""
+    with Session() as db:
+        meal_id = db.execute(select(Meal.id)).scalars().first()
+        product_ids = sorted({row.product_id for row in load_demand(db, [meal_id])[meal_id]})
+        # Movements that cancel out, so the stock itself doesn't change
+        now = datetime.now()
+        db.execute(insert(StockMovement), [
+            {"product_id": product_id, "kind": "correction", "amount": 1 if i % 2 else -1, "created_at": now}
+            for product_id in product_ids for i in range(history_length // len(product_ids) // 2 * 2)
+        ])
+        db.commit()
+        snapshot_all(db)
+        length = db.execute(select(func.count(StockMovement.id)).where(StockMovement.product_id.in_(product_ids))).scalar()
+
+        stock_cache.store(read_positions(db, product_ids))
+        warm = timed(lambda: read_positions(db, product_ids), repeat=50)
+
+        def cold():
+            stock_cache.clear()
+            read_positions(db, product_ids)
+        cold_ms = timed(cold, repeat=50)
+        full_sum = timed(lambda: db.execute(
+            select(StockMovement.product_id, func.sum(StockMovement.amount))
+            .where(StockMovement.product_id.in_(product_ids)).group_by(StockMovement.product_id)
+        ).all(), repeat=20)
+    print(f"stock of {len(product_ids)} products with {length} movements: cached {warm:.3f} ms, "
+          f"latest snapshot + tail {cold_ms:.3f} ms, summing the whole ledger {full_sum:.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite:////tmp/check_ledger.db")
+    parser.add_argument("--steps", type=int, default=600)
+    parser.add_argument("--snapshot-every", type=int, default=7)
+    parser.add_argument("--history", type=int, default=200_000, help="movements added before timing reads")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    ledger.STOCK_SNAPSHOT_EVERY = args.snapshot_every
+    stock_cache.clear()
+    engine, Session = make_session_factory(args.url)
+    seed_ledger(Session, args.seed)
+    status = check(Session, run(Session, args.steps, random.Random(args.seed)))
+    benchmark(Session, args.history)
+    engine.dispose()
+    sys.exit(status)
+
+if __name__ == "__main__":
+    main()
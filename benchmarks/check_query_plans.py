@@ -0,0 +1,44 @@
+"""Query-plan regression check for the report, dashboard and serving-list queries.
+
+Seeds a large serving history, runs EXPLAIN on the statements the routers
+issue and fails (exit code 1) if any of them scans meal_servings,
+product_usage_log or the rollup tables without an index, or sorts the
+serving history instead of reading it in index order. The statements and the
+checks live in tests/test_query_plans.py, which runs them on a small SQLite
+history with the test suite; this script is for a bigger history or a real
+Postgres.
+
+Usage: python -m benchmarks.check_query_plans [--url sqlite:///<tempdir>/bench_plans.db] [--servings 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from benchmarks._common import make_session_factory
+from tests.test_query_plans import explain, problems, seed, statements
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_plans.db')}")
+    parser.add_argument("--servings", type=int, default=100_000)
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    engine, Session = make_session_factory(args.url)
+    seed(Session, args.servings)
+
+    failures = 0
+    with Session() as db:
+        for label, statement, ordered in statements():
+            rows = db.execute(explain(statement)).all()
+            plan = "\n".join(str(row[-1]) for row in rows)
+            found = problems(engine.dialect.name, plan, ordered)
+            print(f"{'FAIL' if found else 'ok':<5} {label:<22} {'; '.join(sorted(set(found)))}")
+            if found or args.verbose:
+                print("      " + plan.replace("\n", "\n      "))
+            failures += bool(found)
+    print(f"{failures} of {len(statements())} queries without a usable index")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Reproducible synthetic dataset: a kitchen after months or years of use.
+
+Builds users, products, meals with unit-compatible recipes, and a serving
+history (with its product_usage_log rows) that follows a weekday rhythm,
+then rebuilds the daily rollups. The same --seed and scale always produce
+the same data. The target schema is dropped and recreated.
+
+Usage: python -m benchmarks.seed [--url sqlite:///<tempdir>/bench_seed.db] [--scale small|medium|large]
+                                 [--products N] [--meals N] [--days N] [--servings-per-day N] [--seed N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time as clock
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, insert
+from app.auth import pwd_context
+from app.models import Meal, MealIngredient, MealServing, Product, ProductUsageLog, User
+from app.rollups import rebuild
+from benchmarks._common import make_session_factory
+
+SCALES = {
+    "small": {"products": 60, "meals": 200, "days": 90, "servings_per_day": 40},
+    "medium": {"products": 300, "meals": 2000, "days": 730, "servings_per_day": 150},
+    "large": {"products": 500, "meals": 5000, "days": 1095, "servings_per_day": 400},
+}
+
+BENCH_PASSWORD = "bench-password"
+STAPLES = ["guruch", "un", "go'sht", "tovuq", "sabzi", "piyoz", "kartoshka", "sut", "tuxum", "yog'", "shakar",
+           "tuz", "non", "yorma", "karam", "pomidor", "bodring", "olma", "qatiq", "sariyog'", "makaron", "no'xat"]
+# Unit share roughly as in the real catalogue: mostly weight, then volume, then pieces
+UNIT_WEIGHTS = {"kg": 40, "g": 15, "l": 15, "ml": 5, "dona": 15, "paket": 5, "quti": 5}
+RECIPE_UNITS = {"g": ["g", "kg"], "kg": ["g", "kg"], "ml": ["ml", "l"], "l": ["ml", "l"]}
+CHUNK = 5000
+
+def resolve_scale(args) -> dict:
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        value = getattr(args, key, None)
+        if value is not None:
+            scale[key] = value
+    return scale
+
+def _chunks(rows, size=CHUNK):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def seed_users(db):
+    """One user per role plus extra cooks, all with the same password. Returns ({role: id}, cook ids)"""
+    password_hash = pwd_context.hash(BENCH_PASSWORD)
+    ids = {}
+    for role in ("admin", "manager", "cook"):
+        user = User(username=f"bench-{role}", email=f"bench-{role}@example.com", password_hash=password_hash, role=role)
+        db.add(user)
+        db.flush()
+        ids[role] = user.id
+    extra = db.execute(insert(User).returning(User.id, sort_by_parameter_order=True), [
+        {"username": f"cook-{i}", "email": f"cook-{i}@example.com", "password_hash": password_hash, "role": "cook"}
+        for i in range(12)
+    ]).scalars().all()
+    return ids, [ids["cook"], *extra]
+
+def seed_products(db, rng, n_products: int):
+    units = list(UNIT_WEIGHTS)
+    rows = []
+    for i in range(n_products):
+        unit = rng.choices(units, weights=list(UNIT_WEIGHTS.values()))[0]
+        big = unit in ("kg", "l")
+        rows.append({
+            "name": f"{STAPLES[i % len(STAPLES)]} {i // len(STAPLES) + 1}",
+            # Enough stock that years of history don't run anything dry
+            "quantity": rng.randint(50_000, 200_000) if big else rng.randint(5_000_000, 20_000_000),
+            "unit": unit,
+            "minimum_quantity": 10 if big else 1000,
+            "delivery_date": date.today() - timedelta(days=rng.randint(0, 30)),
+        })
+    ids = db.execute(insert(Product).returning(Product.id, sort_by_parameter_order=True), rows).scalars().all()
+    return [(product_id, row["unit"]) for product_id, row in zip(ids, rows)]
+
+def seed_meals(db, rng, products, n_meals: int):
+    """Meals with 3-8 ingredients each, returns {meal_id: [(product_id, quantity, unit)]}"""
+    meal_ids = db.execute(insert(Meal).returning(Meal.id, sort_by_parameter_order=True), [
+        {"name": f"taom {i + 1}", "description": "benchmark meal", "is_active": rng.random() > 0.05}
+        for i in range(n_meals)
+    ]).scalars().all()
+    recipes, rows = {}, []
+    for meal_id in meal_ids:
+        recipe = []
+        for product_id, product_unit in rng.sample(products, min(rng.randint(3, 8), len(products))):
+            unit = rng.choice(RECIPE_UNITS.get(product_unit, [product_unit]))
+            quantity = round(rng.uniform(0.02, 0.5), 3) if unit in ("kg", "l") else rng.randint(1, 250)
+            recipe.append((product_id, quantity, unit))
+            rows.append({"meal_id": meal_id, "product_id": product_id, "quantity": quantity, "unit": unit})
+        recipes[meal_id] = recipe
+    for chunk in _chunks(rows):
+        db.execute(insert(MealIngredient), chunk)
+    return recipes
+
+def seed_history(db, rng, recipes, cooks, days: int, servings_per_day: int):
+    """Servings between 08:00 and 17:00 for the last ``days`` days, fewer at weekends"""
+    meal_ids = list(recipes)
+    # A few popular meals make up most of the servings
+    popularity = [1 / (rank + 1) for rank in range(len(meal_ids))]
+    first_day = date.today() - timedelta(days=days)
+    totals = {"servings": 0, "usage": 0}
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        count = servings_per_day if day.weekday() < 5 else servings_per_day // 4
+        count = max(0, int(count * rng.uniform(0.8, 1.2)))
+        if not count:
+            continue
+        seconds = sorted(rng.randrange(8 * 3600, 17 * 3600) for _ in range(count))
+        servings = [{
+            "meal_id": meal_id,
+            "user_id": rng.choice(cooks),
+            "portions_served": rng.randint(5, 40),
+            "served_at": datetime.combine(day, time.min) + timedelta(seconds=second, microseconds=rng.randrange(1_000_000)),
+            "notes": None,
+        } for second, meal_id in zip(seconds, rng.choices(meal_ids, weights=popularity, k=count))]
+        serving_ids = db.execute(
+            insert(MealServing).returning(MealServing.id, sort_by_parameter_order=True), servings
+        ).scalars().all()
+        logs = []
+        for serving_id, serving in zip(serving_ids, servings):
+            for product_id, quantity, unit in recipes[serving["meal_id"]]:
+                amount = quantity * serving["portions_served"]
+                logs.append({"product_id": product_id, "meal_serving_id": serving_id, "quantity_used": amount,
+                             "unit": unit, "used_at": serving["served_at"]})
+        for chunk in _chunks(logs):
+            db.execute(insert(ProductUsageLog), chunk)
+        totals["servings"] += len(servings)
+        totals["usage"] += len(logs)
+    return totals
+
+def seed_dataset(Session, products: int, meals: int, days: int, servings_per_day: int, seed: int = 1) -> dict:
+    """Fill an empty schema and return a summary (ids the benchmarks need and row counts)"""
+    rng = random.Random(seed)
+    with Session() as db:
+        users, cooks = seed_users(db)
+        product_rows = seed_products(db, rng, products)
+        recipes = seed_meals(db, rng, product_rows, meals)
+        totals = seed_history(db, rng, recipes, cooks, days, servings_per_day)
+        db.commit()
+        rebuild(db)
+        return {
+            "users": users,
+            "password": BENCH_PASSWORD,
+            "product_ids": [product_id for product_id, _ in product_rows],
+            "meal_ids": list(recipes),
+            "servings": totals["servings"],
+            "usage_logs": totals["usage"],
+            "max_serving_id": db.query(func.max(MealServing.id)).scalar(),
+        }
+
+def add_scale_arguments(parser):
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--meals", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--servings-per-day", dest="servings_per_day", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'bench_seed.db')}")
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    scale = resolve_scale(args)
+
+    started = clock.perf_counter()
+    _, Session = make_session_factory(args.url)
+    summary = seed_dataset(Session, seed=args.seed, **scale)
+    print(f"scale={scale} seed={args.seed}")
+    print(f"{len(summary['product_ids'])} products, {len(summary['meal_ids'])} meals, {summary['servings']} servings, "
+          f"{summary['usage_logs']} usage log rows in {clock.perf_counter() - started:.1f}s")
+    print(f"log in as bench-admin / bench-manager / bench-cook with password {BENCH_PASSWORD!r}")
+
+if __name__ == "__main__":
+    main()
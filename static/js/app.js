@@ -2,12 +2,28 @@
 // Global variables
 let currentUser = null
 let authToken = null
-let products = []
+let products = [] // Whole catalog, for the ingredient pickers
 let meals = []
+// The product table shows one filtered page at a time, read from the server
+let productPage = { items: [], next: null, total: 0 }
+let productSearchTimer = null
+const PRODUCT_PAGE_SIZE = 50
+let todayServings = []
+
+// Server-sent change events; lastEventId lets a reconnect pick up exactly what was missed
+let eventSource = null
+let lastEventId = null
+let eventsRetryTimer = null
+let eventsConnecting = false
+// Ledger movement each shown quantity is current as of; stock events can arrive out of order
+const productMovements = new Map()
 
 // API Base URL
 const API_BASE = "/api"
 
+// Last response and ETag of each GET endpoint, revalidated with If-None-Match
+const responseCache = new Map()
+
 // Unit display names
 const UNIT_NAMES = {
   g: "g",
@@ -61,6 +77,18 @@ function setupEventListeners() {
   // Product management
   document.getElementById("addProductBtn").addEventListener("click", () => openProductModal())
   document.getElementById("productForm").addEventListener("submit", handleProductSubmit)
+  document.getElementById("productSearch").addEventListener("input", () => {
+    clearTimeout(productSearchTimer)
+    productSearchTimer = setTimeout(loadProducts, 300)
+  })
+  ;["productUnitFilter", "productSort", "productLowStock"].forEach((id) => {
+    document.getElementById(id).addEventListener("change", loadProducts)
+  })
+  document.getElementById("productsMoreBtn").addEventListener("click", loadMoreProducts)
+  document.getElementById("importDeliveryBtn").addEventListener("click", () => {
+    document.getElementById("deliveryFile").click()
+  })
+  document.getElementById("deliveryFile").addEventListener("change", importDelivery)
 
   // Meal management
   document.getElementById("addMealBtn").addEventListener("click", () => openMealModal())
@@ -125,6 +153,7 @@ async function loadUserInfo() {
       document.getElementById("usersNavItem").style.display = "block"
     }
 
+    connectEvents()
     return true
   } catch (error) {
     console.error("Failed to load user info:", error)
@@ -137,6 +166,8 @@ function handleLogout() {
   authToken = null
   currentUser = null
   localStorage.removeItem("authToken")
+  responseCache.clear()
+  disconnectEvents()
   showLogin()
 }
 
@@ -200,10 +231,8 @@ async function loadDashboardData() {
 // Overview functions
 async function loadOverviewData() {
   try {
-    const [stats, lowStockAlerts] = await Promise.all([
-      apiCall("/reports/dashboard-stats"),
-      apiCall("/products/low-stock/alerts"),
-    ])
+    const overview = await apiCall("/reports/overview")
+    const stats = overview.stats
 
     // Update stats
     document.getElementById("todayServings").textContent = stats.today_servings
@@ -212,7 +241,7 @@ async function loadOverviewData() {
     document.getElementById("recentServings").textContent = stats.recent_servings
 
     // Update alerts
-    displayLowStockAlerts(lowStockAlerts)
+    displayLowStockAlerts(overview.low_stock_alerts)
   } catch (error) {
     console.error("Failed to load overview data:", error)
   }
@@ -240,18 +269,104 @@ function displayLowStockAlerts(alertsData) {
 }
 
 // Products functions
+function productQuery() {
+  const params = new URLSearchParams({ limit: PRODUCT_PAGE_SIZE, sort: document.getElementById("productSort").value })
+  const q = document.getElementById("productSearch").value.trim()
+  const unit = document.getElementById("productUnitFilter").value
+  if (q) {
+    params.set("q", q)
+  }
+  if (unit) {
+    params.set("unit", unit)
+  }
+  if (document.getElementById("productLowStock").checked) {
+    params.set("low_stock", "true")
+  }
+  return params
+}
+
 async function loadProducts() {
   try {
-    products = await apiCall("/products/")
+    const page = await apiPage(`/products/?${productQuery()}`)
+    productPage = { items: page.data, next: page.next, total: page.total }
+    displayProducts()
+  } catch (error) {
+    console.error("Failed to load products:", error)
+  }
+}
+
+// Restock from a delivery manifest file (CSV with a header row, or JSON)
+async function importDelivery(event) {
+  const file = event.target.files[0]
+  event.target.value = ""
+  if (!file) {
+    return
+  }
+  const isJson = file.name.toLowerCase().endsWith(".json")
+  try {
+    const response = await fetch(`${API_BASE}/products/deliveries?all_or_nothing=false`, {
+      method: "POST",
+      headers: {
+        "Content-Type": isJson ? "application/json" : "text/csv",
+        Authorization: `Bearer ${authToken}`,
+      },
+      body: await file.text(),
+    })
+    const report = await response.json()
+    if (!response.ok) {
+      throw report
+    }
+    const errors = report.results
+      .filter((result) => result.error)
+      .slice(0, 10)
+      .map((result) => `${result.row}-qator: ${result.error}`)
+    const summary = `Yangilandi: ${report.updated}, yaratildi: ${report.created}, xato: ${report.failed}`
+    if (report.failed > 0) {
+      showErrorMessage([summary, ...errors].join("\n"))
+    } else {
+      showSuccessMessage(summary)
+    }
+    if (!eventsConnected()) {
+      await Promise.all([loadCatalogProducts(), loadProducts(), loadMeals()])
+    }
+  } catch (error) {
+    showErrorMessage(error.detail || "Yetkazib berishni yuklashda xatolik yuz berdi")
+  }
+}
+
+async function loadMoreProducts() {
+  if (!productPage.next) {
+    return
+  }
+  try {
+    const params = productQuery()
+    params.set("cursor", productPage.next)
+    const page = await apiPage(`/products/?${params}`)
+    productPage.items = productPage.items.concat(page.data)
+    productPage.next = page.next
     displayProducts()
   } catch (error) {
     console.error("Failed to load products:", error)
   }
 }
 
+async function loadCatalogProducts() {
+  try {
+    products = await apiCall("/products/")
+  } catch (error) {
+    console.error("Failed to load products:", error)
+  }
+}
+
+function findProduct(productId) {
+  return productPage.items.find((p) => p.id === productId) || products.find((p) => p.id === productId)
+}
+
 function displayProducts() {
+  document.getElementById("productsCount").textContent = `${productPage.items.length} / ${productPage.total}`
+  document.getElementById("productsMoreBtn").style.display = productPage.next ? "block" : "none"
   const tbody = document.querySelector("#productsTable tbody")
-  tbody.innerHTML = products
+  tbody.innerHTML = productPage.items
     .map(
       (product) => `
         <tr>
@@ -305,7 +420,7 @@ function openProductModal(productId = null) {
   const form = document.getElementById("productForm")
 
   if (productId) {
-    const product = products.find((p) => p.id === productId)
+    const product = findProduct(productId)
     title.textContent = "Mahsulotni tahrirlash"
     document.getElementById("productName").value = product.name
     document.getElementById("productQuantity").value = product.quantity
@@ -345,7 +460,9 @@ async function handleProductSubmit(e) {
     }
 
     closeModal("productModal")
-    await loadProducts()
+    if (!eventsConnected()) {
+      await loadProducts()
+    }
     showSuccessMessage("Mahsulot muvaffaqiyatli saqlandi")
   } catch (error) {
     showErrorMessage("Mahsulotni saqlashda xatolik yuz berdi")
@@ -363,7 +480,9 @@ async function deleteProduct(productId) {
 
   try {
     await apiCall(`/products/${productId}`, "DELETE")
-    await loadProducts()
+    if (!eventsConnected()) {
+      await loadProducts()
+    }
     showSuccessMessage("Mahsulot muvaffaqiyatli o'chirildi")
   } catch (error) {
     showErrorMessage("Mahsulotni o'chirishda xatolik yuz berdi")
@@ -442,7 +561,9 @@ function updateMealSelect() {
       .join("")
 }
 
-function openMealModal(mealId = null) {
+async function openMealModal(mealId = null) {
+  await loadCatalogProducts() // ingredient pickers list every product
+
   const modal = document.getElementById("mealModal")
   const title = document.getElementById("mealModalTitle")
   const form = document.getElementById("mealForm")
@@ -559,7 +680,9 @@ async function handleMealSubmit(e) {
     }
 
     closeModal("mealModal")
-    await loadMeals()
+    if (!eventsConnected()) {
+      await loadMeals()
+    }
     showSuccessMessage("Ovqat muvaffaqiyatli saqlandi")
   } catch (error) {
     showErrorMessage("Ovqatni saqlashda xatolik yuz berdi")
@@ -577,7 +700,9 @@ async function deleteMeal(mealId) {
 
   try {
     await apiCall(`/meals/${mealId}`, "DELETE")
-    await loadMeals()
+    if (!eventsConnected()) {
+      await loadMeals()
+    }
     showSuccessMessage("Ovqat muvaffaqiyatli o'chirildi")
   } catch (error) {
     showErrorMessage("Ovqatni o'chirishda xatolik yuz berdi")
@@ -588,7 +713,7 @@ async function deleteMeal(mealId) {
 async function loadServingsData() {
   try {
     await loadMeals() // Ensure meals are loaded for the select
-    const todayServings = await apiCall("/servings/today")
+    todayServings = await apiCall("/servings/today")
     displayTodayServings(todayServings)
   } catch (error) {
     console.error("Failed to load servings data:", error)
@@ -641,8 +766,10 @@ async function handleMealServing(e) {
     })
 
     document.getElementById("serveMealForm").reset()
-    await loadServingsData()
-    await loadMeals() // Refresh possible portions
+    // With the event stream open, the new serving and stock arrive as events
+    if (!eventsConnected()) {
+      await loadServingsData()
+    }
     showSuccessMessage("Ovqat muvaffaqiyatli berildi")
   } catch (error) {
     showErrorMessage(error.detail || "Ovqat berishda xatolik yuz berdi")
@@ -790,8 +917,221 @@ async function toggleUserActive(userId) {
   }
 }
 
+// Live updates
+async function connectEvents() {
+  if (eventSource || eventsConnecting || !authToken) {
+    return
+  }
+  // The stream URL carries a short-lived ticket rather than the token, so every connection gets a new one
+  eventsConnecting = true
+  let ticket
+  try {
+    ticket = (await apiCall("/events/ticket", "POST")).ticket // logs out if the token is no longer valid
+  } catch (error) {
+    console.error("Live updates unavailable:", error)
+    return
+  } finally {
+    eventsConnecting = false
+  }
+  if (eventSource || !authToken) {
+    return
+  }
+  const since = lastEventId ? `&since=${encodeURIComponent(lastEventId)}` : ""
+  eventSource = new EventSource(`${API_BASE}/events/?ticket=${encodeURIComponent(ticket)}${since}`)
+
+  const handlers = {
+    stock: applyStockEvent,
+    product: applyProductEvent,
+    product_deleted: applyProductDeletedEvent,
+    meal: applyMealEvent,
+    meal_deleted: applyMealDeletedEvent,
+    serving: applyServingEvent,
+    resync: resyncAll,
+  }
+  Object.entries(handlers).forEach(([type, handler]) => {
+    eventSource.addEventListener(type, (event) => {
+      if (event.lastEventId) {
+        lastEventId = event.lastEventId
+      }
+      handler(JSON.parse(event.data))
+    })
+  })
+
+  eventSource.onerror = () => {
+    // The browser would reconnect with the same, by then expired, ticket: reconnect with a new one instead
+    eventSource.close()
+    eventSource = null
+    clearTimeout(eventsRetryTimer)
+    eventsRetryTimer = setTimeout(connectEvents, 3000)
+  }
+}
+
+function disconnectEvents() {
+  clearTimeout(eventsRetryTimer)
+  if (eventSource) {
+    eventSource.close()
+    eventSource = null
+  }
+  lastEventId = null
+  productMovements.clear()
+}
+
+function eventsConnected() {
+  return eventSource !== null && eventSource.readyState === EventSource.OPEN
+}
+
+function patchMealPortions(changes) {
+  changes.forEach((change) => {
+    const meal = meals.find((m) => m.id === change.id)
+    if (meal) {
+      meal.possible_portions = change.possible_portions
+    }
+  })
+}
+
+function renderCatalog() {
+  displayProducts()
+  displayMeals()
+  updateMealSelect()
+}
+
+// Whether a quantity as of ``movementId`` is newer than the one shown, remembering it if so
+function newerStock(productId, movementId) {
+  if (movementId == null) {
+    return true
+  }
+  if ((productMovements.get(productId) || 0) >= movementId) {
+    return false
+  }
+  productMovements.set(productId, movementId)
+  return true
+}
+
+function applyStockEvent(data) {
+  let stale = false
+  data.products.forEach((change) => {
+    if (!newerStock(change.id, change.movement_id)) {
+      stale = true
+      return
+    }
+    ;[products, productPage.items].forEach((list) => {
+      const product = list.find((p) => p.id === change.id)
+      if (product) {
+        product.quantity = change.quantity
+      }
+    })
+  })
+  // Portions were worked out before a newer event's, which already included this change
+  if (!stale) {
+    patchMealPortions(data.meals)
+  }
+  renderCatalog()
+}
+
+function applyProductEvent(data) {
+  const product = data.product
+  const index = products.findIndex((p) => p.id === product.id)
+  const newer = data.movement_id != null && newerStock(product.id, data.movement_id)
+  const stale = data.movement_id != null && !newer
+  // An edit that didn't change the stock, or arrived after a newer stock event, keeps the quantity shown
+  if (index >= 0 && !newer) {
+    product.quantity = products[index].quantity
+  }
+  if (index >= 0) {
+    products[index] = product
+  } else {
+    products.push(product)
+  }
+  // The table page only gets edits; whether a new product matches its filters is the server's call
+  const pageIndex = productPage.items.findIndex((p) => p.id === product.id)
+  if (pageIndex >= 0) {
+    productPage.items[pageIndex] = product
+  }
+  meals.forEach((meal) => {
+    meal.ingredients.forEach((ing) => {
+      if (ing.product_id === product.id) {
+        ing.product_name = product.name
+      }
+    })
+  })
+  if (!stale) {
+    patchMealPortions(data.meals)
+  }
+  renderCatalog()
+}
+
+function applyProductDeletedEvent(data) {
+  productMovements.delete(data.id)
+  products = products.filter((p) => p.id !== data.id)
+  if (productPage.items.some((p) => p.id === data.id)) {
+    productPage.items = productPage.items.filter((p) => p.id !== data.id)
+    productPage.total -= 1
+  }
+  // A meal missing one of its products can't be made
+  meals.forEach((meal) => {
+    if (meal.ingredients.some((ing) => ing.product_id === data.id)) {
+      meal.possible_portions = 0
+    }
+  })
+  renderCatalog()
+}
+
+function applyMealEvent(meal) {
+  const index = meals.findIndex((m) => m.id === meal.id)
+  if (!meal.is_active) {
+    if (index >= 0) {
+      meals.splice(index, 1)
+    }
+  } else if (index >= 0) {
+    meals[index] = meal
+  } else {
+    meals.push(meal)
+  }
+  displayMeals()
+  updateMealSelect()
+}
+
+function applyMealDeletedEvent(data) {
+  meals = meals.filter((m) => m.id !== data.id)
+  displayMeals()
+  updateMealSelect()
+}
+
+function applyServingEvent(data) {
+  const today = new Date().toDateString()
+  const known = new Set(todayServings.map((serving) => serving.id))
+  const fresh = data.servings.filter(
+    (serving) => !known.has(serving.id) && new Date(serving.served_at).toDateString() === today,
+  )
+  if (fresh.length > 0) {
+    todayServings = [...fresh.reverse(), ...todayServings]
+    displayTodayServings(todayServings)
+  }
+}
+
+async function resyncAll() {
+  await Promise.all([loadCatalogProducts(), loadProducts(), loadMeals()])
+  if (document.getElementById("servingsSection").classList.contains("active")) {
+    await loadServingsData()
+  }
+}
+
 // Utility functions
 async function apiCall(endpoint, method = "GET", data = null) {
+  return (await apiRequest(endpoint, method, data)).data
+}
+
+// One page of a listing, with its total and the cursor of the next page
+async function apiPage(endpoint) {
+  const { data, headers } = await apiRequest(endpoint)
+  return {
+    data,
+    total: Number.parseInt(headers.get("X-Total-Count") || data.length),
+    next: headers.get("X-Next-Cursor"),
+  }
+}
+
+async function apiRequest(endpoint, method = "GET", data = null) {
   const config = {
     method,
     headers: {
@@ -807,6 +1147,11 @@ async function apiCall(endpoint, method = "GET", data = null) {
     config.body = JSON.stringify(data)
   }
 
+  const cached = method === "GET" ? responseCache.get(endpoint) : null
+  if (cached) {
+    config.headers["If-None-Match"] = cached.etag
+  }
+
   const response = await fetch(`${API_BASE}${endpoint}`, config)
 
   if (response.status === 401) {
@@ -814,12 +1159,22 @@ async function apiCall(endpoint, method = "GET", data = null) {
     throw new Error("Unauthorized")
   }
 
+  // Nothing changed since the last load, reuse it without downloading the list again
+  if (response.status === 304 && cached) {
+    return cached
+  }
+
   if (!response.ok) {
     const error = await response.json()
     throw error
   }
 
-  return await response.json()
+  const result = { data: await response.json(), headers: response.headers }
+  const etag = response.headers.get("ETag")
+  if (method === "GET" && etag) {
+    responseCache.set(endpoint, { etag, ...result })
+  }
+  return result
 }
 
 function openModal(modalId) {
@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+# app.database builds its engine on import, so point it at a throwaway SQLite file first
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='oshxona-tests-'), 'test.db')}"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.auth import create_access_token
+from app.database import Base, SessionLocal
+from app.models import User
+
+@pytest.fixture(scope="session")
+def client():
+    from app.main import app
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+@pytest.fixture(scope="session")
+def make_user(client):
+    """Factory for users; returns (user, Authorization headers)"""
+    def make(username: str, role: str = "cook"):
+        with SessionLocal() as db:
+            user = User(username=username, email=f"{username}@example.com", password_hash="-", role=role)
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+        return user, {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+    return make
+
+@pytest.fixture(scope="session")
+def admin_headers(make_user):
+    return make_user("admin", role="admin")[1]
+
+@pytest.fixture(scope="session")
+def new_database(tmp_path_factory):
+    """Factory for a separate SQLite database with the schema; returns (engine, sessionmaker)"""
+    engines = []
+    def make(name: str):
+        engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp(name) / f'{name}.db'}")
+        Base.metadata.create_all(bind=engine)
+        engines.append(engine)
+        return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    yield make
+    for engine in engines:
+        engine.dispose()
@@ -0,0 +1,48 @@
+"""Bearer-token resolution through the per-worker user cache (app.auth)."""
+import pytest
+from sqlalchemy import event
+from app.auth import user_cache
+from app.catalog import USERS, bump_catalog
+from app.database import SessionLocal, engine
+from app.models import User
+
+@pytest.fixture
+def statements():
+    executed = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
+
+def test_cache_hit_runs_no_queries(client, make_user, statements, monkeypatch):
+    monkeypatch.setattr(user_cache, "sync_interval", 60)
+    _, headers = make_user("cached-cook")
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    statements.clear()
+    hits = user_cache.hits
+    assert client.get("/api/users/me", headers=headers).json()["username"] == "cached-cook"
+    assert user_cache.hits == hits + 1
+    assert statements == []
+
+def test_deactivated_user_is_locked_out_at_once(client, make_user, admin_headers, monkeypatch):
+    monkeypatch.setattr(user_cache, "sync_interval", 60)
+    user, headers = make_user("toggled-cook")
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    assert client.put(f"/api/users/{user.id}/toggle-active", headers=admin_headers).status_code == 200
+    response = client.get("/api/users/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Inactive user"
+
+def test_deactivation_on_another_worker_is_seen_after_sync(client, make_user, monkeypatch):
+    monkeypatch.setattr(user_cache, "sync_interval", 60)
+    user, headers = make_user("remote-cook")
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    # What toggle-active does in another process: this worker's cache isn't touched
+    with SessionLocal() as db:
+        db.get(User, user.id).is_active = False
+        bump_catalog(db, USERS)
+        db.commit()
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    monkeypatch.setattr(user_cache, "sync_interval", 0)
+    assert client.get("/api/users/me", headers=headers).status_code == 401
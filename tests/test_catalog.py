@@ -0,0 +1,67 @@
+"""ETag/304 on the product and meal listings (app.catalog) and its invalidation by writes."""
+import pytest
+from app.catalog import MEALS, PRODUCTS, VERSION_SHARDS, bump_catalog, catalog_versions
+from app.database import SessionLocal
+
+def etag(client, headers, url):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["cache-control"] == "private, no-cache"
+    return response.headers["etag"]
+
+def revalidate(client, headers, url, tag):
+    return client.get(url, headers={**headers, "If-None-Match": tag})
+
+@pytest.fixture
+def product(client, admin_headers):
+    response = client.post("/api/products/", json={"name": "etag rice", "quantity": 50, "unit": "kg"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+@pytest.mark.parametrize("url", ["/api/products/", "/api/meals/"])
+def test_unchanged_listing_is_304(client, admin_headers, url):
+    tag = etag(client, admin_headers, url)
+    response = revalidate(client, admin_headers, url, tag)
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == tag
+    assert revalidate(client, admin_headers, url, f'"other", W/{tag}').status_code == 304
+    assert revalidate(client, admin_headers, url, '"other"').status_code == 200
+
+def test_product_write_changes_both_listings(client, admin_headers, product):
+    products, meals = etag(client, admin_headers, "/api/products/"), etag(client, admin_headers, "/api/meals/")
+    response = client.put(f"/api/products/{product['id']}", json={"quantity": 40}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    # Meals show portions computed from the stock, so their tag follows products too
+    for url, tag in (("/api/products/", products), ("/api/meals/", meals)):
+        response = revalidate(client, admin_headers, url, tag)
+        assert response.status_code == 200
+        assert response.headers["etag"] != tag
+
+def test_meal_write_leaves_products_cached(client, admin_headers, product):
+    products, meals = etag(client, admin_headers, "/api/products/"), etag(client, admin_headers, "/api/meals/")
+    response = client.post("/api/meals/", json={"name": "etag pilaf", "ingredients": [
+        {"product_id": product["id"], "quantity": 200, "unit": "g"}]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert revalidate(client, admin_headers, "/api/meals/", meals).status_code == 200
+    assert revalidate(client, admin_headers, "/api/products/", products).status_code == 304
+
+def test_serving_invalidates_the_listings(client, admin_headers, product):
+    meal = client.post("/api/meals/", json={"name": "etag soup", "ingredients": [
+        {"product_id": product["id"], "quantity": 100, "unit": "g"}]}, headers=admin_headers).json()
+    products, meals = etag(client, admin_headers, "/api/products/"), etag(client, admin_headers, "/api/meals/")
+    response = client.post("/api/servings/", json={"meal_id": meal["id"], "portions_served": 3}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert revalidate(client, admin_headers, "/api/products/", products).status_code == 200
+    assert revalidate(client, admin_headers, "/api/meals/", meals).status_code == 200
+
+def test_bumps_spread_over_shards_add_up(client):
+    with SessionLocal() as db:
+        before = catalog_versions(db, PRODUCTS, MEALS)
+        for _ in range(VERSION_SHARDS * 3):
+            bump_catalog(db, PRODUCTS)
+        db.commit()
+        after = catalog_versions(db, PRODUCTS, MEALS)
+    assert after[PRODUCTS][0] == before[PRODUCTS][0] + VERSION_SHARDS * 3
+    assert after[PRODUCTS][1] is not None
+    assert after[MEALS] == before[MEALS]
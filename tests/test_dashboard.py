@@ -0,0 +1,28 @@
+"""Overview snapshot (app.dashboard) and the low-stock alerts that share its query."""
+from sqlalchemy import event
+from app.dashboard import dashboard_cache
+from app.database import engine
+
+def test_overview_is_two_statements_and_matches_the_alerts(client, admin_headers):
+    for name, quantity in (("overview short", 1), ("overview shorter", 0), ("overview plenty", 500)):
+        response = client.post("/api/products/", json={"name": name, "quantity": quantity, "unit": "g", "minimum_quantity": 10},
+                               headers=admin_headers)
+        assert response.status_code == 200, response.text
+    dashboard_cache.invalidate()
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        overview = client.get("/api/reports/overview", headers=admin_headers).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # Only the bearer token's user lookup besides the counters and the list
+    snapshot = [statement for statement in statements if "users" not in statement and "catalog_versions" not in statement]
+    assert len(snapshot) == 2, snapshot
+    alerts = client.get("/api/products/low-stock/alerts", headers=admin_headers).json()
+    assert overview["low_stock_alerts"] == alerts
+    assert overview["stats"]["low_stock_count"] == alerts["count"]
+    names = [product["name"] for product in alerts["products"]]
+    assert names.index("overview shorter") < names.index("overview short") and "overview plenty" not in names
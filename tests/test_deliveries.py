@@ -0,0 +1,46 @@
+"""Delivery manifest imports (app.deliveries, POST /api/products/deliveries)."""
+import asyncio
+import json
+import pytest
+from app.routers import products as products_router
+
+@pytest.fixture(scope="module")
+def product(client, admin_headers):
+    response = client.post("/api/products/", json={"name": "delivered flour", "quantity": 2, "unit": "kg"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def deliver(client, headers, body, content_type="text/csv", **params):
+    response = client.post("/api/products/deliveries", content=body, params=params,
+                           headers={**headers, "Content-Type": content_type})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_manifest_is_parsed_off_the_event_loop(client, admin_headers, product, monkeypatch):
+    threads = []
+    parse_manifest = products_router.parse_manifest
+
+    def parse(body, content_type):
+        try:
+            asyncio.get_running_loop()
+            threads.append("event loop")
+        except RuntimeError:
+            threads.append("worker")
+        return parse_manifest(body, content_type)
+    monkeypatch.setattr(products_router, "parse_manifest", parse)
+    result = deliver(client, admin_headers, f"id,quantity,unit\n{product['id']},500,g\n", dry_run=True)
+    assert threads == ["worker"]
+    assert result["results"][0]["product_id"] == product["id"]
+
+@pytest.mark.parametrize("product_id", [1.5, True, "1.5", "abc"])
+def test_non_integral_ids_are_row_errors(client, admin_headers, product, product_id):
+    body = f'[{{"id": {json.dumps(product_id)}, "quantity": 1}}]'
+    result = deliver(client, admin_headers, body, "application/json", all_or_nothing=False, dry_run=True)
+    row = result["results"][0]
+    assert row["error"] == f"Invalid product id: {product_id}"
+    assert row.get("product_id") is None
+
+def test_integral_float_id_is_accepted(client, admin_headers, product):
+    body = f'[{{"id": {float(product["id"])}, "quantity": 1}}]'
+    result = deliver(client, admin_headers, body, "application/json", dry_run=True)
+    assert result["results"][0]["product_id"] == product["id"]
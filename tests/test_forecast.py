@@ -0,0 +1,46 @@
+"""Sharing and invalidation of the stock forecasts (app.forecast.ForecastCache)."""
+import threading
+from app.catalog import PRODUCTS, bump_catalog
+from app.database import SessionLocal
+from app.forecast import ForecastCache
+
+def blocking_cache(monkeypatch):
+    cache, started, release, calls = ForecastCache(28), threading.Event(), threading.Event(), []
+
+    def compute(db, today, entry, lead_time_days, cover_days, safety_factor):
+        calls.append(today)
+        started.set()
+        assert release.wait(5)
+        return [{"product_id": len(calls)}], {}, 0
+    monkeypatch.setattr(cache, "_compute", compute)
+    return cache, started, release, calls
+
+def test_concurrent_callers_share_one_computation(client, monkeypatch):
+    cache, started, release, calls = blocking_cache(monkeypatch)
+    results = []
+
+    def ask():
+        with SessionLocal() as db:
+            results.append(cache.get(db))
+    threads = [threading.Thread(target=ask) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    # The computation runs outside the cache lock, so stats don't queue behind it
+    assert cache.stats()["misses"] == 1
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert results == [[{"product_id": 1}]] * 4
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_product_change_recomputes(client, monkeypatch):
+    cache, _, release, calls = blocking_cache(monkeypatch)
+    release.set()
+    with SessionLocal() as db:
+        assert cache.get(db) == cache.get(db) == [{"product_id": 1}]
+        bump_catalog(db, PRODUCTS)
+        db.commit()
+        assert cache.get(db) == [{"product_id": 2}]
+    assert len(calls) == 2
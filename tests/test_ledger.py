@@ -0,0 +1,119 @@
+"""The stock ledger (app.ledger) against the quantities the write paths left behind.
+
+Runs a random mix of servings, batch servings, delivery imports and manual
+corrections through the real write paths, with a snapshot every few movements,
+and records every product's quantity after each transaction. Then checks that
+
+- Product.quantity (the projection) equals the ledger for every product,
+- the stock as of each recorded moment equals what was recorded then,
+- positions read through the cache, from snapshots, and by summing the whole
+  ledger all agree.
+"""
+import random
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from app import ledger
+from app.deliveries import apply_delivery
+from app.ledger import _from_snapshots, open_missing_products, projection_drift, read_positions, stock_as_of, stock_cache
+from app.models import Meal, MealIngredient, Product, StockMovement, User
+from app.stock import correct_stock, serve, serve_batch
+
+UNITS = {"g": ["g", "kg"], "kg": ["g", "kg"], "ml": ["ml", "l"], "l": ["ml", "l"], "dona": ["dona"], "paket": ["paket"]}
+
+def snapshot_quantities(db):
+    return dict(db.execute(select(Product.id, Product.quantity)).all())
+
+def full_sums(db):
+    return dict(db.execute(select(StockMovement.product_id, func.sum(StockMovement.amount)).group_by(StockMovement.product_id)).all())
+
+def seed_ledger(Session, seed: int, n_products: int = 60, n_meals: int = 20):
+    """A cook, products in every unit and meals of 5 unit-compatible ingredients, with opening stock"""
+    rng = random.Random(seed)
+    with Session() as db:
+        db.add(User(username="ledger", email="ledger@example.com", password_hash="-", role="cook"))
+        products = [Product(name=f"product-{i}", quantity=rng.randint(0, 50_000), unit=rng.choice(list(UNITS)),
+                            minimum_quantity=100) for i in range(n_products)]
+        meals = [Meal(name=f"meal-{i}") for i in range(n_meals)]
+        db.add_all(products + meals)
+        db.flush()
+        for meal in meals:
+            for product in rng.sample(products, 5):
+                unit = rng.choice(UNITS[product.unit])
+                quantity = rng.randint(50, 1000) / 1000 if unit in ("kg", "l") else rng.randint(1, 300)
+                db.add(MealIngredient(meal_id=meal.id, product_id=product.id, quantity=quantity, unit=unit))
+        db.commit()
+        open_missing_products(db)
+
+def run(Session, steps: int, rng: random.Random) -> list:
+    """Random writes; returns [(moment, {product_id: quantity})] recorded after each commit"""
+    with Session() as db:
+        user_id = db.execute(select(User.id)).scalar_one()
+        meal_ids = db.execute(select(Meal.id)).scalars().all()
+        products = db.execute(select(Product.id, Product.name, Product.unit)).all()
+
+    history = []
+    for _ in range(steps):
+        action = rng.random()
+        with Session() as db:
+            try:
+                if action < 0.5:
+                    serve(db, rng.choice(meal_ids), user_id, rng.randint(1, 3))
+                elif action < 0.7:
+                    items = [SimpleNamespace(meal_id=rng.choice(meal_ids), portions_served=rng.randint(1, 2), notes=None)
+                             for _ in range(rng.randint(2, 5))]
+                    serve_batch(db, items, user_id, all_or_nothing=rng.random() < 0.5)
+                elif action < 0.9:
+                    rows = [{"id": product.id, "quantity": str(rng.randint(1, 5000))} for product in rng.sample(products, 20)]
+                    apply_delivery(db, rows, mode="add" if rng.random() < 0.8 else "set", user_id=user_id)
+                else:
+                    product = rng.choice(products)
+                    quantity, positions = correct_stock(db, product.id, rng.randint(0, 20_000), None, user_id)
+                    db.execute(Product.__table__.update().where(Product.id == product.id).values(quantity=quantity))
+                    db.commit()
+                    stock_cache.store(positions)
+            except HTTPException:
+                db.rollback()
+        with Session() as db:
+            history.append((db.execute(select(func.max(StockMovement.created_at))).scalar(), snapshot_quantities(db)))
+    return history
+
+def mismatches(Session, history) -> list:
+    """Every way the projection, the point-in-time stock or the position reads disagree with the ledger"""
+    failures = []
+    with Session() as db:
+        drift = projection_drift(db)
+        if drift:
+            failures.append(("projection differs from ledger", drift[:5]))
+
+        for moment, quantities in history[::max(1, len(history) // 100)]:
+            levels = {level["product_id"]: level["quantity"] for level in stock_as_of(db, moment)}
+            wrong = [(product_id, levels.get(product_id), quantity) for product_id, quantity in quantities.items()
+                     if levels.get(product_id) != quantity]
+            if wrong:
+                failures.append(("as of " + moment.isoformat(), wrong[:5]))
+
+        product_ids = db.execute(select(Product.id)).scalars().all()
+        cached = read_positions(db, product_ids[:ledger.CACHED_TAIL_LIMIT])
+        fresh = _from_snapshots(db, product_ids)
+        sums = full_sums(db)
+        for product_id in product_ids:
+            if fresh[product_id].amount != int(sums.get(product_id, 0)):
+                failures.append(("snapshot + tail", product_id, fresh[product_id], sums.get(product_id)))
+            if product_id in cached and cached[product_id][:2] != fresh[product_id][:2]:
+                failures.append(("cache + tail", product_id, cached[product_id], fresh[product_id]))
+
+    return failures
+
+@pytest.mark.parametrize("seed", [7, 19])
+def test_ledger_matches_every_write_path(new_database, monkeypatch, seed):
+    monkeypatch.setattr(ledger, "STOCK_SNAPSHOT_EVERY", 7)
+    stock_cache.clear()
+    _, Session = new_database(f"ledger-{seed}")
+    try:
+        seed_ledger(Session, seed)
+        history = run(Session, 200, random.Random(seed))
+        assert mismatches(Session, history)[:20] == []
+    finally:
+        stock_cache.clear()
@@ -0,0 +1,46 @@
+"""Keyset pagination of the product and user listings (app.listing)."""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from app.database import SessionLocal
+from app.models import Product, User
+from app.routers.products import PRODUCT_SORTS
+from app.routers.users import USER_SORTS
+
+def walk(client, headers, url, params):
+    """Ids of every page, following X-Next-Cursor until it runs out"""
+    ids, cursor = [], None
+    for _ in range(50):
+        response = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers)
+        assert response.status_code == 200, response.text
+        ids += [row["id"] for row in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return ids
+    pytest.fail(f"{url} {params} kept returning a next cursor")
+
+@pytest.fixture(scope="module")
+def listed(client):
+    # Rows written with server_default=func.now() (whole seconds, mostly the same one) next to
+    # rows with a microsecond timestamp from Python, which SQLite stores as text in another format
+    earlier = datetime.now().replace(microsecond=123456) - timedelta(hours=1)
+    with SessionLocal() as db:
+        db.execute(insert(Product), [{"name": f"paged {i}", "quantity": i % 3, "unit": "g"} for i in range(5)])
+        db.execute(insert(Product), [{"name": f"paged late {i}", "quantity": 1, "unit": "g",
+                                      "created_at": earlier + timedelta(microseconds=i)} for i in range(3)])
+        db.execute(insert(User), [{"username": f"paged{i}", "email": f"paged{i}@example.com", "password_hash": "-",
+                                   "role": "cook"} for i in range(5)])
+        db.execute(insert(User), [{"username": f"paged-late{i}", "email": f"paged-late{i}@example.com", "password_hash": "-",
+                                   "role": "admin", "created_at": earlier} for i in range(3)])
+        db.commit()
+
+@pytest.mark.parametrize("url,keys", [("/api/products/", PRODUCT_SORTS), ("/api/users/", USER_SORTS)])
+def test_every_page_sees_each_row_once(client, admin_headers, listed, url, keys):
+    expected = sorted(row["id"] for row in client.get(url, params={"q": "paged"}, headers=admin_headers).json())
+    assert len(expected) == 8
+    for key in keys:
+        for sort in (key, f"-{key}"):
+            ids = walk(client, admin_headers, url, {"q": "paged", "sort": sort, "limit": 2})
+            assert sorted(ids) == expected, sort
+            unpaged = [row["id"] for row in client.get(url, params={"q": "paged", "sort": sort}, headers=admin_headers).json()]
+            assert ids == unpaged, sort
@@ -0,0 +1,18 @@
+"""/metrics and /health/pool share one access policy (app.auth.require_metrics_access)."""
+import pytest
+from app import auth
+
+@pytest.mark.parametrize("url", ["/metrics", "/health/pool"])
+def test_pool_figures_need_admin_or_scrape_token(client, make_user, admin_headers, monkeypatch, url):
+    _, cook_headers = make_user(f"cook-{url.strip('/').replace('/', '-')}")
+    assert client.get(url).status_code == 403
+    assert client.get(url, headers=cook_headers).status_code == 403
+    assert client.get(url, headers=admin_headers).status_code == 200
+
+    monkeypatch.setattr(auth, "METRICS_TOKEN", "scrape-secret")
+    assert client.get(url, headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+    assert client.get(url, headers={"Authorization": "Bearer wrong-secret"}).status_code == 401
+
+def test_metrics_page_has_pool_gauges(client, admin_headers):
+    text = client.get("/metrics", headers=admin_headers).text
+    assert "db_pool_checkouts" in text and "http_requests_total" in text
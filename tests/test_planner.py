@@ -0,0 +1,75 @@
+"""Menu planner (GET /api/meals/plan): portions against a target, per-meal caps and the limiting products."""
+import itertools
+import pytest
+
+names = itertools.count()
+
+@pytest.fixture
+def kitchen(client, admin_headers):
+    """1000 g of flour, 10 eggs; "bread" takes 300 g flour, "pie" 0.5 kg flour and 2 eggs"""
+    def post(url, payload):
+        response = client.post(url, json=payload, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+    n = next(names)
+    flour = post("/api/products/", {"name": f"flour {n}", "quantity": 1000, "unit": "g"})
+    eggs = post("/api/products/", {"name": f"eggs {n}", "quantity": 10, "unit": "dona"})
+    bread = post("/api/meals/", {"name": f"bread {n}", "ingredients": [
+        {"product_id": flour["id"], "quantity": 300, "unit": "g"}]})
+    pie = post("/api/meals/", {"name": f"pie {n}", "ingredients": [
+        {"product_id": flour["id"], "quantity": 0.5, "unit": "kg"}, {"product_id": eggs["id"], "quantity": 2, "unit": "dona"}]})
+    return {"flour": flour["id"], "eggs": eggs["id"], "bread": bread["id"], "pie": pie["id"]}
+
+def plan(client, headers, meal_ids, **params):
+    # Other tests share the database, so every plan is limited to this kitchen's meals
+    response = client.get("/api/meals/plan", params={"meal_id": meal_ids, **params}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def portions(result):
+    return {meal["meal_id"]: meal["portions"] for meal in result["meals"]}
+
+def products(result):
+    return {product["product_id"]: product for product in result["products"]}
+
+def test_target_that_fits_is_met_exactly(client, admin_headers, kitchen):
+    result = plan(client, admin_headers, [kitchen["bread"], kitchen["pie"]], target=2)
+    assert (result["target"], result["total_portions"], result["target_met"]) == (2, 2, True)
+    assert result["candidate_meals"] == 2
+    assert sum(portions(result).values()) == 2
+
+def test_target_out_of_reach_reports_the_shortfall(client, admin_headers, kitchen):
+    # 1000 g of flour makes at most three 300 g breads
+    result = plan(client, admin_headers, [kitchen["bread"], kitchen["pie"]], target=5)
+    assert (result["total_portions"], result["target_met"]) == (3, False)
+    assert portions(result) == {kitchen["bread"]: 3}
+    flour = products(result)[kitchen["flour"]]
+    assert (flour["available"], flour["used"], flour["remaining"], flour["limiting"]) == (1000, 900, 100, True)
+
+def test_without_target_serves_as_much_as_possible(client, admin_headers, kitchen):
+    result = plan(client, admin_headers, [kitchen["bread"], kitchen["pie"]])
+    assert (result["target"], result["total_portions"], result["target_met"]) == (None, 3, True)
+
+def test_only_the_exhausted_product_is_limiting(client, admin_headers, kitchen):
+    result = plan(client, admin_headers, [kitchen["pie"]])
+    assert portions(result) == {kitchen["pie"]: 2}
+    flour, eggs = products(result)[kitchen["flour"]], products(result)[kitchen["eggs"]]
+    assert (flour["used"], flour["remaining"], flour["limiting"]) == (1000, 0, True)
+    assert (eggs["unit"], eggs["available"], eggs["used"], eggs["remaining"], eggs["limiting"]) == ("dona", 10, 4, 6, False)
+
+def test_max_share_caps_each_meal(client, admin_headers, kitchen):
+    # Half of a target of 4 lets bread take two portions, leaving 400 g: too little for a pie
+    result = plan(client, admin_headers, [kitchen["bread"], kitchen["pie"]], target=4, max_share=0.5)
+    assert all(count <= 2 for count in portions(result).values())
+    assert (result["total_portions"], result["target_met"]) == (2, False)
+
+def test_max_meals_limits_the_meals_cooked(client, admin_headers, kitchen):
+    # One meal can only reach 3 portions as bread
+    result = plan(client, admin_headers, [kitchen["bread"], kitchen["pie"]], target=3, max_meals=1)
+    assert portions(result) == {kitchen["bread"]: 3}
+    assert result["target_met"] is True
+
+def test_max_share_needs_a_target(client, admin_headers, kitchen):
+    response = client.get("/api/meals/plan", params={"meal_id": [kitchen["bread"]], "max_share": 0.5}, headers=admin_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "max_share needs a target"
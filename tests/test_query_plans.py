@@ -0,0 +1,119 @@
+"""The report, dashboard and serving-list queries must read through an index.
+
+Seeds a serving history, runs EXPLAIN on the statements the routers issue and
+fails if one of them scans meal_servings, product_usage_log or the rollup
+tables without an index, or sorts the serving history instead of reading it
+in index order. benchmarks/check_query_plans.py runs the same statements
+against a bigger history or a real Postgres.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+import pytest
+from sqlalchemy import func, insert, select, text, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from app.models import (
+    DailyMealRollup, DailyProductUsageRollup, Meal, MealIngredient, MealServing, Product, ProductUsageLog, User
+)
+from app.rollups import rebuild
+from app.routers.servings import serving_rows_query
+
+HISTORY_TABLES = ("meal_servings", "product_usage_log", "daily_meal_rollups", "daily_product_usage_rollups",
+                  "meal_ingredients")
+
+class explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(explain)
+def _compile_explain(element, compiler, **kw):
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+def seed(Session, n_servings: int, days: int = 400):
+    rng = random.Random(11)
+    start = datetime.combine(date.today() - timedelta(days=days), time(8))
+    with Session() as db:
+        db.execute(insert(User), [
+            {"username": f"cook-{i}", "email": f"cook-{i}@example.com", "password_hash": "-", "role": "cook"}
+            for i in range(20)
+        ])
+        db.execute(insert(Product), [{"name": f"product-{i}", "quantity": 1000, "unit": "g"} for i in range(200)])
+        db.execute(insert(Meal), [{"name": f"meal-{i}"} for i in range(60)])
+        db.execute(insert(MealIngredient), [
+            {"meal_id": m + 1, "product_id": rng.randint(1, 200), "quantity": 50, "unit": "g"}
+            for m in range(60) for _ in range(4)
+        ])
+        servings, logs = [], []
+        for i in range(n_servings):
+            served_at = start + timedelta(seconds=i * days * 86400 // n_servings)
+            servings.append({"id": i + 1, "meal_id": rng.randint(1, 60), "user_id": rng.randint(1, 20),
+                             "portions_served": rng.randint(1, 30), "served_at": served_at})
+            for _ in range(3):
+                logs.append({"product_id": rng.randint(1, 200), "meal_serving_id": i + 1,
+                             "quantity_used": rng.randint(10, 900), "unit": "g", "used_at": served_at})
+        db.execute(insert(MealServing), servings)
+        db.execute(insert(ProductUsageLog), logs)
+        db.commit()
+        rebuild(db)
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+def statements():
+    today = date.today()
+    month_start = today.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    midnight = datetime.combine(today, time.min)
+    week_ago = midnight - timedelta(days=7)
+    history = serving_rows_query().limit(101)
+    return [
+        ("monthly report", select(func.sum(DailyMealRollup.portions_served))
+            .where(DailyMealRollup.day >= month_start, DailyMealRollup.day < next_month), False),
+        ("dashboard today", select(func.sum(DailyMealRollup.portions_served))
+            .where(DailyMealRollup.day == today), False),
+        ("dashboard recent", select(MealServing).order_by(MealServing.served_at.desc()).limit(5), True),
+        ("usage analytics", select(Product.name, func.sum(DailyProductUsageRollup.quantity_used))
+            .join(DailyProductUsageRollup, DailyProductUsageRollup.product_id == Product.id)
+            .where(DailyProductUsageRollup.day >= today - timedelta(days=30)).group_by(Product.name), False),
+        ("servings first page", history, True),
+        ("servings next page", history.where(tuple_(MealServing.served_at, MealServing.id) < tuple_(week_ago, 1000)), True),
+        ("servings date range", history.where(MealServing.served_at >= week_ago, MealServing.served_at < midnight), True),
+        ("servings by meal", history.where(MealServing.meal_id == 7), True),
+        ("servings by user", history.where(MealServing.user_id == 3), True),
+        ("servings today", serving_rows_query().where(MealServing.served_at >= midnight), True),
+        ("product usage range", select(func.sum(ProductUsageLog.quantity_used))
+            .where(ProductUsageLog.product_id == 5, ProductUsageLog.used_at >= week_ago), False),
+        ("meal ingredients", select(MealIngredient).where(MealIngredient.meal_id.in_([1, 2, 3])), False),
+    ]
+
+def problems(dialect: str, plan: str, ordered: bool):
+    found = []
+    for line in plan.splitlines():
+        stripped = line.strip()
+        for table in HISTORY_TABLES:
+            if dialect == "sqlite" and stripped.startswith(f"SCAN {table}") and "INDEX" not in stripped:
+                found.append(f"full scan of {table}")
+            if dialect == "postgresql" and f"Seq Scan on {table}" in stripped:
+                found.append(f"sequential scan of {table}")
+        if ordered and dialect == "sqlite" and "TEMP B-TREE FOR ORDER BY" in stripped:
+            found.append("sorts instead of reading the index in order")
+        if ordered and dialect == "postgresql" and stripped.startswith(("Sort ", "->  Sort ")):
+            found.append("sorts instead of reading the index in order")
+    return found
+
+STATEMENTS = statements()
+
+@pytest.fixture(scope="module")
+def plans_database(new_database):
+    engine, Session = new_database("plans")
+    seed(Session, 20_000)
+    return engine, Session
+
+@pytest.mark.parametrize("label,statement,ordered", STATEMENTS, ids=[label for label, _, _ in STATEMENTS])
+def test_query_uses_an_index(plans_database, label, statement, ordered):
+    engine, Session = plans_database
+    with Session() as db:
+        plan = "\n".join(str(row[-1]) for row in db.execute(explain(statement)).all())
+    assert problems(engine.dialect.name, plan, ordered) == [], plan
@@ -0,0 +1,10 @@
+"""Monthly report generation (app.routers.reports)."""
+import pytest
+
+@pytest.mark.parametrize("year,month", [(2024, 13), (2024, 0), (0, 5)])
+def test_out_of_range_month_is_rejected(client, admin_headers, year, month):
+    assert client.post(f"/api/reports/generate-monthly/{year}/{month}", headers=admin_headers).status_code == 422
+
+def test_december_report_counts_up_to_new_year(client, admin_headers):
+    response = client.post("/api/reports/generate-monthly/2023/12", headers=admin_headers)
+    assert response.status_code == 200, response.text
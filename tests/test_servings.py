@@ -0,0 +1,70 @@
+"""Batch servings (POST /api/servings/batch): one locked snapshot, all or nothing or partial."""
+import itertools
+import pytest
+
+names = itertools.count()
+
+@pytest.fixture
+def kitchen(client, admin_headers):
+    """1000 g of flour, 10 eggs; "bread" takes 300 g flour, "pie" 0.5 kg flour and 2 eggs"""
+    def post(url, payload):
+        response = client.post(url, json=payload, headers=admin_headers)
+        assert response.status_code == 200, response.text
+        return response.json()
+    n = next(names)
+    flour = post("/api/products/", {"name": f"flour {n}", "quantity": 1000, "unit": "g"})
+    eggs = post("/api/products/", {"name": f"eggs {n}", "quantity": 10, "unit": "dona"})
+    bread = post("/api/meals/", {"name": f"bread {n}", "ingredients": [
+        {"product_id": flour["id"], "quantity": 300, "unit": "g"}]})
+    pie = post("/api/meals/", {"name": f"pie {n}", "ingredients": [
+        {"product_id": flour["id"], "quantity": 0.5, "unit": "kg"}, {"product_id": eggs["id"], "quantity": 2, "unit": "dona"}]})
+    return {"flour": flour["id"], "eggs": eggs["id"], "bread": bread["id"], "pie": pie["id"]}
+
+def quantity(client, headers, product_id):
+    return client.get(f"/api/products/{product_id}", headers=headers).json()["quantity"]
+
+def serve(client, headers, items, all_or_nothing=True):
+    response = client.post("/api/servings/batch", json={"items": items, "all_or_nothing": all_or_nothing}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_shared_ingredient_is_checked_against_what_earlier_items_left(client, admin_headers, kitchen):
+    # 300 + 500 fit in 1000 g of flour, the next 300 don't
+    items = [{"meal_id": kitchen["bread"], "portions_served": 1}, {"meal_id": kitchen["pie"], "portions_served": 1},
+             {"meal_id": kitchen["bread"], "portions_served": 1}]
+    result = serve(client, admin_headers, items, all_or_nothing=False)
+    assert (result["applied"], result["served"], result["failed"]) == (True, 2, 1)
+    assert [item["success"] for item in result["results"]] == [True, True, False]
+    assert result["results"][2]["error"].startswith("Not enough flour")
+    assert result["results"][1]["serving"]["meal_name"].startswith("pie")
+    assert quantity(client, admin_headers, kitchen["flour"]) == 200
+    assert quantity(client, admin_headers, kitchen["eggs"]) == 8
+
+def test_all_or_nothing_rolls_back_the_whole_batch(client, admin_headers, kitchen):
+    items = [{"meal_id": kitchen["bread"], "portions_served": 2}, {"meal_id": kitchen["pie"], "portions_served": 1},
+             {"meal_id": 10 ** 9, "portions_served": 1}]
+    result = serve(client, admin_headers, items)
+    assert (result["applied"], result["served"], result["failed"]) == (False, 0, 3)
+    errors = [item["error"] for item in result["results"]]
+    assert errors[0] == "Not served: another item in the batch failed"
+    assert errors[1].startswith("Not enough flour")
+    assert errors[2] == "Meal not found"
+    assert quantity(client, admin_headers, kitchen["flour"]) == 1000
+    assert quantity(client, admin_headers, kitchen["eggs"]) == 10
+
+def test_batch_that_fits_is_served_in_full(client, admin_headers, kitchen):
+    items = [{"meal_id": kitchen["pie"], "portions_served": 1, "notes": "lunch"},
+             {"meal_id": kitchen["bread"], "portions_served": 1}]
+    result = serve(client, admin_headers, items)
+    assert (result["applied"], result["served"], result["failed"]) == (True, 2, 0)
+    assert result["results"][0]["serving"]["notes"] == "lunch"
+    assert quantity(client, admin_headers, kitchen["flour"]) == 200
+
+@pytest.mark.parametrize("portions", [0, -1])
+def test_non_positive_portions_are_rejected(client, admin_headers, kitchen, portions):
+    response = client.post("/api/servings/batch", json={"items": [{"meal_id": kitchen["bread"], "portions_served": portions}]},
+                           headers=admin_headers)
+    assert response.status_code == 422
+
+def test_empty_batch_is_rejected(client, admin_headers):
+    assert client.post("/api/servings/batch", json={"items": []}, headers=admin_headers).status_code == 400
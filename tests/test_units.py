@@ -0,0 +1,120 @@
+"""Fixed-point unit engine (app.units) against exact Decimal arithmetic.
+
+Random Numeric(10, 3) quantities in every unit pair, half of them handed over
+as floats like the request schemas do, must give the exact answer for portion
+counts, stock checks and deductions, and round-trip through to_fixed/from_fixed.
+"""
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from app.stock import deduct_demand
+from app.units import FACTORS, UNITS, can_make_portions, compatible, from_fixed, max_portions, to_fixed
+
+CASES = 20_000
+SEEDS = [7, 11, 23]
+THOUSANDTH = Decimal("0.001")
+MAX_NUMERIC = 10 ** 10 - 1  # Numeric(10, 3) in thousandths
+
+def exact_base(quantity, unit):
+    return Decimal(str(quantity)) * FACTORS.get(unit, 1)
+
+def random_quantity(rng, small=False):
+    # Mostly kitchen-sized values, with some at the edges of the column
+    if rng.random() < 0.05:
+        return Decimal(rng.choice((0, 1, MAX_NUMERIC))) * THOUSANDTH
+    upper = 50_000 if small else 20_000_000
+    return Decimal(rng.randint(1, upper)) * THOUSANDTH
+
+def random_cases(seed, as_float=0.2):
+    """(available, product unit, needed, needed unit), unknown units included"""
+    rng = random.Random(seed)
+    units = list(UNITS) + ["unknown"]
+    for _ in range(CASES):
+        case = (random_quantity(rng), rng.choice(units), random_quantity(rng, small=True), rng.choice(units))
+        if rng.random() < as_float:
+            case = (float(case[0]), case[1], float(case[2]), case[3])
+        yield case
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_portions_match_exact_arithmetic(seed):
+    wrong = []
+    for available, product_unit, needed, needed_unit in random_cases(seed):
+        exact = 0
+        if compatible(product_unit, needed_unit) and Decimal(str(needed)) > 0:
+            exact = int(exact_base(available, product_unit) // exact_base(needed, needed_unit))
+        portions = can_make_portions(available, product_unit, needed, needed_unit)
+        if portions != exact:
+            wrong.append((available, product_unit, needed, needed_unit, portions, exact))
+    assert wrong[:20] == []
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_stock_check_and_deduction_match_exact_arithmetic(seed):
+    # The comparison and subtraction app.stock.deduct_demand makes
+    wrong = []
+    for available, product_unit, needed, needed_unit in random_cases(seed):
+        if not compatible(product_unit, needed_unit):
+            continue
+        have, want = to_fixed(available, product_unit), to_fixed(needed, needed_unit)
+        exact_have, exact_want = exact_base(available, product_unit), exact_base(needed, needed_unit)
+        if (have >= want) != (exact_have >= exact_want):
+            wrong.append(("enough", available, product_unit, needed, needed_unit))
+        # The stock column keeps three decimals of the product's unit, so that is where both round
+        expected = ((exact_have - exact_want) / FACTORS[product_unit]).quantize(THOUSANDTH)
+        if from_fixed(have - want, product_unit) != expected:
+            wrong.append(("left", available, product_unit, needed, needed_unit, from_fixed(have - want, product_unit), expected))
+    assert wrong[:20] == []
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_round_trip(seed):
+    wrong = []
+    for available, product_unit, _, _ in random_cases(seed, as_float=0):
+        if from_fixed(to_fixed(available, product_unit), product_unit) != available:
+            wrong.append((available, product_unit))
+    assert wrong[:20] == []
+
+@pytest.mark.parametrize("unit,step_unit,step", [
+    ("kg", "g", Decimal("0.100")), ("l", "ml", Decimal("0.100")), ("g", "kg", Decimal("0.001")),
+    ("dona", "dona", Decimal("0.100")),
+])
+def test_repeated_deductions_do_not_drift(unit, step_unit, step):
+    # A thousand small deductions must land exactly where one big one does
+    quantity = Decimal("100.000")
+    fixed = to_fixed(quantity, unit)
+    for _ in range(1000):
+        fixed -= to_fixed(step, step_unit)
+    expected = ((exact_base(quantity, unit) - exact_base(step * 1000, step_unit)) / FACTORS[unit]).quantize(THOUSANDTH)
+    assert from_fixed(fixed, unit) == expected
+
+def test_max_portions():
+    assert max_portions([(Decimal(10), "kg", Decimal(300), "g"), (Decimal(5), "dona", Decimal(1), "dona")]) == 5
+    assert max_portions([(Decimal(10), "kg", Decimal(300), "ml")]) == 0
+    assert max_portions([(None, None, Decimal(1), "g")]) == 0
+    assert max_portions([]) == 0
+
+def test_fixed_point_values():
+    assert to_fixed(Decimal("1.5"), "kg") == 1_500_000
+    assert to_fixed(1.5, "g") == 1_500
+    assert from_fixed(1_500_000, "g") == Decimal("1500.000")
+    assert from_fixed(to_fixed(Decimal("0.001"), "l"), "ml") == Decimal("1.000")
+
+def test_conversions_between_units():
+    assert can_make_portions(Decimal("10"), "kg", Decimal("300"), "g") == 33
+    assert can_make_portions(Decimal("10"), "kg", Decimal("300"), "ml") == 0
+    assert compatible("kg", "g") and not compatible("kg", "l")
+    assert from_fixed(to_fixed(Decimal("9.700"), "kg") - to_fixed(Decimal("200"), "g"), "kg") == Decimal("9.500")
+
+def shortage(quantity, unit, needed, needed_unit, portions=1):
+    stock = {1: {"name": "Rice", "quantity": Decimal(quantity), "unit": unit}}
+    ingredients = [SimpleNamespace(product_id=1, quantity=Decimal(needed), unit=needed_unit)]
+    with pytest.raises(HTTPException) as error:
+        deduct_demand(stock, ingredients, portions)
+    return error.value.detail
+
+def test_shortage_is_reported_in_the_product_unit():
+    assert shortage("9.7", "kg", "1000", "g", portions=100) == \
+        "Not enough Rice available. Required: 100.000kg, Available: 9.700kg"
+
+def test_incompatible_unit_is_not_a_shortage():
+    assert shortage("9.7", "kg", "1", "l") == "Can't convert l to kg for Rice"